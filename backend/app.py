@@ -2,49 +2,221 @@
 FriendCircle - Backend API v1.2
 """
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import (
+    Flask, Blueprint, Response, request, jsonify, send_from_directory, stream_with_context,
+    current_app, has_request_context, abort, g
+)
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.local import LocalProxy
+from werkzeug.security import safe_join
 from datetime import datetime, timedelta
+from functools import wraps
+from sqlalchemy import event
+from sqlalchemy.sql.elements import TextClause
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from eventos import criar_hub
+from cache import criar_cache, CacheRespostas, CacheEntidades
+from tarefas import ProcessadorEmLote, Agendador
+from senhas import ProcessadorSenhas, SenhasOcupadas
+from presenca import criar_presenca
+from metricas import Registro, Medicao, BUCKETS_CONSULTAS, medir, medido, instrumentar_motor
+from portabilidade import exportar, importar, ImportacaoInvalida
+from armazenamento import RequisicaoUpload, receber_upload, PASTA_TEMPORARIA
+from serializacao import (
+    CamposInvalidos, ler_campos, montar, validar, recortar, pedidos, escolher_provedor, comprimir
+)
+import imagens
+from banco import (
+    aplicar_migracoes, plano_de_consulta, varreduras,
+    configurar_sqlite, criar_motor_leitura, EscritorUnico, preencher_busca, recontar_blobs, FAIXA_BUSCA
+)
+import click
+import sys
 import os
-import uuid
 import secrets
+import time
+import base64
+import hashlib
+import json
+import mimetypes
+import re
 
-app = Flask(__name__)
-CORS(app, resources={r"/api/*": {"origins": "*"}})
-
-app.config['SECRET_KEY'] = 'dev-secret-key'
-app.config['JWT_SECRET_KEY'] = 'jwt-secret-key'
-app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=30)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///friendcircle.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['UPLOAD_FOLDER'] = 'uploads'
-
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'avatars'), exist_ok=True)
-os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'posts'), exist_ok=True)
-
-db = SQLAlchemy(app)
-jwt = JWTManager(app)
+# ══════════════════════════════════════════════════════════════════════════════
+# CONFIGURAÇÃO
+# ══════════════════════════════════════════════════════════════════════════════
+# O app é montado por create_app() (no fim do arquivo). Importar este módulo
+# não abre o banco nem cria pastas; o esquema é criado por 'flask init-db'.
+
+MAX_NOTIFICACOES_LISTADAS = 50
+
+
+def carregar_config():
+    """Configuração padrão, com o que vem do ambiente."""
+    config = {}
+    config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key')
+    config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'jwt-secret-key')
+    config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=30)
+    config['JWT_TOKEN_LOCATION'] = ['headers']
+    config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///friendcircle.db')
+    config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    config['SQLITE_PRAGMAS'] = {
+        # Antes do journal_mode: só vale para um arquivo novo (num banco existente, a partir do próximo VACUUM)
+        'auto_vacuum': 'INCREMENTAL',
+        'journal_mode': 'WAL',
+        'busy_timeout': 15000,
+        'synchronous': 'NORMAL',
+        'cache_size': -16000,
+        'mmap_size': 134217728,
+        'temp_store': 'MEMORY'
+    }
+    config['SQLITE_POOL_LEITURA'] = 10
+    config['SQLITE_ESCRITOR_UNICO'] = True
+    config['TIMELINE_MATERIALIZADA'] = os.environ.get('TIMELINE_MATERIALIZADA', '0') == '1'
+    config['EVENTOS_URL'] = os.environ.get('EVENTOS_URL', 'memory://')
+    config['SSE_HEARTBEAT'] = 25
+    config['CACHE_URL'] = os.environ.get('CACHE_URL', 'memory://')
+    config['CACHE_MAX_ITENS'] = 2048
+    # TTL (segundos) por endpoint; endpoints fora da lista não são cacheados
+    config['CACHE_TTL'] = {
+        'api.get_stats': 30,
+        'api.list_users': 60
+    }
+    # Cartões de autor (usuário serializado embutido em posts, comentários, convites e notificações)
+    config['CARTOES_MAX_ITENS'] = 5000
+    config['CARTOES_TTL'] = 300
+    config['NOTIFICACOES_ASSINCRONAS'] = True
+    config['NOTIFICACOES_INTERVALO'] = 1.0
+    # Presença: last_seen é gravado em lote, no máximo uma vez por PRESENCA_RESOLUCAO segundos por usuário
+    config['PRESENCA_RESOLUCAO'] = 60
+    config['PRESENCA_INTERVALO'] = 5.0
+    config['ONLINE_JANELA'] = timedelta(minutes=5)
+    # Absoluto: file.save() resolve pelo diretório atual e send_from_directory pelo root_path
+    config['UPLOAD_FOLDER'] = os.path.abspath(os.environ.get('UPLOAD_FOLDER', 'uploads'))
+    # Requisições maiores são recusadas pelo Content-Length, antes de ler o corpo;
+    # cada arquivo também é limitado enquanto é gravado (uploads sem Content-Length)
+    config['MAX_CONTENT_LENGTH'] = 20 * 1024 * 1024
+    config['UPLOAD_MAX_BYTES'] = 15 * 1024 * 1024
+    config['BLOBS_CARENCIA'] = timedelta(hours=1)
+    # Entrega de /uploads pelo servidor da frente: '' (o próprio Flask), 'x-accel' (nginx) ou 'x-sendfile'
+    config['UPLOADS_SENDFILE'] = os.environ.get('UPLOADS_SENDFILE', '')
+    config['UPLOADS_ACCEL_PREFIX'] = os.environ.get('UPLOADS_ACCEL_PREFIX', '/protected-uploads/')
+    config['IMAGENS_WORKERS'] = 2
+    config['IMAGENS_QUALIDADE'] = 80
+    config['BUSCA_MAX_CANDIDATOS'] = 10000
+    # Hash de senhas: formato do Werkzeug; trocar o custo rehasheia cada senha no próximo login
+    config['SENHAS_METODO'] = os.environ.get('SENHAS_METODO', 'scrypt:32768:8:1')
+    config['SENHAS_WORKERS'] = int(os.environ.get('SENHAS_WORKERS', 2))
+    config['SENHAS_FILA'] = 32
+    config['SENHAS_ESPERA'] = 5.0
+    # Métricas: cabeçalho Server-Timing e log de requisições e consultas lentas (segundos)
+    config['METRICAS_SERVER_TIMING'] = os.environ.get('METRICAS_SERVER_TIMING', '1') == '1'
+    config['METRICAS_REQUISICAO_LENTA'] = float(os.environ.get('METRICAS_REQUISICAO_LENTA', 1.0))
+    config['METRICAS_CONSULTA_LENTA'] = float(os.environ.get('METRICAS_CONSULTA_LENTA', 0.1))
+    # Codificador das respostas: 'auto' (orjson se instalado), 'orjson' ou 'padrao'
+    config['JSON_PROVEDOR'] = os.environ.get('JSON_PROVEDOR', 'auto')
+    # gzip nas respostas JSON acima de RESPOSTAS_GZIP_MINIMO bytes (desligado: o proxy da frente costuma fazer)
+    config['RESPOSTAS_GZIP'] = os.environ.get('RESPOSTAS_GZIP', '0') == '1'
+    config['RESPOSTAS_GZIP_MINIMO'] = 1024
+    config['RESPOSTAS_GZIP_NIVEL'] = 6
+    # Manutenção periódica: intervalo (segundos) de cada tarefa; o agendador confere a cada MANUTENCAO_VERIFICAR
+    config['MANUTENCAO_AUTOMATICA'] = os.environ.get('MANUTENCAO_AUTOMATICA', '1') == '1'
+    config['MANUTENCAO_VERIFICAR'] = 60
+    config['MANUTENCAO_TAREFAS'] = {
+        'convites': 6 * 3600,
+        'notificacoes': 3600,
+        'arquivos': 6 * 3600,
+        'checkpoint': 600,
+        'estatisticas': 24 * 3600,
+        'compactacao': 24 * 3600
+    }
+    # Linhas (ou páginas, na compactação) por transação e pausa entre elas: o lock de escrita nunca fica preso
+    config['MANUTENCAO_LOTE'] = 200
+    config['MANUTENCAO_PAUSA'] = 0.05
+    config['RETENCAO_CONVITES'] = timedelta(days=30)
+    # Notificações lidas além das que GET /api/notifications mostra
+    config['RETENCAO_NOTIFICACOES_LIDAS'] = MAX_NOTIFICACOES_LISTADAS
+    # VACUUM completo (só pelo 'flask manutencao') quando o banco não tem auto_vacuum incremental e sobra essa fração do arquivo (0 desliga)
+    config['MANUTENCAO_VACUUM_LIVRE'] = 0.25
+    return config
+
+
+bp = Blueprint('api', __name__, cli_group=None)
+
+
+def _escreve(clause):
+    if isinstance(clause, TextClause):
+        return not clause.text.lstrip()[:6].upper().startswith(('SELECT', 'WITH'))
+    return getattr(clause, 'is_dml', False)
+
+
+class SessaoRoteada(Session):
+    # GETs (e rotas marcadas com @leituras_sem_lock) leem pelo pool somente leitura;
+    # qualquer escrita vai para o motor principal, e a transação fica nele até o
+    # commit (lê o que acabou de gravar). Depois do commit, o que a rota ainda lê
+    # para montar a resposta também vai ao pool: senão cada recarga abriria outro
+    # BEGIN IMMEDIATE e seguraria a fila de escrita
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if self._flushing or _escreve(clause) or self.new or self.dirty or self.deleted:
+            self.info['escrevendo'] = True
+        elif not self.info.get('escrevendo'):
+            leitura = current_app.extensions.get('sqlite_leitura')
+            if (leitura is not None and bind is None
+                    and has_request_context()
+                    and (request.method in ('GET', 'HEAD') or g.get('leituras_sem_lock')
+                         or self.info.get('commitada'))):
+                return leitura
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _do_app(nome):
+    # Objetos que dependem da configuração: criados por create_app, um conjunto por app
+    return LocalProxy(lambda: current_app.extensions[nome])
+
+
+db = SQLAlchemy(session_options={'class_': SessaoRoteada})
+jwt = JWTManager()
+cache_respostas = CacheRespostas()
+hub = _do_app('hub')
+processador_senhas = _do_app('processador_senhas')
+presenca = _do_app('presenca')
+cache_cartoes = _do_app('cache_cartoes')
+processador_imagens = _do_app('processador_imagens')
+escritor_notificacoes = _do_app('escritor_notificacoes')
+escritor_presenca = _do_app('escritor_presenca')
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+
+def urls_variantes(pasta, filename, variantes):
+    # Os nomes são determinísticos; enquanto o worker não termina, /uploads serve o original
+    if not filename or not imagens.disponivel():
+        return {}
+    return {v: f'/uploads/{pasta}/{imagens.nome_variante(filename, v)}' for v in variantes}
+
 # ══════════════════════════════════════════════════════════════════════════════
 # MODELOS
 # ══════════════════════════════════════════════════════════════════════════════
 
 likes = db.Table('likes',
     db.Column('user_id', db.Integer, db.ForeignKey('users.id'), primary_key=True),
-    db.Column('post_id', db.Integer, db.ForeignKey('posts.id'), primary_key=True)
+    db.Column('post_id', db.Integer, db.ForeignKey('posts.id'), primary_key=True),
+    db.Index('ix_likes_post_id', 'post_id')
 )
 
 class User(db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        db.Index('ix_users_last_seen', 'last_seen'),
+        db.Index('ix_users_created_at', 'created_at'),
+        db.Index('ix_users_is_active_last_seen', 'is_active', 'last_seen'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
@@ -58,38 +230,48 @@ class User(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_seen = db.Column(db.DateTime, default=datetime.utcnow)
+    total_posts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_likes = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     posts = db.relationship('Post', backref='author', lazy='dynamic', cascade='all, delete-orphan')
     comments = db.relationship('Comment', backref='author', lazy='dynamic', cascade='all, delete-orphan')
     liked_posts = db.relationship('Post', secondary=likes, backref=db.backref('liked_by', lazy='dynamic'))
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        with medir('senha'):
+            self.password_hash = processador_senhas.gerar(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
-    
-    def to_dict(self, include_email=False):
-        data = {
-            'id': self.id,
-            'nome': self.nome,
-            'bio': self.bio,
-            'avatar': self.avatar,
-            'emoji': self.emoji,
-            'cor_tema': self.cor_tema,
-            'is_admin': self.is_admin,
-            'created_at': self.created_at.isoformat(),
-            'last_seen': self.last_seen.isoformat() if self.last_seen else None,
-            'total_posts': self.posts.count(),
-            'total_likes': sum(post.liked_by.count() for post in self.posts)
-        }
-        if include_email:
-            data['email'] = self.email
-        return data
+        with medir('senha'):
+            return processador_senhas.verificar(self.password_hash, password)
+    
+    # Datas saem como datetime: o provedor JSON do app as formata
+    CAMPOS = {
+        'id': lambda u: u.id,
+        'nome': lambda u: u.nome,
+        'bio': lambda u: u.bio,
+        'avatar': lambda u: u.avatar,
+        'avatar_variantes': lambda u: urls_variantes('avatars', u.avatar, imagens.VARIANTES_AVATAR),
+        'emoji': lambda u: u.emoji,
+        'cor_tema': lambda u: u.cor_tema,
+        'is_admin': lambda u: u.is_admin,
+        'created_at': lambda u: u.created_at,
+        'last_seen': lambda u: u.last_seen,
+        'total_posts': lambda u: u.total_posts,
+        'total_likes': lambda u: u.total_likes
+    }
+    CAMPOS_COM_EMAIL = {**CAMPOS, 'email': lambda u: u.email}
+    
+    def to_dict(self, include_email=False, campos=None):
+        return montar(campos, User.CAMPOS_COM_EMAIL if include_email else User.CAMPOS, self)
 
 
 class Post(db.Model):
     __tablename__ = 'posts'
+    __table_args__ = (
+        db.Index('ix_posts_created_at_id', 'created_at', 'id'),
+        db.Index('ix_posts_user_id_created_at', 'user_id', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -97,40 +279,143 @@ class Post(db.Model):
     imagem = db.Column(db.String(256), default='')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    likes_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    comments_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     comments = db.relationship('Comment', backref='post', lazy='dynamic', cascade='all, delete-orphan')
     
+    # None: o valor vem pronto de serializar_posts (cartão do autor, curtida)
+    CAMPOS = {
+        'id': lambda p: p.id,
+        'autor': None,
+        'texto': lambda p: p.texto,
+        'imagem': lambda p: p.imagem,
+        'imagem_variantes': lambda p: urls_variantes('posts', p.imagem, imagens.VARIANTES_POST),
+        'created_at': lambda p: p.created_at,
+        'updated_at': lambda p: p.updated_at,
+        'likes_count': lambda p: p.likes_count,
+        'comments_count': lambda p: p.comments_count,
+        'liked_by_me': None,
+        'tempo': lambda p: tempo_relativo(p.created_at)
+    }
+    
     def to_dict(self, current_user_id=None):
-        return {
-            'id': self.id,
-            'autor': self.author.to_dict(),
-            'texto': self.texto,
-            'imagem': self.imagem,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat(),
-            'likes_count': self.liked_by.count(),
-            'comments_count': self.comments.count(),
-            'liked_by_me': current_user_id in [u.id for u in self.liked_by] if current_user_id else False,
-            'tempo': self._tempo_relativo()
+        return serializar_posts([self], current_user_id)[0]
+    
+    def _montar_dict(self, autor, liked_by_me, campos=None):
+        return montar(campos, Post.CAMPOS, self, autor=autor, liked_by_me=liked_by_me)
+
+
+def tempo_relativo(data):
+    agora = datetime.utcnow()
+    diff = agora - data
+    if diff.days > 30:
+        return f'{data.day:02d}/{data.month:02d}/{data.year}'
+    elif diff.days > 0:
+        return f'{diff.days}d'
+    elif diff.seconds > 3600:
+        return f'{diff.seconds // 3600}h'
+    elif diff.seconds > 60:
+        return f'{diff.seconds // 60}min'
+    else:
+        return 'agora'
+
+
+class TimelineEntry(db.Model):
+    __tablename__ = 'timeline'
+    __table_args__ = (
+        db.Index('ix_timeline_created_at_id', 'created_at', 'id'),
+        db.Index('ix_timeline_user_id_created_at', 'user_id', 'created_at', 'id'),
+    )
+    
+    # id é o próprio id do post
+    id = db.Column(db.Integer, db.ForeignKey('posts.id'), primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    likes_count = db.Column(db.Integer, nullable=False, default=0)
+    comments_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    @staticmethod
+    def de_post(post):
+        payload = {
+            'id': post.id,
+            'texto': post.texto,
+            'imagem': post.imagem,
+            'created_at': post.created_at.isoformat(),
+            'updated_at': post.updated_at.isoformat()
         }
+        return TimelineEntry(
+            id=post.id,
+            user_id=post.user_id,
+            created_at=post.created_at,
+            payload=json.dumps(payload, ensure_ascii=False),
+            likes_count=post.likes_count or 0,
+            comments_count=post.comments_count or 0
+        )
+    
+    # Mesma forma do Post; texto, imagem e datas vêm do payload gravado
+    CAMPOS = {
+        'id': lambda e: e.id,
+        'autor': None,
+        'texto': lambda e: e.dados['texto'],
+        'imagem': lambda e: e.dados['imagem'],
+        'imagem_variantes': lambda e: urls_variantes('posts', e.dados['imagem'], imagens.VARIANTES_POST),
+        'created_at': lambda e: e.dados['created_at'],
+        'updated_at': lambda e: e.dados['updated_at'],
+        'likes_count': lambda e: e.likes_count,
+        'comments_count': lambda e: e.comments_count,
+        'liked_by_me': None,
+        'tempo': lambda e: tempo_relativo(e.created_at)
+    }
+    
+    @property
+    def dados(self):
+        if '_dados' not in self.__dict__:
+            self.__dict__['_dados'] = json.loads(self.payload)
+        return self.__dict__['_dados']
+    
+    def _montar_dict(self, autor, liked_by_me, campos=None):
+        return montar(campos, TimelineEntry.CAMPOS, self, autor=autor, liked_by_me=liked_by_me)
+
+
+class Blob(db.Model):
+    __tablename__ = 'blobs'
+    __table_args__ = (
+        db.Index('ix_blobs_refs_atualizado_em', 'refs', 'atualizado_em'),
+    )
     
-    def _tempo_relativo(self):
-        agora = datetime.utcnow()
-        diff = agora - self.created_at
-        if diff.days > 30:
-            return self.created_at.strftime('%d/%m/%Y')
-        elif diff.days > 0:
-            return f'{diff.days}d'
-        elif diff.seconds > 3600:
-            return f'{diff.seconds // 3600}h'
-        elif diff.seconds > 60:
-            return f'{diff.seconds // 60}min'
-        else:
-            return 'agora'
+    # '<pasta>/<sha256>.<ext>': cada conteúdo é gravado uma vez por pasta
+    nome = db.Column(db.String(256), primary_key=True)
+    refs = db.Column(db.Integer, nullable=False, default=0)
+    tamanho = db.Column(db.Integer, nullable=True)
+    atualizado_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class TarefaManutencao(db.Model):
+    __tablename__ = 'manutencao'
+    
+    nome = db.Column(db.String(64), primary_key=True)
+    proxima = db.Column(db.DateTime, nullable=False)
+    ultima = db.Column(db.DateTime, nullable=True)
+    duracao = db.Column(db.Float, nullable=True)
+    # JSON com o que a última execução recuperou ({"linhas": ..., "bytes": ...})
+    resultado = db.Column(db.Text, nullable=False, default='{}')
+
+
+class Versao(db.Model):
+    __tablename__ = 'versoes'
+    
+    # 'posts', 'usuarios', 'usuario:<id>', 'comentarios:<post_id>', 'notificacoes:<user_id>'
+    chave = db.Column(db.String(64), primary_key=True)
+    versao = db.Column(db.Integer, nullable=False, default=0)
 
 
 class Comment(db.Model):
     __tablename__ = 'comments'
+    __table_args__ = (
+        db.Index('ix_comments_post_id_created_at', 'post_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -138,17 +423,25 @@ class Comment(db.Model):
     texto = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    CAMPOS = {
+        'id': lambda c: c.id,
+        'autor': None,
+        'texto': lambda c: c.texto,
+        'created_at': lambda c: c.created_at
+    }
+    
     def to_dict(self):
-        return {
-            'id': self.id,
-            'autor': self.author.to_dict(),
-            'texto': self.texto,
-            'created_at': self.created_at.isoformat()
-        }
+        return serializar_comentarios([self])[0]
+    
+    def _montar_dict(self, autor, campos=None):
+        return montar(campos, Comment.CAMPOS, self, autor=autor)
 
 
 class Invite(db.Model):
     __tablename__ = 'invites'
+    __table_args__ = (
+        db.Index('ix_invites_invited_by_id_created_at', 'invited_by_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), nullable=False)
@@ -162,20 +455,29 @@ class Invite(db.Model):
     invited_by = db.relationship('User', foreign_keys=[invited_by_id], backref='sent_invites')
     used_by = db.relationship('User', foreign_keys=[used_by_id])
     
+    CAMPOS = {
+        'id': lambda i: i.id,
+        'email': lambda i: i.email,
+        'token': lambda i: i.token,
+        'invited_by': None,
+        'used': lambda i: i.used,
+        'created_at': lambda i: i.created_at,
+        'expires_at': lambda i: i.expires_at
+    }
+    
     def to_dict(self):
-        return {
-            'id': self.id,
-            'email': self.email,
-            'token': self.token,
-            'invited_by': self.invited_by.to_dict(),
-            'used': self.used,
-            'created_at': self.created_at.isoformat(),
-            'expires_at': self.expires_at.isoformat()
-        }
+        return serializar_convites([self])[0]
+    
+    def _montar_dict(self, invited_by, campos=None):
+        return montar(campos, Invite.CAMPOS, self, invited_by=invited_by)
 
 
 class Notification(db.Model):
     __tablename__ = 'notifications'
+    __table_args__ = (
+        db.Index('ix_notifications_user_id_lida_created_at', 'user_id', 'lida', 'created_at'),
+        db.Index('ix_notifications_agrupamento', 'user_id', 'tipo', 'post_id', 'lida'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -185,50 +487,865 @@ class Notification(db.Model):
     lida = db.Column(db.Boolean, default=False)
     actor_id = db.Column(db.Integer, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Agrupamento de curtidas/comentários por post ("Ana e mais 12 curtiram seu post")
+    post_id = db.Column(db.Integer, nullable=True)
+    # Aproximado acima de MAX_ATORES_RASTREADOS atores distintos
+    total_atores = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    atores_recentes = db.Column(db.Text, nullable=False, default='[]', server_default='[]')
     
     user = db.relationship('User', backref='notifications')
     
     def to_dict(self):
-        actor = None
-        if self.actor_id:
-            actor_user = User.query.get(self.actor_id)
-            if actor_user:
-                actor = actor_user.to_dict()
-        
-        return {
-            'id': self.id,
-            'tipo': self.tipo,
-            'mensagem': self.mensagem,
-            'link': self.link,
-            'lida': self.lida,
-            'actor': actor,
-            'created_at': self.created_at.isoformat()
-        }
+        return serializar_notificacoes([self])[0]
+    
+    def ids_atores(self):
+        ids = json.loads(self.atores_recentes or '[]')
+        if not ids and self.actor_id:
+            ids = [self.actor_id]
+        return ids
+    
+    CAMPOS = {
+        'id': lambda n: n.id,
+        'tipo': lambda n: n.tipo,
+        'mensagem': lambda n: n.mensagem,
+        'link': lambda n: n.link,
+        'lida': lambda n: n.lida,
+        'actor': None,
+        'atores': None,
+        'total_atores': lambda n: n.total_atores,
+        'post_id': lambda n: n.post_id,
+        'created_at': lambda n: n.created_at
+    }
+    
+    def _montar_dict(self, cartoes, campos=None):
+        atores = [cartoes[a] for a in self.ids_atores()[:MAX_ATORES_EXIBIDOS] if a in cartoes]
+        return montar(campos, Notification.CAMPOS, self, actor=cartoes.get(self.actor_id), atores=atores)
 
 
 # ══════════════════════════════════════════════════════════════════════════════
 # FUNÇÕES AUXILIARES
 # ══════════════════════════════════════════════════════════════════════════════
 
-def criar_notificacao(user_id, tipo, mensagem, actor_id=None, link=''):
-    notif = Notification(
-        user_id=user_id,
-        tipo=tipo,
-        mensagem=mensagem,
-        actor_id=actor_id,
-        link=link
+# Curtidas e comentários no mesmo post viram uma única notificação não lida.
+# A gravação sai da requisição: a intenção fica na sessão e, depois do commit,
+# vai para um escritor em lote que agrupa e grava periodicamente.
+
+TIPOS_AGRUPADOS = {
+    'like': ('curtiu seu post', 'curtiram seu post'),
+    'comment': ('comentou no seu post', 'comentaram no seu post'),
+}
+MAX_ATORES_EXIBIDOS = 3
+# Ids distintos guardados por grupo para não contar duas vezes quem descurte e curte de novo.
+# O total é exato até esse limite; acima dele é aproximado: quem já saiu da lista
+# (não está entre os 100 mais recentes) e volta a agir é contado outra vez
+MAX_ATORES_RASTREADOS = 100
+
+
+def criar_notificacao(user_id, tipo, mensagem, actor_id=None, link='', post_id=None):
+    intencao = {
+        'user_id': int(user_id),
+        'tipo': tipo,
+        'mensagem': mensagem,
+        'actor_id': int(actor_id) if actor_id else None,
+        'link': link,
+        'post_id': post_id,
+        'created_at': datetime.utcnow()
+    }
+    if current_app.config['NOTIFICACOES_ASSINCRONAS']:
+        db.session.info.setdefault('notificacoes_pendentes', []).append(intencao)
+    else:
+        aplicar_notificacoes([intencao])
+
+
+def aplicar_notificacoes(intencoes):
+    carimbar(*(f"notificacoes:{i['user_id']}" for i in intencoes))
+    avulsas = []
+    grupos = {}
+    for intencao in intencoes:
+        if intencao['tipo'] in TIPOS_AGRUPADOS and intencao['post_id']:
+            chave = (intencao['user_id'], intencao['tipo'], intencao['post_id'])
+            grupos.setdefault(chave, []).append(intencao)
+        else:
+            avulsas.append(intencao)
+    
+    for intencao in avulsas:
+        campos = {k: v for k, v in intencao.items() if k != 'post_id'}
+        db.session.add(Notification(**campos))
+    
+    if not grupos:
+        return
+    
+    ids_atores = {i['actor_id'] for grupo in grupos.values() for i in grupo}
+    nomes = dict(db.session.query(User.id, User.nome).filter(User.id.in_(ids_atores)))
+    
+    for (user_id, tipo, post_id), grupo in grupos.items():
+        existente = Notification.query.filter_by(
+            user_id=user_id, tipo=tipo, post_id=post_id, lida=False
+        ).order_by(Notification.id.desc()).first()
+        
+        atores = existente.ids_atores() if existente else []
+        total = existente.total_atores if existente else 0
+        for intencao in grupo:
+            if intencao['actor_id'] in atores:
+                atores.remove(intencao['actor_id'])
+            else:
+                total += 1
+            atores.insert(0, intencao['actor_id'])
+        atores = atores[:MAX_ATORES_RASTREADOS]
+        
+        nome = nomes.get(atores[0], 'Alguém')
+        singular, plural = TIPOS_AGRUPADOS[tipo]
+        mensagem = f'{nome} {singular}' if total == 1 else f'{nome} e mais {total - 1} {plural}'
+        
+        # Regrava com id novo para o grupo subir na lista e chegar ao stream
+        if existente:
+            db.session.delete(existente)
+        db.session.add(Notification(
+            user_id=user_id,
+            tipo=tipo,
+            mensagem=mensagem,
+            actor_id=atores[0],
+            link=grupo[-1]['link'],
+            post_id=post_id,
+            total_atores=total,
+            atores_recentes=json.dumps(atores),
+            created_at=grupo[-1]['created_at']
+        ))
+
+
+def _gravar_notificacoes(intencoes):
+    try:
+        aplicar_notificacoes(intencoes)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+@medido('serializacao')
+def serializar_notificacoes(notificacoes, campos=None):
+    ids = set()
+    if pedidos(campos, 'atores'):
+        ids.update(a for n in notificacoes for a in n.ids_atores()[:MAX_ATORES_EXIBIDOS])
+    if pedidos(campos, 'actor'):
+        ids.update(n.actor_id for n in notificacoes if n.actor_id)
+    cartoes = cartoes_usuarios(ids) if ids else {}
+    return [n._montar_dict(cartoes, campos) for n in notificacoes]
+
+def canal_notificacoes(user_id):
+    return f'notificacoes:{user_id}'
+
+
+# Notificações só são publicadas no hub depois do commit que as grava
+@event.listens_for(SessaoRoteada, 'after_flush')
+def _capturar_notificacoes(session, _contexto):
+    novas = [(n.user_id, n.id) for n in session.new if isinstance(n, Notification)]
+    if novas:
+        session.info.setdefault('notificacoes_publicar', []).extend(novas)
+
+
+def invalidar_cache(*tags):
+    # Só depois do commit: antes disso outra requisição poderia recachear o dado velho
+    db.session.info.setdefault('cache_invalidar', set()).update(tags)
+
+
+def invalidar_cartoes(*user_ids):
+    ids = {int(i) for i in user_ids}
+    db.session.info.setdefault('cartoes_invalidar', set()).update(ids)
+    carimbar('usuarios', *(f'usuario:{i}' for i in ids))
+
+
+@event.listens_for(SessaoRoteada, 'after_commit')
+def _depois_do_commit(session):
+    session.info.pop('escrevendo', None)
+    session.info['commitada'] = True
+    pendentes = session.info.pop('notificacoes_pendentes', None)
+    if pendentes:
+        escritor_notificacoes.adicionar(*pendentes)
+    for user_id, notif_id in session.info.pop('notificacoes_publicar', []):
+        hub.publicar(canal_notificacoes(user_id), notif_id)
+    tags = session.info.pop('cache_invalidar', None)
+    if tags:
+        cache_respostas.invalidar(*tags)
+    cartoes = session.info.pop('cartoes_invalidar', None)
+    if cartoes:
+        cache_cartoes.invalidar(cartoes)
+
+
+@event.listens_for(SessaoRoteada, 'after_rollback')
+def _depois_do_rollback(session):
+    for chave in ('escrevendo', 'notificacoes_pendentes', 'notificacoes_publicar', 'cache_invalidar', 'cartoes_invalidar'):
+        session.info.pop(chave, None)
+
+
+def leituras_sem_lock(view):
+    # Para POSTs que consultam antes de escrever (ou só consultam): as leituras não
+    # abrem a transação de escrita; o que for gravado continua indo ao motor principal
+    @wraps(view)
+    def envolvida(*args, **kwargs):
+        g.leituras_sem_lock = True
+        return view(*args, **kwargs)
+    return envolvida
+
+
+def admin_required(view):
+    @wraps(view)
+    def envolvida(*args, **kwargs):
+        user = User.query.get(get_jwt_identity())
+        if not user or not user.is_admin:
+            return jsonify({'error': 'Sem permissão'}), 403
+        return view(*args, **kwargs)
+    return envolvida
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# PRESENÇA
+# ══════════════════════════════════════════════════════════════════════════════
+# Toda requisição autenticada marca o usuário como ativo no rastreador em
+# memória (ou Redis); o last_seen vai para o banco em lote, em segundo plano.
+
+def _gravar_presenca(vistos):
+    ultimos = {}
+    for user_id, quando in vistos:
+        ultimos[user_id] = max(quando, ultimos.get(user_id, quando))
+    
+    usuarios = User.__table__
+    try:
+        db.session.execute(
+            db.update(usuarios)
+            .where(usuarios.c.id == db.bindparam('b_id'))
+            .values(last_seen=db.bindparam('b_last_seen')),
+            [{'b_id': u, 'b_last_seen': q} for u, q in ultimos.items()]
+        )
+        # Só o /me (ETag por usuário); os cartões de autor aceitam o last_seen atrasado até o TTL
+        carimbar(*(f'usuario:{u}' for u in ultimos))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def registrar_presenca(user_id):
+    if presenca.registrar(int(user_id)):
+        escritor_presenca.adicionar((int(user_id), datetime.utcnow()))
+
+
+def usuarios_online():
+    return presenca.online(time.time() - current_app.config['ONLINE_JANELA'].total_seconds())
+
+
+@bp.after_app_request
+def _marcar_presenca(resposta):
+    try:
+        user_id = get_jwt_identity()
+    except RuntimeError:
+        # Rota sem @jwt_required
+        return resposta
+    if user_id:
+        registrar_presenca(user_id)
+    return resposta
+
+
+def referenciar_blob(pasta, filename, tamanho=None):
+    db.session.execute(
+        sqlite_insert(Blob)
+        .values(nome=f'{pasta}/{filename}', refs=1, tamanho=tamanho, atualizado_em=datetime.utcnow())
+        .on_conflict_do_update(
+            index_elements=[Blob.nome],
+            set_={'refs': Blob.refs + 1, 'atualizado_em': datetime.utcnow()}
+        )
     )
-    db.session.add(notif)
+
+
+def liberar_blob(pasta, filename):
+    # Blobs sem referência ficam para 'flask limpar-blobs' (após a carência)
+    if filename:
+        Blob.query.filter_by(nome=f'{pasta}/{filename}').update({
+            Blob.refs: Blob.refs - 1,
+            Blob.atualizado_em: datetime.utcnow()
+        }, synchronize_session=False)
+
+
+def salvar_imagem(file, pasta, variantes):
+    ext = file.filename.rsplit('.', 1)[1].lower()
+    destino = os.path.join(current_app.config['UPLOAD_FOLDER'], pasta)
+    # O original também é público: sai sem EXIF (GPS, câmera) antes de ganhar o nome
+    upload = receber_upload(file, destino, imagens.remover_metadados)
+    filename = upload.nome(ext)
+    # A referência abre a transação de escrita antes de conferir o arquivo: a
+    # limpeza de blobs (que apaga com o mesmo lock) não passa no meio
+    referenciar_blob(pasta, filename, upload.tamanho)
+    if upload.guardar(destino, ext):
+        processador_imagens.enviar(os.path.join(destino, filename), variantes)
+    return filename
+
 
 def gerar_token_convite():
     return secrets.token_urlsafe(32)
 
 
+# ══════════════════════════════════════════════════════════════════════════════
+# MÉTRICAS
+# ══════════════════════════════════════════════════════════════════════════════
+# Cada requisição conta e cronometra suas consultas e fases (serialização,
+# hash de senha, espera pelo lock de escrita). O resumo vai no Server-Timing, nos histogramas de
+# /api/admin/metrics (por processo: com vários workers, cada um tem os seus)
+# e, acima dos limites, no log de lentidão com o local da chamada.
+
+metricas = Registro()
+metricas.histograma('requisicao_segundos', 'Duração das requisições por rota')
+metricas.histograma('requisicao_sql_segundos', 'Tempo em SQL por requisição')
+metricas.histograma('requisicao_consultas', 'Consultas SQL por requisição', BUCKETS_CONSULTAS)
+metricas.histograma('fase_segundos', 'Tempo por fase da requisição (serializacao, senha, lock)')
+metricas.contador('requisicoes_total', 'Requisições por rota e status')
+metricas.contador('consultas_lentas_total', 'Consultas acima de METRICAS_CONSULTA_LENTA (sem o BEGIN)')
+metricas.histograma('espera_lock_segundos', 'Espera pelo lock de escrita até o BEGIN voltar (inclusive fora de requisições)')
+metricas.contador('manutencao_linhas_total', 'Linhas e arquivos apagados pela manutenção')
+metricas.contador('manutencao_bytes_total', 'Bytes recuperados pela manutenção')
+
+
+def _consulta_lenta(duracao, statement, local):
+    metricas.somar('consultas_lentas_total')
+    print(f"🐢 Consulta lenta ({duracao * 1000:.0f} ms) em {local}: {' '.join(statement.split())[:500]}")
+
+
+def _esperou_lock(duracao):
+    metricas.observar('espera_lock_segundos', duracao)
+
+
+@bp.before_app_request
+def _iniciar_medicao():
+    g.medicao = Medicao()
+
+
+@bp.after_app_request
+def _registrar_medicao(resposta):
+    medicao = g.pop('medicao', None)
+    if medicao is None:
+        return resposta
+    total = time.perf_counter() - medicao.inicio
+    endpoint = request.url_rule.endpoint if request.url_rule else 'nao_encontrado'
+    
+    metricas.observar('requisicao_segundos', total, endpoint=endpoint, metodo=request.method)
+    metricas.observar('requisicao_sql_segundos', medicao.sql, endpoint=endpoint)
+    metricas.observar('requisicao_consultas', medicao.consultas, endpoint=endpoint)
+    for fase, duracao in medicao.fases.items():
+        metricas.observar('fase_segundos', duracao, endpoint=endpoint, fase=fase)
+    metricas.somar('requisicoes_total', endpoint=endpoint, metodo=request.method, status=resposta.status_code)
+    
+    if current_app.config['METRICAS_SERVER_TIMING']:
+        resposta.headers['Server-Timing'] = medicao.server_timing(total)
+    if total >= current_app.config['METRICAS_REQUISICAO_LENTA']:
+        fases = ''.join(f', {fase} {duracao * 1000:.0f} ms' for fase, duracao in medicao.fases.items())
+        print(f"🐢 Requisição lenta: {request.method} {request.path} ({endpoint}) {total * 1000:.0f} ms, "
+              f"{medicao.consultas} consultas em {medicao.sql * 1000:.0f} ms{fases}")
+    return resposta
+
+
+# Registrado depois da medição, roda antes dela: o gzip entra no total e na fase 'compressao'
+@bp.after_app_request
+def _comprimir_resposta(resposta):
+    if not current_app.config['RESPOSTAS_GZIP']:
+        return resposta
+    with medir('compressao'):
+        return comprimir(
+            resposta, request.accept_encodings,
+            minimo=current_app.config['RESPOSTAS_GZIP_MINIMO'],
+            nivel=current_app.config['RESPOSTAS_GZIP_NIVEL']
+        )
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# CONTADORES
+# ══════════════════════════════════════════════════════════════════════════════
+# total_posts/total_likes (User) e likes_count/comments_count (Post) são
+# mantidos nas mesmas transações que alteram posts, curtidas e comentários.
+
+def ajustar_contadores_usuario(user_id, posts=0, likes=0):
+    User.query.filter_by(id=user_id).update({
+        User.total_posts: User.total_posts + posts,
+        User.total_likes: User.total_likes + likes
+    }, synchronize_session=False)
+    invalidar_cartoes(user_id)
+
+
+def ajustar_contadores_post(post_id, likes=0, comments=0):
+    # updated_at fica como está: contador não é edição do post
+    Post.query.filter_by(id=post_id).update({
+        Post.likes_count: Post.likes_count + likes,
+        Post.comments_count: Post.comments_count + comments,
+        Post.updated_at: Post.updated_at
+    }, synchronize_session=False)
+
+
+def recalcular_contadores():
+    likes_por_post = db.select(db.func.count()).select_from(likes).where(
+        likes.c.post_id == Post.id
+    ).scalar_subquery()
+    comments_por_post = db.select(db.func.count(Comment.id)).where(
+        Comment.post_id == Post.id
+    ).scalar_subquery()
+    db.session.execute(db.update(Post).values(
+        likes_count=likes_por_post,
+        comments_count=comments_por_post,
+        updated_at=Post.updated_at
+    ))
+    
+    posts_autor = db.aliased(Post)
+    posts_por_usuario = db.select(db.func.count(posts_autor.id)).where(
+        posts_autor.user_id == User.id
+    ).scalar_subquery()
+    likes_por_usuario = db.select(db.func.coalesce(db.func.sum(posts_autor.likes_count), 0)).where(
+        posts_autor.user_id == User.id
+    ).scalar_subquery()
+    db.session.execute(db.update(User).values(
+        total_posts=posts_por_usuario,
+        total_likes=likes_por_usuario
+    ))
+    Versao.query.filter(Versao.chave.like('usuario:%')).update(
+        {Versao.versao: Versao.versao + 1}, synchronize_session=False
+    )
+    carimbar('posts', 'usuarios')
+    db.session.commit()
+    cache_cartoes.limpar()
+
+
+@bp.cli.command('recalcular-contadores')
+def recalcular_contadores_command():
+    """Reconstrói os contadores de usuários e posts a partir das tabelas."""
+    recalcular_contadores()
+    print("✅ Contadores recalculados!")
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# SERIALIZAÇÃO EM LOTE
+# ══════════════════════════════════════════════════════════════════════════════
+# Serializa uma página inteira com um número fixo de consultas agrupadas,
+# em vez de N consultas por post/autor.
+
+@medido('serializacao')
+def serializar_usuarios(users, include_email=False, campos=None):
+    return [u.to_dict(include_email=include_email, campos=campos) for u in users]
+
+
+def _carregar_cartoes(user_ids):
+    autores = User.query.filter(User.id.in_(user_ids)).all()
+    return dict(zip([u.id for u in autores], serializar_usuarios(autores)))
+
+
+def cartoes_usuarios(user_ids):
+    """{id: usuário serializado}, do cache quando possível; busca os que faltam numa consulta só."""
+    return cache_cartoes.buscar([int(i) for i in user_ids if i], _carregar_cartoes)
+
+
+@medido('serializacao')
+def serializar_comentarios(comments, campos=None):
+    cartoes = cartoes_usuarios(c.user_id for c in comments) if pedidos(campos, 'autor') else {}
+    return [c._montar_dict(cartoes.get(c.user_id), campos) for c in comments]
+
+
+@medido('serializacao')
+def serializar_convites(invites, campos=None):
+    cartoes = cartoes_usuarios(i.invited_by_id for i in invites) if pedidos(campos, 'invited_by') else {}
+    return [i._montar_dict(cartoes.get(i.invited_by_id), campos) for i in invites]
+
+
+MAX_IDS_CURTIDAS = 200
+
+
+def _posts_curtidos(current_user_id, post_ids):
+    if not current_user_id or not post_ids:
+        return set()
+    return {
+        post_id for (post_id,) in db.session.query(likes.c.post_id).filter(
+            likes.c.user_id == int(current_user_id),
+            likes.c.post_id.in_(post_ids)
+        )
+    }
+
+
+MAX_COMENTARIOS_INLINE = 10
+
+
+def comentarios_recentes(post_ids, limite, campos=None):
+    """{post_id: últimos `limite` comentários serializados, em ordem cronológica}, numa consulta só."""
+    posicao = db.func.row_number().over(
+        partition_by=Comment.post_id,
+        order_by=(Comment.created_at.desc(), Comment.id.desc())
+    ).label('posicao')
+    janela = db.select(Comment, posicao).where(Comment.post_id.in_(post_ids)).subquery()
+    recente = db.aliased(Comment, janela)
+    comments = db.session.query(recente).filter(janela.c.posicao <= limite).order_by(
+        recente.post_id, recente.created_at, recente.id
+    ).all()
+    
+    por_post = {}
+    for comment, dados in zip(comments, serializar_comentarios(comments, campos)):
+        por_post.setdefault(comment.post_id, []).append(dados)
+    return por_post
+
+
+@medido('serializacao')
+def serializar_posts(posts, current_user_id=None, comentarios=0, campos=None):
+    # Também aceita entradas da timeline materializada (mesma interface _montar_dict)
+    if not posts:
+        return []
+    
+    campos_comentarios = None
+    if campos is not None and comentarios:
+        campos = dict(campos)
+        if 'comments' not in campos:
+            comentarios = 0
+        campos_comentarios = campos.pop('comments', None)
+    
+    cartoes = cartoes_usuarios(p.user_id for p in posts) if pedidos(campos, 'autor') else {}
+    curtidos = _posts_curtidos(current_user_id, [p.id for p in posts]) if pedidos(campos, 'liked_by_me') else set()
+    
+    resultado = [
+        post._montar_dict(
+            autor=cartoes.get(post.user_id),
+            liked_by_me=post.id in curtidos,
+            campos=campos
+        )
+        for post in posts
+    ]
+    if comentarios:
+        recentes = comentarios_recentes([p.id for p in posts], comentarios, campos_comentarios)
+        for post, dados in zip(posts, resultado):
+            dados['comments'] = recentes.get(post.id, [])
+    return resultado
+
+
+def campos_pedidos():
+    """Árvore de `?fields=` (None sem o parâmetro): campos de cada item da resposta."""
+    return ler_campos(request.args.get('fields', ''))
+
+
+@bp.app_errorhandler(CamposInvalidos)
+def _campos_invalidos(erro):
+    return jsonify({'error': f'Campos desconhecidos em fields: {erro}'}), 400
+
+
+def comentarios_incluidos():
+    """N de `?include=comments:N` (0 sem include); ValueError se o pedido for inválido."""
+    total = 0
+    for item in filter(None, request.args.get('include', '').split(',')):
+        nome, _, valor = item.partition(':')
+        if nome != 'comments' or not valor.isdigit() or not 1 <= int(valor) <= MAX_COMENTARIOS_INLINE:
+            raise ValueError(item)
+        total = int(valor)
+    return total
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# GET CONDICIONAL
+# ══════════════════════════════════════════════════════════════════════════════
+# Cada recurso tem um número de versão na tabela 'versoes', incrementado na
+# mesma transação que o altera. A ETag sai só desses números: se o cliente já
+# tem a versão atual, a rota responde 304 sem consultar nem serializar nada.
+
+def carimbar(*chaves):
+    for chave in dict.fromkeys(chaves):
+        db.session.execute(
+            sqlite_insert(Versao)
+            .values(chave=chave, versao=1)
+            .on_conflict_do_update(index_elements=[Versao.chave], set_={'versao': Versao.versao + 1})
+        )
+
+
+def etag_versoes(chaves, relativo=False):
+    versoes = dict(db.session.query(Versao.chave, Versao.versao).filter(Versao.chave.in_(chaves)))
+    partes = [f'{c}={versoes.get(c, 0)}' for c in chaves]
+    partes.append(f'u={get_jwt_identity()}')
+    if relativo:
+        # O campo 'tempo' ("5min", "2h") muda sozinho: a ETag vence a cada minuto
+        partes.append(f't={int(time.time() // 60)}')
+    return hashlib.sha1('|'.join(partes).encode()).hexdigest()[:20]
+
+
+def _marcar_condicional(resposta, etag):
+    resposta.set_etag(etag, weak=True)
+    resposta.headers['Cache-Control'] = 'private, no-cache'
+    return resposta
+
+
+def nao_modificado(etag):
+    """Resposta 304 se o If-None-Match do cliente já tem `etag`, senão None."""
+    if request.if_none_match.contains_weak(etag):
+        return _marcar_condicional(Response(status=304), etag)
+    return None
+
+
+def get_condicional(chaves, relativo=False):
+    """Decora uma rota GET: `chaves(**kwargs)` lista as versões de que a resposta depende."""
+    def decorador(view):
+        @wraps(view)
+        def envolvida(*args, **kwargs):
+            etag = etag_versoes(chaves(**kwargs), relativo)
+            resposta = nao_modificado(etag)
+            if resposta is not None:
+                return resposta
+            resposta = current_app.make_response(view(*args, **kwargs))
+            if resposta.status_code == 200:
+                _marcar_condicional(resposta, etag)
+            return resposta
+        return envolvida
+    return decorador
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# PAGINAÇÃO POR CURSOR
+# ══════════════════════════════════════════════════════════════════════════════
+# Cursor opaco sobre (created_at, id): cada página é uma leitura por faixa no
+# índice, sem OFFSET nem COUNT(*), e inserções novas não deslocam as páginas.
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def codificar_cursor(created_at, item_id):
+    bruto = f'{created_at.isoformat()}|{item_id}'.encode()
+    return base64.urlsafe_b64encode(bruto).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, item_id = bruto.split('|')
+        return datetime.fromisoformat(created_at), int(item_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise CursorInvalido(cursor) from e
+
+
+def pagina_por_cursor(query, modelo, cursor, limite, crescente=False):
+    chave = db.tuple_(modelo.created_at, modelo.id)
+    if cursor:
+        posicao = decodificar_cursor(cursor)
+        query = query.filter(chave > posicao if crescente else chave < posicao)
+    
+    if crescente:
+        query = query.order_by(modelo.created_at.asc(), modelo.id.asc())
+    else:
+        query = query.order_by(modelo.created_at.desc(), modelo.id.desc())
+    itens = query.limit(limite + 1).all()
+    
+    proximo = None
+    if len(itens) > limite:
+        itens = itens[:limite]
+        proximo = codificar_cursor(itens[-1].created_at, itens[-1].id)
+    return itens, proximo
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# TIMELINE MATERIALIZADA
+# ══════════════════════════════════════════════════════════════════════════════
+# Opcional (TIMELINE_MATERIALIZADA). Como todo membro vê todos os posts, o
+# fan-out na escrita vai para uma única timeline compartilhada: create_post
+# grava a entrada já serializada e curtidas, comentários e exclusões a
+# atualizam na mesma transação. O feed vira uma leitura por faixa no índice.
+
+def timeline_ativa():
+    return current_app.config['TIMELINE_MATERIALIZADA']
+
+
+def timeline_adicionar(post):
+    if timeline_ativa():
+        db.session.flush()
+        db.session.add(TimelineEntry.de_post(post))
+
+
+def timeline_ajustar(post_id, likes=0, comments=0):
+    if timeline_ativa():
+        TimelineEntry.query.filter_by(id=post_id).update({
+            TimelineEntry.likes_count: TimelineEntry.likes_count + likes,
+            TimelineEntry.comments_count: TimelineEntry.comments_count + comments
+        }, synchronize_session=False)
+
+
+def timeline_remover(post_id):
+    if timeline_ativa():
+        TimelineEntry.query.filter_by(id=post_id).delete(synchronize_session=False)
+
+
+def reconstruir_timeline(lote=1000):
+    TimelineEntry.query.delete()
+    ultimo_id = 0
+    total = 0
+    while True:
+        posts = Post.query.filter(Post.id > ultimo_id).order_by(Post.id).limit(lote).all()
+        if not posts:
+            break
+        db.session.add_all([TimelineEntry.de_post(p) for p in posts])
+        db.session.flush()
+        ultimo_id = posts[-1].id
+        total += len(posts)
+        db.session.expunge_all()
+    db.session.commit()
+    return total
+
+
+def divergencias_timeline(lote=1000):
+    divergencias = []
+    ids_posts = {pid for (pid,) in db.session.query(Post.id)}
+    ids_timeline = {tid for (tid,) in db.session.query(TimelineEntry.id)}
+    divergencias += [(pid, 'ausente na timeline') for pid in sorted(ids_posts - ids_timeline)]
+    divergencias += [(tid, 'post não existe mais') for tid in sorted(ids_timeline - ids_posts)]
+    
+    ultimo_id = 0
+    while True:
+        pares = db.session.query(Post, TimelineEntry).join(
+            TimelineEntry, TimelineEntry.id == Post.id
+        ).filter(Post.id > ultimo_id).order_by(Post.id).limit(lote).all()
+        if not pares:
+            break
+        for post, entrada in pares:
+            esperado = TimelineEntry.de_post(post)
+            for campo in ('user_id', 'created_at', 'payload', 'likes_count', 'comments_count'):
+                if getattr(esperado, campo) != getattr(entrada, campo):
+                    divergencias.append((post.id, f'{campo} diferente'))
+        ultimo_id = pares[-1][0].id
+        db.session.expunge_all()
+    return divergencias
+
+
+@bp.cli.command('reconstruir-timeline')
+def reconstruir_timeline_command():
+    """Recria a timeline materializada a partir da tabela de posts."""
+    total = reconstruir_timeline()
+    print(f"✅ Timeline reconstruída com {total} posts")
+
+
+@bp.cli.command('verificar-timeline')
+def verificar_timeline_command():
+    """Compara a timeline materializada com as tabelas e falha se divergirem."""
+    divergencias = divergencias_timeline()
+    for post_id, motivo in divergencias[:50]:
+        print(f"  ✗ post {post_id}: {motivo}")
+    if divergencias:
+        print(f"❌ {len(divergencias)} divergência(s); rode 'flask reconstruir-timeline'")
+        sys.exit(1)
+    print("✅ Timeline consistente")
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# BUSCA
+# ══════════════════════════════════════════════════════════════════════════════
+# Tabela FTS5 'busca' (migração 7) com posts, comentários e perfis. O rowid
+# codifica o documento (tipo * FAIXA_BUSCA + id) e cada escrita atualiza o índice
+# na mesma transação. Sem stemming: buscas casam por prefixo de cada palavra.
+# Termos muito comuns casam com boa parte da base; para não calcular o bm25 de
+# todos, só os BUSCA_MAX_CANDIDATOS documentos mais recentes de cada tipo entram
+# no ranking (por tipo: misturados, os perfis disputariam vaga com os posts).
+
+TIPOS_BUSCA = {'post': 0, 'comentario': 1, 'usuario': 2}
+MAX_TERMOS_BUSCA = 8
+
+
+def _rowid_busca(tipo, ref_id):
+    return TIPOS_BUSCA[tipo] * FAIXA_BUSCA + int(ref_id)
+
+
+def indexar_busca(tipo, ref_id, texto):
+    db.session.execute(
+        db.text('INSERT OR REPLACE INTO busca (rowid, texto) VALUES (:rowid, :texto)'),
+        {'rowid': _rowid_busca(tipo, ref_id), 'texto': texto}
+    )
+
+
+def remover_busca(tipo, ref_id):
+    db.session.execute(db.text('DELETE FROM busca WHERE rowid = :rowid'), {'rowid': _rowid_busca(tipo, ref_id)})
+
+
+def texto_busca_usuario(user):
+    return f"{user.nome} {user.bio or ''}"
+
+
+def consulta_fts(q):
+    """'ana praia' -> '"ana"* AND "praia"*'. Só palavras: nada da sintaxe FTS5 passa adiante."""
+    termos = re.findall(r'\w+', q)[:MAX_TERMOS_BUSCA]
+    return ' AND '.join(f'"{t}"*' for t in termos)
+
+
+def codificar_cursor_busca(nota, rowid):
+    return base64.urlsafe_b64encode(f'{nota!r}|{rowid}'.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor_busca(cursor):
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        nota, rowid = bruto.split('|')
+        return float(nota), int(rowid)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise CursorInvalido(cursor) from e
+
+
+def buscar(q, tipo=None, cursor=None, limite=20):
+    """Retorna ([(tipo, id)], próximo cursor), do mais relevante (bm25) para o menos."""
+    params = {'q': consulta_fts(q), 'limite': limite + 1, 'candidatos': current_app.config['BUSCA_MAX_CANDIDATOS']}
+    pagina = ''
+    if cursor:
+        params['nota'], params['rowid'] = decodificar_cursor_busca(cursor)
+        pagina = 'WHERE nota > :nota OR (nota = :nota AND rowid > :rowid)'
+    
+    # O FTS5 percorre a faixa do tipo em ordem de rowid: o LIMIT de cada ramo para cedo
+    ramos = ' UNION ALL '.join(
+        f"SELECT * FROM (SELECT rowid, bm25(busca) AS nota FROM busca "
+        f"WHERE busca MATCH :q AND rowid BETWEEN {TIPOS_BUSCA[t] * FAIXA_BUSCA} AND {(TIPOS_BUSCA[t] + 1) * FAIXA_BUSCA - 1} "
+        f"ORDER BY rowid DESC LIMIT :candidatos)"
+        for t in ([tipo] if tipo else TIPOS_BUSCA)
+    )
+    linhas = db.session.execute(db.text(
+        f"SELECT rowid, nota FROM ({ramos}) {pagina} ORDER BY nota, rowid LIMIT :limite"
+    ), params).all()
+    
+    proximo = None
+    if len(linhas) > limite:
+        linhas = linhas[:limite]
+        proximo = codificar_cursor_busca(linhas[-1].nota, linhas[-1].rowid)
+    nomes = {v: k for k, v in TIPOS_BUSCA.items()}
+    return [(nomes[r.rowid // FAIXA_BUSCA], r.rowid % FAIXA_BUSCA) for r in linhas], proximo
+
+
+@medido('serializacao')
+def serializar_resultados(encontrados, current_user_id=None):
+    ids = {tipo: [i for t, i in encontrados if t == tipo] for tipo in TIPOS_BUSCA}
+    
+    posts = Post.query.filter(Post.id.in_(ids['post'])).all() if ids['post'] else []
+    comentarios = Comment.query.filter(Comment.id.in_(ids['comentario'])).all() if ids['comentario'] else []
+    dados = {
+        'post': dict(zip([p.id for p in posts], serializar_posts(posts, current_user_id))),
+        'comentario': dict(zip([c.id for c in comentarios], serializar_comentarios(comentarios))),
+        'usuario': cartoes_usuarios(ids['usuario']),
+    }
+    post_dos_comentarios = {c.id: c.post_id for c in comentarios}
+    
+    resultados = []
+    for tipo, ref_id in encontrados:
+        # Pode ter sido apagado entre a busca e a leitura
+        if ref_id not in dados[tipo]:
+            continue
+        item = {'tipo': tipo, tipo: dados[tipo][ref_id]}
+        if tipo == 'comentario':
+            item['post_id'] = post_dos_comentarios[ref_id]
+        resultados.append(item)
+    return resultados
+
+
+@bp.cli.command('reconstruir-busca')
+def reconstruir_busca_command():
+    """Recria o índice de busca a partir de posts, comentários e perfis."""
+    with db.engine.begin() as conn:
+        preencher_busca(conn)
+        total = conn.exec_driver_sql('SELECT COUNT(*) FROM busca').scalar()
+    print(f"✅ Índice de busca reconstruído com {total} documentos")
+
+
 # ══════════════════════════════════════════════════════════════════════════════
 # ROTAS DE AUTENTICAÇÃO
 # ══════════════════════════════════════════════════════════════════════════════
 
-@app.route('/api/auth/register', methods=['POST'])
+@bp.route('/api/auth/register', methods=['POST'])
+@leituras_sem_lock
 def register():
     try:
         data = request.get_json()
@@ -268,17 +1385,32 @@ def register():
             if invite.email.lower() != email:
                 return jsonify({'error': 'Este convite foi enviado para outro email'}), 400
         
-        user = User(email=email, nome=nome, is_admin=is_first_user)
-        user.set_password(password)
+        # Só com o cadastro validado (fora da transação de escrita): sem convite, ninguém ocupa o pool de hash
+        with medir('senha'):
+            password_hash = processador_senhas.gerar(password)
+        
+        user = User(email=email, nome=nome, is_admin=is_first_user, password_hash=password_hash)
         
         db.session.add(user)
-        db.session.flush()
+        try:
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({'error': 'Email já cadastrado'}), 400
+        indexar_busca('usuario', user.id, texto_busca_usuario(user))
         
         if invite:
-            invite.used = True
-            invite.used_by_id = user.id
+            # O convite pode ter sido usado enquanto o hash era calculado
+            if not db.session.execute(
+                db.update(Invite)
+                .where(Invite.id == invite.id, Invite.used == False)
+                .values(used=True, used_by_id=user.id)
+            ).rowcount:
+                db.session.rollback()
+                return jsonify({'error': 'Convite inválido ou já utilizado'}), 400
             criar_notificacao(invite.invited_by_id, 'invite_accepted', f'{nome} aceitou seu convite!', actor_id=user.id)
         
+        invalidar_cache('usuarios', 'stats')
         db.session.commit()
         
         access_token = create_access_token(identity=str(user.id))
@@ -289,13 +1421,16 @@ def register():
             'user': user.to_dict(include_email=True)
         }), 201
         
+    except SenhasOcupadas:
+        return jsonify({'error': 'Servidor ocupado, tente de novo em instantes'}), 503
     except Exception as e:
         db.session.rollback()
         print(f"Erro no registro: {str(e)}")
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
 
-@app.route('/api/auth/login', methods=['POST'])
+@bp.route('/api/auth/login', methods=['POST'])
+@leituras_sem_lock
 def login():
     try:
         data = request.get_json()
@@ -314,8 +1449,10 @@ def login():
         if not user or not user.check_password(password):
             return jsonify({'error': 'Email ou senha incorretos'}), 401
         
-        user.last_seen = datetime.utcnow()
-        db.session.commit()
+        if processador_senhas.desatualizado(user.password_hash):
+            user.set_password(password)
+            db.session.commit()
+        registrar_presenca(user.id)
         
         access_token = create_access_token(identity=str(user.id))
         
@@ -325,12 +1462,15 @@ def login():
             'user': user.to_dict(include_email=True)
         })
         
+    except SenhasOcupadas:
+        return jsonify({'error': 'Servidor ocupado, tente de novo em instantes'}), 503
     except Exception as e:
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
 
-@app.route('/api/auth/me', methods=['GET'])
+@bp.route('/api/auth/me', methods=['GET'])
 @jwt_required()
+@get_condicional(lambda: [f'usuario:{get_jwt_identity()}'])
 def get_me():
     user_id = get_jwt_identity()
     user = User.query.get(user_id)
@@ -338,13 +1478,10 @@ def get_me():
     if not user:
         return jsonify({'error': 'Usuário não encontrado'}), 404
     
-    user.last_seen = datetime.utcnow()
-    db.session.commit()
-    
-    return jsonify(user.to_dict(include_email=True))
+    return jsonify(user.to_dict(include_email=True, campos=campos_pedidos()))
 
 
-@app.route('/api/auth/check-invite/<token>', methods=['GET'])
+@bp.route('/api/auth/check-invite/<token>', methods=['GET'])
 def check_invite(token):
     invite = Invite.query.filter_by(token=token, used=False).first()
     
@@ -365,7 +1502,7 @@ def check_invite(token):
 # ROTAS DE PERFIL
 # ══════════════════════════════════════════════════════════════════════════════
 
-@app.route('/api/profile', methods=['PUT'])
+@bp.route('/api/profile', methods=['PUT'])
 @jwt_required()
 def update_profile():
     user_id = get_jwt_identity()
@@ -385,6 +1522,10 @@ def update_profile():
     if 'cor_tema' in data:
         user.cor_tema = data['cor_tema']
     
+    if 'nome' in data or 'bio' in data:
+        indexar_busca('usuario', user.id, texto_busca_usuario(user))
+    invalidar_cache('usuarios')
+    invalidar_cartoes(user.id)
     db.session.commit()
     
     return jsonify({
@@ -393,7 +1534,7 @@ def update_profile():
     })
 
 
-@app.route('/api/profile/avatar', methods=['POST'])
+@bp.route('/api/profile/avatar', methods=['POST'])
 @jwt_required()
 def upload_avatar():
     user_id = get_jwt_identity()
@@ -407,57 +1548,74 @@ def upload_avatar():
     if file.filename == '' or not allowed_file(file.filename):
         return jsonify({'error': 'Arquivo inválido'}), 400
     
-    ext = file.filename.rsplit('.', 1)[1].lower()
-    filename = f"{user_id}_{uuid.uuid4().hex}.{ext}"
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'avatars', filename)
-    
-    file.save(filepath)
+    filename = salvar_imagem(file, 'avatars', imagens.VARIANTES_AVATAR)
+    liberar_blob('avatars', user.avatar)
     user.avatar = filename
+    invalidar_cache('usuarios')
+    invalidar_cartoes(user.id)
     db.session.commit()
     
     return jsonify({'message': 'Avatar atualizado!', 'avatar': filename})
 
 
-@app.route('/api/users', methods=['GET'])
+@bp.route('/api/users', methods=['GET'])
 @jwt_required()
+@cache_respostas.resposta(tags=('usuarios',))
 def list_users():
     users = User.query.filter_by(is_active=True).order_by(User.last_seen.desc()).all()
-    return jsonify([user.to_dict() for user in users])
+    return jsonify(serializar_usuarios(users, campos=campos_pedidos()))
 
 
-@app.route('/api/users/<int:user_id>', methods=['GET'])
+@bp.route('/api/users/<int:user_id>', methods=['GET'])
 @jwt_required()
 def get_user(user_id):
-    user = User.query.get(user_id)
-    if not user:
+    cartao = cartoes_usuarios([user_id]).get(user_id)
+    if not cartao:
         return jsonify({'error': 'Usuário não encontrado'}), 404
-    return jsonify(user.to_dict())
+    return jsonify(recortar(cartao, validar(campos_pedidos(), User.CAMPOS)))
 
 
 # ══════════════════════════════════════════════════════════════════════════════
 # ROTAS DE POSTS
 # ══════════════════════════════════════════════════════════════════════════════
 
-@app.route('/api/posts', methods=['GET'])
+@bp.route('/api/posts', methods=['GET'])
 @jwt_required()
+@get_condicional(lambda: ['posts', 'usuarios'], relativo=True)
 def list_posts():
     user_id = get_jwt_identity()
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 20, type=int)
+    per_page = min(request.args.get('per_page', 20, type=int), 100)
+    try:
+        comentarios = comentarios_incluidos()
+    except ValueError:
+        return jsonify({'error': f'include inválido: use comments:N com N de 1 a {MAX_COMENTARIOS_INLINE}'}), 400
+    
+    if 'page' not in request.args:
+        modelo = TimelineEntry if timeline_ativa() else Post
+        try:
+            posts, next_cursor = pagina_por_cursor(modelo.query, modelo, request.args.get('cursor'), per_page)
+        except CursorInvalido:
+            return jsonify({'error': 'Cursor inválido'}), 400
+        return jsonify({
+            'posts': serializar_posts(posts, current_user_id=user_id, comentarios=comentarios, campos=campos_pedidos()),
+            'next_cursor': next_cursor
+        })
     
+    # Modo legado por página (OFFSET + total)
+    page = request.args.get('page', 1, type=int)
     posts = Post.query.order_by(Post.created_at.desc()).paginate(
         page=page, per_page=per_page, error_out=False
     )
     
     return jsonify({
-        'posts': [post.to_dict(current_user_id=user_id) for post in posts.items],
+        'posts': serializar_posts(posts.items, current_user_id=user_id, comentarios=comentarios, campos=campos_pedidos()),
         'total': posts.total,
         'pages': posts.pages,
         'current_page': page
     })
 
 
-@app.route('/api/posts', methods=['POST'])
+@bp.route('/api/posts', methods=['POST'])
 @jwt_required()
 def create_post():
     user_id = get_jwt_identity()
@@ -470,11 +1628,7 @@ def create_post():
         if 'imagem' in request.files:
             file = request.files['imagem']
             if file.filename != '' and allowed_file(file.filename):
-                ext = file.filename.rsplit('.', 1)[1].lower()
-                filename = f"{user_id}_{uuid.uuid4().hex}.{ext}"
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'posts', filename)
-                file.save(filepath)
-                imagem = filename
+                imagem = salvar_imagem(file, 'posts', imagens.VARIANTES_POST)
     else:
         data = request.get_json()
         texto = data.get('texto', '').strip() if data else ''
@@ -484,6 +1638,12 @@ def create_post():
     
     post = Post(user_id=user_id, texto=texto, imagem=imagem)
     db.session.add(post)
+    db.session.flush()
+    indexar_busca('post', post.id, texto)
+    ajustar_contadores_usuario(user_id, posts=1)
+    timeline_adicionar(post)
+    invalidar_cache('usuarios', 'stats')
+    carimbar('posts')
     db.session.commit()
     
     return jsonify({
@@ -492,8 +1652,9 @@ def create_post():
     }), 201
 
 
-@app.route('/api/posts/<int:post_id>', methods=['GET'])
+@bp.route('/api/posts/<int:post_id>', methods=['GET'])
 @jwt_required()
+@get_condicional(lambda post_id: ['posts', 'usuarios'], relativo=True)
 def get_post(post_id):
     user_id = get_jwt_identity()
     post = Post.query.get(post_id)
@@ -501,13 +1662,13 @@ def get_post(post_id):
     if not post:
         return jsonify({'error': 'Post não encontrado'}), 404
     
-    return jsonify(post.to_dict(current_user_id=user_id))
+    return jsonify(serializar_posts([post], current_user_id=user_id, campos=campos_pedidos())[0])
 
 
-@app.route('/api/posts/<int:post_id>', methods=['DELETE'])
+@bp.route('/api/posts/<int:post_id>', methods=['DELETE'])
 @jwt_required()
 def delete_post(post_id):
-    user_id = get_jwt_identity()
+    user_id = int(get_jwt_identity())
     user = User.query.get(user_id)
     post = Post.query.get(post_id)
     
@@ -517,48 +1678,106 @@ def delete_post(post_id):
     if post.user_id != user_id and not user.is_admin:
         return jsonify({'error': 'Sem permissão'}), 403
     
+    ajustar_contadores_usuario(post.user_id, posts=-1, likes=-post.likes_count)
+    timeline_remover(post.id)
+    remover_busca('post', post.id)
+    db.session.execute(
+        db.text('DELETE FROM busca WHERE rowid IN (SELECT :faixa + id FROM comments WHERE post_id = :post_id)'),
+        {'faixa': _rowid_busca('comentario', 0), 'post_id': post.id}
+    )
+    liberar_blob('posts', post.imagem)
     db.session.delete(post)
+    invalidar_cache('usuarios', 'stats')
+    carimbar('posts', f'comentarios:{post.id}')
     db.session.commit()
     
     return jsonify({'message': 'Post deletado!'})
 
 
-@app.route('/api/posts/<int:post_id>/like', methods=['POST'])
+@bp.route('/api/posts/<int:post_id>/like', methods=['POST'])
 @jwt_required()
 def like_post(post_id):
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user_id = int(get_jwt_identity())
     post = Post.query.get(post_id)
     
     if not post:
         return jsonify({'error': 'Post não encontrado'}), 404
     
-    if user in post.liked_by:
-        post.liked_by.remove(user)
-        liked = False
-    else:
-        post.liked_by.append(user)
-        liked = True
+    # Uma busca pela chave primária (user_id, post_id): tenta descurtir, senão curte.
+    # A transação já começa com BEGIN IMMEDIATE, então dois toques seguidos não se cruzam.
+    removidas = db.session.execute(
+        db.delete(likes).where(likes.c.user_id == user_id, likes.c.post_id == post.id)
+    ).rowcount
+    liked = not removidas
+    if liked:
+        db.session.execute(
+            sqlite_insert(likes).values(user_id=user_id, post_id=post.id).on_conflict_do_nothing()
+        )
         if post.user_id != user_id:
-            criar_notificacao(post.user_id, 'like', f'{user.nome} curtiu seu post', actor_id=user_id)
-    
+            nome = db.session.query(User.nome).filter_by(id=user_id).scalar()
+            criar_notificacao(post.user_id, 'like', f'{nome} curtiu seu post', actor_id=user_id, post_id=post.id)
+    
+    delta = 1 if liked else -1
+    likes_count = post.likes_count + delta
+    ajustar_contadores_post(post.id, likes=delta)
+    ajustar_contadores_usuario(post.user_id, likes=delta)
+    timeline_ajustar(post.id, likes=delta)
+    invalidar_cache('usuarios')
+    carimbar('posts')
     db.session.commit()
     
-    return jsonify({'liked': liked, 'likes_count': post.liked_by.count()})
+    return jsonify({'liked': liked, 'likes_count': likes_count})
+
+
+@bp.route('/api/likes/state', methods=['POST'])
+@jwt_required()
+@leituras_sem_lock
+def likes_state():
+    user_id = get_jwt_identity()
+    data = request.get_json(silent=True) or {}
+    post_ids = data.get('post_ids')
+    
+    if not isinstance(post_ids, list) or len(post_ids) > MAX_IDS_CURTIDAS:
+        return jsonify({'error': f'Envie post_ids como lista de até {MAX_IDS_CURTIDAS} ids'}), 400
+    try:
+        post_ids = {int(i) for i in post_ids}
+    except (TypeError, ValueError):
+        return jsonify({'error': 'post_ids inválidos'}), 400
+    
+    return jsonify({'liked': sorted(_posts_curtidos(user_id, post_ids))})
 
 
-@app.route('/api/posts/user/<int:user_id>', methods=['GET'])
+@bp.route('/api/posts/user/<int:user_id>', methods=['GET'])
 @jwt_required()
+@get_condicional(lambda user_id: ['posts', 'usuarios'], relativo=True)
 def list_user_posts(user_id):
     current_user_id = get_jwt_identity()
-    page = request.args.get('page', 1, type=int)
+    try:
+        comentarios = comentarios_incluidos()
+    except ValueError:
+        return jsonify({'error': f'include inválido: use comments:N com N de 1 a {MAX_COMENTARIOS_INLINE}'}), 400
+    
+    if 'page' not in request.args:
+        modelo = TimelineEntry if timeline_ativa() else Post
+        query = modelo.query.filter_by(user_id=user_id)
+        try:
+            posts, next_cursor = pagina_por_cursor(query, modelo, request.args.get('cursor'), 20)
+        except CursorInvalido:
+            return jsonify({'error': 'Cursor inválido'}), 400
+        return jsonify({
+            'posts': serializar_posts(posts, current_user_id=current_user_id, comentarios=comentarios,
+                                      campos=campos_pedidos()),
+            'next_cursor': next_cursor
+        })
     
+    page = request.args.get('page', 1, type=int)
     posts = Post.query.filter_by(user_id=user_id).order_by(
         Post.created_at.desc()
     ).paginate(page=page, per_page=20, error_out=False)
     
     return jsonify({
-        'posts': [post.to_dict(current_user_id=current_user_id) for post in posts.items],
+        'posts': serializar_posts(posts.items, current_user_id=current_user_id, comentarios=comentarios,
+                                  campos=campos_pedidos()),
         'total': posts.total
     })
 
@@ -567,18 +1786,27 @@ def list_user_posts(user_id):
 # ROTAS DE COMENTÁRIOS
 # ══════════════════════════════════════════════════════════════════════════════
 
-@app.route('/api/posts/<int:post_id>/comments', methods=['GET'])
+@bp.route('/api/posts/<int:post_id>/comments', methods=['GET'])
 @jwt_required()
+@get_condicional(lambda post_id: [f'comentarios:{post_id}', 'usuarios'])
 def list_comments(post_id):
     post = Post.query.get(post_id)
     if not post:
         return jsonify({'error': 'Post não encontrado'}), 404
     
-    comments = Comment.query.filter_by(post_id=post_id).order_by(Comment.created_at.asc()).all()
-    return jsonify([c.to_dict() for c in comments])
+    per_page = min(request.args.get('per_page', 50, type=int), 100)
+    query = Comment.query.filter_by(post_id=post_id)
+    try:
+        comments, next_cursor = pagina_por_cursor(query, Comment, request.args.get('cursor'), per_page, crescente=True)
+    except CursorInvalido:
+        return jsonify({'error': 'Cursor inválido'}), 400
+    return jsonify({
+        'comments': serializar_comentarios(comments, campos=campos_pedidos()),
+        'next_cursor': next_cursor
+    })
 
 
-@app.route('/api/posts/<int:post_id>/comments', methods=['POST'])
+@bp.route('/api/posts/<int:post_id>/comments', methods=['POST'])
 @jwt_required()
 def create_comment(post_id):
     user_id = get_jwt_identity()
@@ -596,28 +1824,62 @@ def create_comment(post_id):
     
     comment = Comment(user_id=user_id, post_id=post_id, texto=texto)
     db.session.add(comment)
+    db.session.flush()
+    indexar_busca('comentario', comment.id, texto)
+    ajustar_contadores_post(post.id, comments=1)
+    timeline_ajustar(post.id, comments=1)
+    invalidar_cache('stats')
+    carimbar('posts', f'comentarios:{post.id}')
     
-    if post.user_id != user_id:
-        criar_notificacao(post.user_id, 'comment', f'{user.nome} comentou no seu post', actor_id=user_id)
+    if post.user_id != int(user_id):
+        criar_notificacao(post.user_id, 'comment', f'{user.nome} comentou no seu post', actor_id=user_id, post_id=post.id)
     
     db.session.commit()
     
     return jsonify({'message': 'Comentário adicionado!', 'comment': comment.to_dict()}), 201
 
 
+# ══════════════════════════════════════════════════════════════════════════════
+# ROTAS DE BUSCA
+# ══════════════════════════════════════════════════════════════════════════════
+
+@bp.route('/api/search', methods=['GET'])
+@jwt_required()
+def search():
+    user_id = get_jwt_identity()
+    q = request.args.get('q', '').strip()
+    tipo = request.args.get('tipo') or None
+    limite = min(request.args.get('per_page', 20, type=int), 50)
+    
+    if not consulta_fts(q):
+        return jsonify({'error': 'Informe o que buscar'}), 400
+    if tipo and tipo not in TIPOS_BUSCA:
+        return jsonify({'error': f"tipo deve ser um de: {', '.join(TIPOS_BUSCA)}"}), 400
+    
+    try:
+        encontrados, next_cursor = buscar(q, tipo, request.args.get('cursor'), limite)
+    except CursorInvalido:
+        return jsonify({'error': 'Cursor inválido'}), 400
+    
+    return jsonify({
+        'results': serializar_resultados(encontrados, current_user_id=user_id),
+        'next_cursor': next_cursor
+    })
+
+
 # ══════════════════════════════════════════════════════════════════════════════
 # ROTAS DE CONVITES
 # ══════════════════════════════════════════════════════════════════════════════
 
-@app.route('/api/invites', methods=['GET'])
+@bp.route('/api/invites', methods=['GET'])
 @jwt_required()
 def list_invites():
     user_id = get_jwt_identity()
     invites = Invite.query.filter_by(invited_by_id=user_id).order_by(Invite.created_at.desc()).all()
-    return jsonify([i.to_dict() for i in invites])
+    return jsonify(serializar_convites(invites, campos=campos_pedidos()))
 
 
-@app.route('/api/invites', methods=['POST'])
+@bp.route('/api/invites', methods=['POST'])
 @jwt_required()
 def create_invite():
     user_id = get_jwt_identity()
@@ -651,28 +1913,81 @@ def create_invite():
 # ROTAS DE NOTIFICAÇÕES
 # ══════════════════════════════════════════════════════════════════════════════
 
-@app.route('/api/notifications', methods=['GET'])
+@bp.route('/api/notifications', methods=['GET'])
 @jwt_required()
+@get_condicional(lambda: [f'notificacoes:{get_jwt_identity()}', 'usuarios'])
 def list_notifications():
     user_id = get_jwt_identity()
     
     notifications = Notification.query.filter_by(user_id=user_id).order_by(
         Notification.created_at.desc()
-    ).limit(50).all()
+    ).limit(MAX_NOTIFICACOES_LISTADAS).all()
     
     unread_count = Notification.query.filter_by(user_id=user_id, lida=False).count()
     
     return jsonify({
-        'notifications': [n.to_dict() for n in notifications],
+        'notifications': serializar_notificacoes(notifications, campos=campos_pedidos()),
         'unread_count': unread_count
     })
 
 
-@app.route('/api/notifications/read', methods=['POST'])
+@bp.route('/api/notifications/stream', methods=['GET'])
+# EventSource não envia cabeçalhos: só o stream aceita ?jwt=<token>
+@jwt_required(locations=['headers', 'query_string'])
+def stream_notifications():
+    user_id = int(get_jwt_identity())
+    heartbeat = current_app.config['SSE_HEARTBEAT']
+    
+    # Assina antes de ler o último id para não perder nada entre as duas coisas
+    assinatura = hub.assinar(canal_notificacoes(user_id))
+    
+    ultimo_id = request.headers.get('Last-Event-ID', type=int)
+    retomando = ultimo_id is not None
+    if not retomando:
+        ultimo_id = db.session.query(db.func.max(Notification.id)).filter(
+            Notification.user_id == user_id
+        ).scalar() or 0
+    db.session.close()
+    
+    def eventos():
+        nonlocal ultimo_id
+        try:
+            yield f'retry: {heartbeat * 1000}\n\n'
+            buscar = retomando
+            while True:
+                if buscar:
+                    novas = Notification.query.filter(
+                        Notification.user_id == user_id,
+                        Notification.id > ultimo_id
+                    ).order_by(Notification.id).limit(50).all()
+                    dados = serializar_notificacoes(novas)
+                    # Conexão ociosa não segura conexão do pool
+                    db.session.close()
+                    cache_cartoes.esquecer_memo()
+                    for notif in dados:
+                        ultimo_id = notif['id']
+                        yield f"id: {notif['id']}\nevent: notification\ndata: {current_app.json.dumps(notif, ensure_ascii=False)}\n\n"
+                    if len(dados) == 50:
+                        continue
+                
+                buscar = assinatura.proximo(timeout=heartbeat) is not None
+                if not buscar:
+                    yield ': ping\n\n'
+        finally:
+            hub.cancelar(assinatura)
+    
+    return Response(stream_with_context(eventos()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+@bp.route('/api/notifications/read', methods=['POST'])
 @jwt_required()
 def mark_notifications_read():
     user_id = get_jwt_identity()
     Notification.query.filter_by(user_id=user_id, lida=False).update({'lida': True})
+    carimbar(f'notificacoes:{user_id}')
     db.session.commit()
     return jsonify({'message': 'Notificações lidas!'})
 
@@ -681,37 +1996,704 @@ def mark_notifications_read():
 # OUTRAS ROTAS
 # ══════════════════════════════════════════════════════════════════════════════
 
-@app.route('/uploads/<path:filename>')
+CACHE_UPLOADS = 365 * 24 * 3600
+
+
+def _original_da_variante(pasta, filename):
+    diretorio, nome = os.path.split(filename)
+    for candidato in imagens.candidatos_originais(nome, ALLOWED_EXTENSIONS):
+        if os.path.isfile(os.path.join(pasta, diretorio, candidato)):
+            return os.path.join(diretorio, candidato)
+    return None
+
+
+@bp.route('/uploads/<path:filename>')
 def serve_upload(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    pasta = current_app.config['UPLOAD_FOLDER']
+    caminho = safe_join(pasta, filename)
+    if caminho is None:
+        abort(404)
+    
+    # Nomes de upload nunca mudam de conteúdo (hash/uuid), então podem ficar em cache para sempre
+    imutavel = True
+    if not os.path.isfile(caminho):
+        # Variante ainda não gerada (ou Pillow ausente): serve o original, sem cache longo
+        filename = _original_da_variante(pasta, filename)
+        if filename is None:
+            abort(404)
+        imutavel = False
+    
+    etag = os.path.basename(filename).rsplit('.', 1)[0]
+    
+    if current_app.config['UPLOADS_SENDFILE'] == 'x-accel':
+        resposta = Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        resposta.headers['X-Accel-Redirect'] = current_app.config['UPLOADS_ACCEL_PREFIX'] + filename.replace(os.sep, '/')
+        resposta.set_etag(etag)
+        resposta.cache_control.public = True
+        resposta.cache_control.max_age = CACHE_UPLOADS if imutavel else 0
+    else:
+        resposta = send_from_directory(
+            pasta, filename, etag=etag, conditional=True, max_age=CACHE_UPLOADS if imutavel else 0
+        )
+        resposta.accept_ranges = 'bytes'
+    
+    if imutavel:
+        resposta.cache_control.immutable = True
+    else:
+        resposta.cache_control.no_cache = True
+    return resposta.make_conditional(request) if current_app.config['UPLOADS_SENDFILE'] == 'x-accel' else resposta
 
 
-@app.route('/api/stats', methods=['GET'])
+@bp.route('/api/stats', methods=['GET'])
 @jwt_required()
+@cache_respostas.resposta(tags=('stats',))
 def get_stats():
     return jsonify({
         'total_users': User.query.filter_by(is_active=True).count(),
         'total_posts': Post.query.count(),
         'total_comments': Comment.query.count(),
-        'online_users': User.query.filter(User.last_seen > datetime.utcnow() - timedelta(minutes=5)).count(),
+        'online_users': usuarios_online(),
+        # 'worker': presença em memória, só quem este processo atendeu
+        'online_users_scope': 'global' if presenca.compartilhada else 'worker',
         'new_members_week': User.query.filter(User.created_at > datetime.utcnow() - timedelta(days=7)).count()
     })
 
 
-@app.route('/api/health', methods=['GET'])
+@bp.route('/api/admin/cache', methods=['GET'])
+@jwt_required()
+@admin_required
+def cache_stats():
+    return jsonify(cache_respostas.estatisticas())
+
+
+@bp.route('/api/admin/maintenance', methods=['GET'])
+@jwt_required()
+@admin_required
+def maintenance_status():
+    tarefas = {t.nome: t for t in TarefaManutencao.query.all()}
+    resposta = {}
+    for nome, intervalo in current_app.config['MANUTENCAO_TAREFAS'].items():
+        tarefa = tarefas.get(nome) or TarefaManutencao(resultado='null')
+        resposta[nome] = {
+            'intervalo': intervalo,
+            'ultima': tarefa.ultima,
+            'proxima': tarefa.proxima,
+            'duracao': tarefa.duracao,
+            'resultado': json.loads(tarefa.resultado)
+        }
+    return jsonify(resposta)
+
+
+@bp.route('/api/admin/metrics', methods=['GET'])
+@jwt_required()
+@admin_required
+def metrics():
+    return Response(metricas.exportar(), mimetype='text/plain; version=0.0.4')
+
+
+@bp.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'ok', 'version': '1.2'})
 
 
+# ══════════════════════════════════════════════════════════════════════════════
+# UPLOADS
+# ══════════════════════════════════════════════════════════════════════════════
+
+def limpar_blobs(carencia=None, lote=500):
+    carencia = carencia if carencia is not None else current_app.config['BLOBS_CARENCIA']
+    limite = datetime.utcnow() - carencia
+    removidos = 0
+    bytes_liberados = 0
+    while True:
+        blobs = Blob.query.filter(Blob.refs <= 0, Blob.atualizado_em < limite).limit(lote).all()
+        if not blobs:
+            break
+        for blob in blobs:
+            pasta, filename = blob.nome.split('/', 1)
+            variantes = imagens.VARIANTES_AVATAR if pasta == 'avatars' else imagens.VARIANTES_POST
+            for nome in [filename] + [imagens.nome_variante(filename, v) for v in variantes]:
+                caminho = os.path.join(current_app.config['UPLOAD_FOLDER'], pasta, nome)
+                if os.path.exists(caminho):
+                    bytes_liberados += os.path.getsize(caminho)
+                    os.unlink(caminho)
+            db.session.delete(blob)
+        db.session.commit()
+        removidos += len(blobs)
+    return removidos, bytes_liberados
+
+
+@bp.cli.command('limpar-blobs')
+def limpar_blobs_command():
+    """Apaga arquivos enviados que não são mais referenciados por posts nem avatares."""
+    removidos, bytes_liberados = limpar_blobs()
+    print(f"✅ {removidos} arquivo(s) removido(s), {bytes_liberados / 1024 / 1024:.1f} MB liberados")
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# MANUTENÇÃO
+# ══════════════════════════════════════════════════════════════════════════════
+# Retenção (convites vencidos, notificações lidas que ninguém mais vê, arquivos
+# órfãos) e cuidados com o SQLite (checkpoint do WAL, ANALYZE, compactação).
+# Cada worker tem um agendador; a tabela 'manutencao' guarda a próxima execução
+# de cada tarefa e só roda quem consegue adiá-la (UPDATE ... WHERE proxima <= agora).
+# Exclusões vão em lotes de MANUTENCAO_LOTE linhas, cada um na sua transação,
+# com uma pausa entre eles para as requisições pegarem o lock de escrita.
+
+def uso_do_banco():
+    """(bytes em páginas usadas, bytes em páginas livres) do arquivo do banco."""
+    with motor_leitura().connect() as conn:
+        tamanho = conn.exec_driver_sql('PRAGMA page_size').scalar()
+        total = conn.exec_driver_sql('PRAGMA page_count').scalar()
+        livres = conn.exec_driver_sql('PRAGMA freelist_count').scalar()
+    return (total - livres) * tamanho, livres * tamanho
+
+
+def _ler_ids(consulta):
+    with motor_leitura().connect() as conn:
+        return [i for (i,) in conn.execute(consulta)]
+
+
+def _apagar_em_lotes(modelo, ids):
+    lote = current_app.config['MANUTENCAO_LOTE']
+    apagadas = 0
+    for inicio in range(0, len(ids), lote):
+        apagadas += db.session.execute(
+            db.delete(modelo).where(modelo.id.in_(ids[inicio:inicio + lote]))
+        ).rowcount
+        db.session.commit()
+        time.sleep(current_app.config['MANUTENCAO_PAUSA'])
+    return apagadas
+
+
+def _apagar_linhas(modelo, consulta):
+    usadas = uso_do_banco()[0]
+    apagadas = _apagar_em_lotes(modelo, _ler_ids(consulta))
+    # As páginas liberadas voltam para a lista livre do arquivo (a compactação devolve ao disco)
+    return {'linhas': apagadas, 'bytes': max(0, usadas - uso_do_banco()[0])}
+
+
+def limpar_convites():
+    """Convites usados ou não, vencidos há mais de RETENCAO_CONVITES."""
+    limite = datetime.utcnow() - current_app.config['RETENCAO_CONVITES']
+    return _apagar_linhas(Invite, db.select(Invite.id).where(Invite.expires_at < limite))
+
+
+def limpar_notificacoes():
+    """Notificações lidas além das RETENCAO_NOTIFICACOES_LIDAS mais recentes de cada usuário."""
+    posicao = db.func.row_number().over(
+        partition_by=Notification.user_id,
+        order_by=(Notification.created_at.desc(), Notification.id.desc())
+    ).label('posicao')
+    janela = db.select(Notification.id, Notification.lida, posicao).subquery()
+    consulta = db.select(janela.c.id).where(
+        janela.c.posicao > current_app.config['RETENCAO_NOTIFICACOES_LIDAS'],
+        janela.c.lida == True
+    )
+    return _apagar_linhas(Notification, consulta)
+
+
+def limpar_arquivos():
+    """Blobs sem referência e arquivos em uploads/ que nenhum blob conhece (uploads interrompidos)."""
+    removidos, bytes_liberados = limpar_blobs(lote=current_app.config['MANUTENCAO_LOTE'])
+    
+    with motor_leitura().connect() as conn:
+        conhecidos = {nome for (nome,) in conn.execute(db.select(Blob.nome))}
+        conhecidos.update(f'posts/{nome}' for (nome,) in conn.execute(db.select(Post.imagem).distinct()))
+        conhecidos.update(f'avatars/{nome}' for (nome,) in conn.execute(db.select(User.avatar).distinct()))
+    
+    # Mesma carência dos blobs: um upload em andamento já tem arquivo mas ainda não tem linha
+    limite = time.time() - current_app.config['BLOBS_CARENCIA'].total_seconds()
+    orfaos = []
+    for pasta in ('posts', 'avatars', PASTA_TEMPORARIA):
+        diretorio = os.path.join(current_app.config['UPLOAD_FOLDER'], pasta)
+        if not os.path.isdir(diretorio):
+            continue
+        for entrada in os.scandir(diretorio):
+            if not entrada.is_file() or entrada.stat().st_mtime > limite:
+                continue
+            originais = []
+            if pasta != PASTA_TEMPORARIA:
+                originais = [f'{pasta}/{nome}' for nome in
+                             imagens.candidatos_originais(entrada.name, ALLOWED_EXTENSIONS) or [entrada.name]]
+                if any(nome in conhecidos for nome in originais):
+                    continue
+            orfaos.append((entrada.path, originais))
+    
+    # Confere de novo com o lock de escrita: um novo upload do mesmo conteúdo pode
+    # ter passado a usar o arquivo depois da leitura acima (ver salvar_imagem)
+    lote = current_app.config['MANUTENCAO_LOTE']
+    for inicio in range(0, len(orfaos), lote):
+        parte = orfaos[inicio:inicio + lote]
+        nomes = {nome for _, originais in parte for nome in originais}
+        usados = set(db.session.scalars(db.select(Blob.nome).where(Blob.nome.in_(nomes)))) if nomes else set()
+        for caminho, originais in parte:
+            if usados.intersection(originais) or not os.path.exists(caminho):
+                continue
+            bytes_liberados += os.path.getsize(caminho)
+            os.unlink(caminho)
+            removidos += 1
+        db.session.commit()
+        time.sleep(current_app.config['MANUTENCAO_PAUSA'])
+    return {'linhas': removidos, 'bytes': bytes_liberados}
+
+
+def _tamanho(caminho):
+    return os.path.getsize(caminho) if caminho and os.path.exists(caminho) else 0
+
+
+def _pragma(*comandos, busy_timeout=None):
+    """Roda os comandos numa conexão, fora de transação (VACUUM e checkpoint não rodam dentro de uma).
+
+    Devolve as linhas do último.
+    """
+    conexao = db.engine.raw_connection()
+    try:
+        if busy_timeout is not None:
+            conexao.execute(f'PRAGMA busy_timeout={busy_timeout}')
+        for comando in comandos:
+            linhas = conexao.execute(comando).fetchall()
+        return linhas
+    finally:
+        if busy_timeout is not None:
+            conexao.execute(f"PRAGMA busy_timeout={current_app.config['SQLITE_PRAGMAS']['busy_timeout']}")
+        conexao.close()
+
+
+def checkpoint_wal():
+    """Copia o WAL para o banco e o trunca; desiste em 1 s se houver leitura longa em andamento."""
+    wal = f'{db.engine.url.database}-wal'
+    antes = _tamanho(wal)
+    ocupado, _paginas, copiadas = _pragma('PRAGMA wal_checkpoint(TRUNCATE)', busy_timeout=1000)[0]
+    return {'paginas': copiadas, 'ocupado': bool(ocupado), 'bytes': max(0, antes - _tamanho(wal))}
+
+
+def atualizar_estatisticas():
+    """ANALYZE (amostrado, para não ler tabelas inteiras): o planejador escolhe melhor os índices."""
+    tabelas = _pragma('PRAGMA analysis_limit=1000', 'ANALYZE', 'SELECT DISTINCT tbl FROM sqlite_stat1')
+    return {'tabelas': len(tabelas)}
+
+
+def compactar(vacuum=False):
+    """Devolve ao disco as páginas livres: aos poucos com auto_vacuum incremental, senão com VACUUM.
+
+    O VACUUM reescreve o arquivo inteiro com o lock de escrita preso: só com
+    `vacuum=True` (flask manutencao compactacao), nunca pelo agendador.
+    """
+    usadas, livres = uso_do_banco()
+    if not livres:
+        return {'modo': 'nada', 'bytes': 0}
+    
+    if _pragma('PRAGMA auto_vacuum')[0][0] == 2:
+        while _pragma('PRAGMA freelist_count')[0][0]:
+            _pragma(f"PRAGMA incremental_vacuum({current_app.config['MANUTENCAO_LOTE']})")
+            time.sleep(current_app.config['MANUTENCAO_PAUSA'])
+        modo = 'incremental'
+    elif 0 < current_app.config['MANUTENCAO_VACUUM_LIVRE'] <= livres / (usadas + livres):
+        if not vacuum:
+            return {'modo': 'vacuum pendente (flask manutencao compactacao)', 'bytes': 0}
+        # Reescreve o arquivo inteiro (e passa o banco para auto_vacuum incremental)
+        _pragma('VACUUM')
+        modo = 'vacuum'
+    else:
+        return {'modo': 'nada', 'bytes': 0}
+    # As páginas saem do arquivo no checkpoint; até lá a mudança está no WAL
+    _pragma('PRAGMA wal_checkpoint(TRUNCATE)', busy_timeout=1000)
+    return {'modo': modo, 'bytes': max(0, usadas + livres - sum(uso_do_banco()))}
+
+
+TAREFAS_MANUTENCAO = {
+    'convites': limpar_convites,
+    'notificacoes': limpar_notificacoes,
+    'arquivos': limpar_arquivos,
+    'checkpoint': checkpoint_wal,
+    'estatisticas': atualizar_estatisticas,
+    'compactacao': compactar,
+}
+
+
+def _reservar_vencidas():
+    """Adia as tarefas vencidas para daqui a um intervalo e devolve as que este processo reservou."""
+    intervalos = current_app.config['MANUTENCAO_TAREFAS']
+    agora = datetime.utcnow()
+    with motor_leitura().connect() as conn:
+        proximas = dict(conn.execute(db.select(TarefaManutencao.nome, TarefaManutencao.proxima)).all())
+    vencidas = [n for n in intervalos if n in TAREFAS_MANUTENCAO and proximas.get(n, agora) <= agora]
+    if not vencidas:
+        return []
+    
+    reservadas = []
+    for nome in vencidas:
+        db.session.execute(
+            sqlite_insert(TarefaManutencao).values(nome=nome, proxima=agora).on_conflict_do_nothing()
+        )
+        if db.session.execute(
+            db.update(TarefaManutencao)
+            .where(TarefaManutencao.nome == nome, TarefaManutencao.proxima <= agora)
+            .values(proxima=agora + timedelta(seconds=intervalos[nome]))
+        ).rowcount:
+            reservadas.append(nome)
+    db.session.commit()
+    return reservadas
+
+
+def rodar_tarefa(nome, **opcoes):
+    """Roda uma tarefa de manutenção, registra o resultado e o devolve."""
+    inicio = time.perf_counter()
+    try:
+        resultado = TAREFAS_MANUTENCAO[nome](**opcoes)
+    except Exception:
+        db.session.rollback()
+        raise
+    duracao = time.perf_counter() - inicio
+    
+    agora = datetime.utcnow()
+    intervalo = current_app.config['MANUTENCAO_TAREFAS'].get(nome, 0)
+    db.session.execute(
+        sqlite_insert(TarefaManutencao)
+        .values(nome=nome, proxima=agora + timedelta(seconds=intervalo), ultima=agora, duracao=duracao,
+                resultado=json.dumps(resultado))
+        .on_conflict_do_update(index_elements=[TarefaManutencao.nome], set_={
+            'ultima': agora, 'duracao': duracao, 'resultado': json.dumps(resultado)
+        })
+    )
+    db.session.commit()
+    metricas.somar('manutencao_linhas_total', resultado.get('linhas', 0), tarefa=nome)
+    metricas.somar('manutencao_bytes_total', resultado.get('bytes', 0), tarefa=nome)
+    return resultado, duracao
+
+
+def descrever_resultado(resultado):
+    partes = [f"{resultado['linhas']} linha(s)"] if 'linhas' in resultado else []
+    partes.append(f"{resultado.get('bytes', 0) / 1024:.1f} KB")
+    partes += [f'{chave} {valor}' for chave, valor in resultado.items() if chave not in ('linhas', 'bytes')]
+    return ', '.join(partes)
+
+
+def executar_manutencao():
+    for nome in _reservar_vencidas():
+        try:
+            resultado, duracao = rodar_tarefa(nome)
+        except Exception as e:
+            print(f"Erro na manutenção ({nome}): {str(e)}")
+            continue
+        print(f"🧹 Manutenção {nome}: {descrever_resultado(resultado)} em {duracao:.2f}s")
+
+
+@bp.before_app_request
+def _iniciar_agendador():
+    if current_app.config['MANUTENCAO_AUTOMATICA']:
+        current_app.extensions['agendador'].iniciar()
+
+
+@bp.cli.command('manutencao')
+@click.argument('tarefas', nargs=-1)
+def manutencao_command(tarefas):
+    """Roda agora as tarefas de manutenção (todas, ou só as indicadas) e mostra o que cada uma recuperou."""
+    desconhecidas = set(tarefas) - TAREFAS_MANUTENCAO.keys()
+    if desconhecidas:
+        print(f"❌ Tarefa(s) desconhecida(s): {', '.join(sorted(desconhecidas))} "
+              f"(existem: {', '.join(TAREFAS_MANUTENCAO)})")
+        sys.exit(1)
+    for nome in tarefas or TAREFAS_MANUTENCAO:
+        # Pela linha de comando (ou cron, fora do horário de pico) a compactação pode fazer o VACUUM completo
+        resultado, duracao = rodar_tarefa(nome, **({'vacuum': True} if nome == 'compactacao' else {}))
+        print(f"  ✓ {nome}: {descrever_resultado(resultado)} em {duracao:.2f}s")
+    print("✅ Manutenção concluída")
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# EXPORTAÇÃO E IMPORTAÇÃO
+# ══════════════════════════════════════════════════════════════════════════════
+
+def motor_leitura():
+    # Exportar pelo motor principal seguraria o BEGIN IMMEDIATE do começo ao fim
+    return current_app.extensions.get('sqlite_leitura') or db.engine
+
+
+def reconstruir_derivados():
+    """Depois de uma importação: busca, blobs, contadores, timeline e caches."""
+    with db.engine.begin() as conn:
+        preencher_busca(conn)
+        recontar_blobs(conn)
+    recalcular_contadores()
+    if timeline_ativa():
+        reconstruir_timeline()
+    cache_respostas.invalidar('usuarios', 'stats')
+
+
+@bp.cli.command('exportar')
+@click.argument('arquivo', type=click.File('w', encoding='utf-8'))
+@click.option('--sem-senhas', is_flag=True, help='Não inclui os hashes de senha.')
+def exportar_command(arquivo, sem_senhas):
+    """Exporta usuários, posts, comentários, curtidas, convites e notificações em NDJSON."""
+    total = 0
+    with motor_leitura().connect() as conn:
+        for linha in exportar(conn, db.metadata, incluir_senhas=not sem_senhas):
+            arquivo.write(linha)
+            total += 1
+    click.echo(f"✅ {total} registros exportados", err=True)
+
+
+@bp.cli.command('importar')
+@click.argument('arquivo', type=click.File('r', encoding='utf-8'))
+@click.option('--lote', default=5000, show_default=True, help='Registros por INSERT.')
+def importar_command(arquivo, lote):
+    """Importa um arquivo de 'flask exportar' num banco vazio e reconstrói os dados derivados."""
+    inicio = time.time()
+    try:
+        with db.engine.begin() as conn:
+            totais = importar(conn, db.metadata, arquivo, lote)
+    except ImportacaoInvalida as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    reconstruir_derivados()
+    for tabela, total in totais.items():
+        print(f"  {tabela}: {total}")
+    print(f"✅ {sum(totais.values())} registros importados em {time.time() - inicio:.1f}s")
+
+
+@bp.route('/api/admin/export', methods=['GET'])
+@jwt_required()
+@admin_required
+def export_data():
+    incluir_senhas = request.args.get('senhas') == '1'
+    motor = motor_leitura()
+    
+    def linhas():
+        # Uma conexão e uma transação: o arquivo inteiro sai do mesmo retrato do banco
+        with motor.connect() as conn:
+            yield from exportar(conn, db.metadata, incluir_senhas=incluir_senhas)
+    
+    return Response(stream_with_context(linhas()), mimetype='application/x-ndjson', headers={
+        'Content-Disposition': 'attachment; filename=friendcircle.ndjson'
+    })
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# ESQUEMA E ÍNDICES
+# ══════════════════════════════════════════════════════════════════════════════
+
+@bp.cli.command('migrar')
+def migrar_command():
+    """Aplica as migrações de esquema pendentes."""
+    aplicadas = aplicar_migracoes(db.engine)
+    for versao, descricao in aplicadas:
+        print(f"  ✓ {versao:03d} {descricao}")
+    print("✅ Esquema atualizado!" if aplicadas else "✅ Nenhuma migração pendente")
+
+
+def consultas_por_rota():
+    # Mesmas consultas que as rotas executam, com valores de exemplo
+    agora = datetime.utcnow()
+    cursor = (agora, 1)
+    ids = [1, 2, 3]
+    return [
+        ('POST /api/auth/register', User.query.filter_by(email='a@a.com').statement),
+        ('POST /api/auth/register', Invite.query.filter_by(token='x', used=False).statement),
+        ('GET /api/posts', Post.query.order_by(Post.created_at.desc(), Post.id.desc()).limit(21).statement),
+        ('GET /api/posts', Post.query.filter(db.tuple_(Post.created_at, Post.id) < cursor)
+            .order_by(Post.created_at.desc(), Post.id.desc()).limit(21).statement),
+        ('GET /api/posts', User.query.filter(User.id.in_(ids)).statement),
+        ('GET /api/posts', db.select(likes.c.post_id).where(likes.c.user_id == 1, likes.c.post_id.in_(ids))),
+        ('GET /api/posts', TimelineEntry.query.filter(db.tuple_(TimelineEntry.created_at, TimelineEntry.id) < cursor)
+            .order_by(TimelineEntry.created_at.desc(), TimelineEntry.id.desc()).limit(21).statement),
+        ('GET /api/posts/user/<id>', TimelineEntry.query.filter_by(user_id=1)
+            .filter(db.tuple_(TimelineEntry.created_at, TimelineEntry.id) < cursor)
+            .order_by(TimelineEntry.created_at.desc(), TimelineEntry.id.desc()).limit(21).statement),
+        ('GET /api/posts/user/<id>', Post.query.filter_by(user_id=1).filter(db.tuple_(Post.created_at, Post.id) < cursor)
+            .order_by(Post.created_at.desc(), Post.id.desc()).limit(21).statement),
+        ('DELETE /api/posts/<id>', db.select(likes).where(likes.c.post_id == 1)),
+        ('DELETE /api/posts/<id>', Comment.query.filter_by(post_id=1).statement),
+        ('GET /api/posts/<id>/comments', Comment.query.filter_by(post_id=1)
+            .filter(db.tuple_(Comment.created_at, Comment.id) > cursor)
+            .order_by(Comment.created_at.asc(), Comment.id.asc()).limit(51).statement),
+        ('GET /api/posts?include=comments:N', db.select(Comment, db.func.row_number().over(
+            partition_by=Comment.post_id, order_by=(Comment.created_at.desc(), Comment.id.desc())
+        )).where(Comment.post_id.in_(ids))),
+        ('GET (If-None-Match)', db.select(Versao.chave, Versao.versao).where(Versao.chave.in_(['posts', 'usuarios']))),
+        ('GET /api/search', db.text(
+            "SELECT rowid, nota FROM (SELECT * FROM (SELECT rowid, bm25(busca) AS nota FROM busca "
+            f"WHERE busca MATCH '\"ana\"*' AND rowid BETWEEN {2 * FAIXA_BUSCA} AND {3 * FAIXA_BUSCA - 1} "
+            "ORDER BY rowid DESC LIMIT 10000)) "
+            "WHERE nota > -1.5 OR (nota = -1.5 AND rowid > 40) ORDER BY nota, rowid LIMIT 21"
+        )),
+        ('GET /api/users', User.query.filter_by(is_active=True).order_by(User.last_seen.desc()).statement),
+        ('GET /api/invites', Invite.query.filter_by(invited_by_id=1).order_by(Invite.created_at.desc()).statement),
+        ('POST /api/invites', User.query.filter_by(email='a@a.com').statement),
+        ('GET /api/notifications', Notification.query.filter_by(user_id=1)
+            .order_by(Notification.created_at.desc()).limit(50).statement),
+        ('GET /api/notifications', db.select(db.func.count()).select_from(Notification)
+            .where(Notification.user_id == 1, Notification.lida == False)),
+        ('POST /api/posts/<id>/like', Notification.query.filter_by(user_id=1, tipo='like', post_id=1, lida=False)
+            .order_by(Notification.id.desc()).limit(1).statement),
+        ('POST /api/posts/<id>/like', db.delete(likes).where(likes.c.user_id == 1, likes.c.post_id == 1)),
+        ('POST /api/likes/state', db.select(likes.c.post_id).where(likes.c.user_id == 1, likes.c.post_id.in_(ids))),
+        ('POST /api/notifications/read', db.update(Notification)
+            .where(Notification.user_id == 1, Notification.lida == False).values(lida=True)),
+        ('GET /api/stats', db.select(db.func.count()).select_from(User).where(User.is_active == True)),
+        ('GET /api/stats', db.select(db.func.count()).select_from(Post)),
+        ('GET /api/stats', db.select(db.func.count()).select_from(Comment)),
+        ('GET /api/stats', db.select(db.func.count()).select_from(User)
+            .where(User.created_at > agora - timedelta(days=7))),
+    ]
+
+
+# Varreduras esperadas (rota, linha do plano): qualquer outro SCAN reprova a consulta
+VARREDURAS_PERMITIDAS = [
+    # Primeira página do feed: percorre o índice já na ordem e para no LIMIT
+    ('GET /api/posts', r'SCAN posts USING INDEX ix_posts_created_at_id'),
+    # O MATCH é resolvido pelo índice do FTS5 (M no idxStr); o número varia com a versão do SQLite
+    ('GET /api/search', r'SCAN busca VIRTUAL TABLE INDEX \d+:M.*'),
+    # Totais do /api/stats: contar a tabela inteira é o pedido (pelo menor índice; a resposta fica em cache)
+    ('GET /api/stats', r'SCAN posts USING COVERING INDEX \w+'),
+    ('GET /api/stats', r'SCAN comments USING COVERING INDEX \w+'),
+]
+
+
+def consultas_sem_indice():
+    """(rota, varreduras não permitidas, plano) de cada consulta das rotas que percorre uma tabela."""
+    falhas = []
+    with db.engine.connect() as conn:
+        for rota, statement in consultas_por_rota():
+            plano = plano_de_consulta(conn, statement)
+            proibidas = [
+                linha for linha in varreduras(plano)
+                if not any(r == rota and re.fullmatch(padrao, linha) for r, padrao in VARREDURAS_PERMITIDAS)
+            ]
+            if proibidas:
+                falhas.append((rota, proibidas, plano))
+    return falhas
+
+
+@bp.cli.command('verificar-indices')
+def verificar_indices_command():
+    """Roda EXPLAIN QUERY PLAN nas consultas das rotas e falha se alguma varrer uma tabela fora das permitidas."""
+    falhas = consultas_sem_indice()
+    for rota, proibidas, plano in falhas:
+        print(f"  ✗ {rota}: {'; '.join(proibidas)}")
+        for linha in plano:
+            print(f"      {linha}")
+    print(f"  ✓ {len(consultas_por_rota()) - len(falhas)} consulta(s) com índice")
+
+    if falhas:
+        print(f"❌ {len(falhas)} consulta(s) sem índice")
+        sys.exit(1)
+    print("✅ Todas as consultas usam índices")
+
+
 # ══════════════════════════════════════════════════════════════════════════════
 # INICIALIZAÇÃO
 # ══════════════════════════════════════════════════════════════════════════════
 
-with app.app_context():
+def configurar_banco(app):
+    # Só registra eventos e cria motores: nenhuma conexão é aberta aqui
+    if db.engine.dialect.name == 'sqlite':
+        if app.config['SQLITE_ESCRITOR_UNICO']:
+            EscritorUnico().instalar(db.engine)
+        configurar_sqlite(db.engine, app.config['SQLITE_PRAGMAS'])
+        app.extensions['sqlite_leitura'] = criar_motor_leitura(
+            db.engine, app.config['SQLITE_PRAGMAS'], app.config['SQLITE_POOL_LEITURA']
+        )
+    for motor in filter(None, (db.engine, app.extensions.get('sqlite_leitura'))):
+        instrumentar_motor(
+            motor, app.config['METRICAS_CONSULTA_LENTA'], _consulta_lenta,
+            _esperou_lock if motor is db.engine else None
+        )
+
+
+def _no_contexto(app, processar):
+    # Os escritores em lote e o agendador rodam em threads próprias, fora de qualquer requisição
+    def processar_no_contexto(*args):
+        with app.app_context():
+            processar(*args)
+    return processar_no_contexto
+
+
+def create_app(config=None):
+    """Monta o app: configuração do ambiente sobreposta por `config`, extensões e rotas."""
+    app = Flask(__name__)
+    app.request_class = RequisicaoUpload
+    app.config.update(carregar_config())
+    app.config.update(config or {})
+    app.config['USE_X_SENDFILE'] = app.config['UPLOADS_SENDFILE'] == 'x-sendfile'
+    app.json = escolher_provedor(app.config['JSON_PROVEDOR'])(app)
+    CORS(app, resources={r"/api/*": {"origins": "*"}})
+    
+    for pasta in ('', 'avatars', 'posts', PASTA_TEMPORARIA):
+        os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], pasta), exist_ok=True)
+    
+    db.init_app(app)
+    jwt.init_app(app)
+    cache_respostas.init_app(app, criar_cache(app.config['CACHE_URL'], app.config['CACHE_MAX_ITENS']))
+    app.extensions.update({
+        'hub': criar_hub(app.config['EVENTOS_URL']),
+        'processador_senhas': ProcessadorSenhas(
+            app.config['SENHAS_METODO'],
+            workers=app.config['SENHAS_WORKERS'],
+            fila=app.config['SENHAS_FILA'],
+            espera=app.config['SENHAS_ESPERA']
+        ),
+        'presenca': criar_presenca(app.config['CACHE_URL'], app.config['PRESENCA_RESOLUCAO']),
+        'cache_cartoes': CacheEntidades(
+            criar_cache(app.config['CACHE_URL'], app.config['CARTOES_MAX_ITENS']),
+            'cartao', ttl=app.config['CARTOES_TTL']
+        ),
+        'processador_imagens': imagens.ProcessadorImagens(
+            workers=app.config['IMAGENS_WORKERS'],
+            qualidade=app.config['IMAGENS_QUALIDADE']
+        ),
+        'escritor_notificacoes': ProcessadorEmLote(
+            _no_contexto(app, _gravar_notificacoes),
+            intervalo=app.config['NOTIFICACOES_INTERVALO'],
+            nome='escritor-notificacoes'
+        ),
+        'escritor_presenca': ProcessadorEmLote(
+            _no_contexto(app, _gravar_presenca),
+            intervalo=app.config['PRESENCA_INTERVALO'],
+            nome='escritor-presenca'
+        ),
+        'agendador': Agendador(
+            _no_contexto(app, executar_manutencao),
+            intervalo=app.config['MANUTENCAO_VERIFICAR'],
+            nome='manutencao'
+        ),
+    })
+    app.register_blueprint(bp)
+    
+    with app.app_context():
+        configurar_banco(app)
+    return app
+
+
+def encerrar_app(app):
+    """Saída do worker: termina a manutenção e as variantes em andamento, grava o que os
+    escritores em lote ainda têm e fecha pools e conexões."""
+    for nome in ('agendador', 'processador_imagens', 'escritor_notificacoes', 'escritor_presenca', 'processador_senhas'):
+        app.extensions[nome].encerrar()
+    with app.app_context():
+        db.engine.dispose()
+        if app.extensions.get('sqlite_leitura') is not None:
+            app.extensions['sqlite_leitura'].dispose()
+
+
+def inicializar_banco():
     db.create_all()
+    return aplicar_migracoes(db.engine)
+
+
+@bp.cli.command('init-db')
+def init_db_command():
+    """Cria as tabelas e aplica as migrações pendentes (rodar antes de subir o servidor)."""
+    for versao, descricao in inicializar_banco():
+        print(f"  ✓ {versao}: {descricao}")
     print("✅ Banco de dados inicializado!")
 
+
 if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        inicializar_banco()
     print("""
 ╔═══════════════════════════════════════════════════════════════╗
 ║          FRIENDCIRCLE - BACKEND API v1.2                      ║
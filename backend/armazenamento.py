@@ -0,0 +1,95 @@
+"""
+FriendCircle - Armazenamento de uploads endereçado por conteúdo
+"""
+
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge
+import hashlib
+import os
+import tempfile
+
+PASTA_TEMPORARIA = 'tmp'
+
+
+class ArquivoEmHash:
+    """Arquivo temporário que calcula o SHA-256 e limita o tamanho enquanto recebe os bytes."""
+
+    def __init__(self, pasta, limite=None):
+        self.limite = limite
+        self.tamanho = 0
+        self._hash = hashlib.sha256()
+        self._arquivo = tempfile.NamedTemporaryFile(dir=pasta, prefix='upload-', delete=False)
+        self.caminho = self._arquivo.name
+        self._guardado = False
+
+    def write(self, dados):
+        self.tamanho += len(dados)
+        if self.limite is not None and self.tamanho > self.limite:
+            self.close()
+            raise RequestEntityTooLarge()
+        self._hash.update(dados)
+        return self._arquivo.write(dados)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def nome(self, extensao):
+        return f'{self.hexdigest()}.{extensao}'
+
+    def concluir(self, preparar=None):
+        """Fecha a cópia temporária; `preparar(caminho)` ainda pode ajustá-la antes de ela ficar visível.
+
+        O nome continua sendo o hash do que foi enviado: o mesmo envio cai no mesmo arquivo.
+        """
+        self._arquivo.flush()
+        self._arquivo.close()
+        if preparar is not None:
+            preparar(self.caminho)
+            self.tamanho = os.path.getsize(self.caminho)
+
+    def guardar(self, pasta, extensao):
+        """Move para <pasta>/<sha256>.<ext>; se o arquivo já existe, descarta a cópia. Retorna True se moveu.
+
+        Quem apaga arquivos decide pela tabela de blobs, com o lock de escrita: chame
+        depois de gravar a referência, na mesma transação, para que a conferência
+        aqui e a exclusão lá não se cruzem (se a limpeza apagou antes, a cópia entra no lugar).
+        """
+        destino = os.path.join(pasta, self.nome(extensao))
+        novo = not os.path.exists(destino)
+        if novo:
+            os.replace(self.caminho, destino)
+        else:
+            os.unlink(self.caminho)
+        self._guardado = True
+        return novo
+
+    def close(self):
+        if not self._arquivo.closed:
+            self._arquivo.close()
+        if not self._guardado and os.path.exists(self.caminho):
+            os.unlink(self.caminho)
+
+    def __getattr__(self, nome):
+        return getattr(self._arquivo, nome)
+
+
+class RequisicaoUpload(Request):
+    """Grava cada arquivo do multipart direto em disco, já calculando o hash."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        from flask import current_app
+
+        pasta = os.path.join(current_app.config['UPLOAD_FOLDER'], PASTA_TEMPORARIA)
+        return ArquivoEmHash(pasta, current_app.config.get('UPLOAD_MAX_BYTES'))
+
+
+def receber_upload(arquivo, pasta, preparar=None):
+    """ArquivoEmHash concluído (hash e tamanho prontos) de um FileStorage destinado a `pasta`."""
+    stream = arquivo.stream
+    if not isinstance(stream, ArquivoEmHash):
+        # Fora do parser multipart (ex.: FileStorage montado à mão): copia em blocos
+        stream = ArquivoEmHash(os.path.join(os.path.dirname(pasta), PASTA_TEMPORARIA))
+        for bloco in iter(lambda: arquivo.stream.read(64 * 1024), b''):
+            stream.write(bloco)
+    stream.concluir(preparar)
+    return stream
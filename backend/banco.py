@@ -0,0 +1,311 @@
+"""
+FriendCircle - Infraestrutura do banco de dados (motor SQLite, migrações e planos de consulta)
+"""
+
+from datetime import datetime
+from sqlalchemy import create_engine, event
+import re
+import threading
+import time
+
+# ══════════════════════════════════════════════════════════════════════════════
+# MOTOR SQLITE
+# ══════════════════════════════════════════════════════════════════════════════
+# O pysqlite abre transações sozinho e só pede o lock de escrita no primeiro
+# INSERT/UPDATE, quando já não dá para esperar pelo busy_timeout. Aqui o
+# SQLAlchemy controla o BEGIN: o motor de escrita usa BEGIN IMMEDIATE e o de
+# leitura abre o arquivo em modo somente leitura.
+
+PRAGMAS_SO_ESCRITA = ('journal_mode', 'auto_vacuum')
+MODOS_AUTO_VACUUM = {'NONE': 0, 'FULL': 1, 'INCREMENTAL': 2}
+
+
+def configurar_sqlite(engine, pragmas, somente_leitura=False):
+    @event.listens_for(engine, 'connect')
+    def _aplicar_pragmas(dbapi_conn, _registro):
+        dbapi_conn.isolation_level = None
+        cursor = dbapi_conn.cursor()
+        # busy_timeout primeiro: os pragmas que tocam no arquivo (journal_mode num banco
+        # novo) esperam pelo lock em vez de falhar na hora com "database is locked"
+        for nome, valor in sorted(pragmas.items(), key=lambda p: p[0] != 'busy_timeout'):
+            if somente_leitura and nome in PRAGMAS_SO_ESCRITA:
+                continue
+            if nome == 'auto_vacuum':
+                # Gravar auto_vacuum abre uma transação de escrita mesmo sem mudar nada: em
+                # toda conexão nova isso disputaria o lock fora do EscritorUnico (e, no gevent,
+                # a espera do busy_timeout trava o worker inteiro)
+                atual = cursor.execute('PRAGMA auto_vacuum').fetchone()[0]
+                if atual == MODOS_AUTO_VACUUM.get(str(valor).upper(), valor):
+                    continue
+            cursor.execute(f'PRAGMA {nome}={valor}')
+        if somente_leitura:
+            cursor.execute('PRAGMA query_only=ON')
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def _begin(conn):
+        conn.exec_driver_sql('BEGIN' if somente_leitura else 'BEGIN IMMEDIATE')
+
+
+def criar_motor_leitura(engine_escrita, pragmas, pool_size=10):
+    caminho = engine_escrita.url.database
+    if not caminho or caminho == ':memory:':
+        return None
+    engine = create_engine(
+        f'sqlite:///file:{caminho}?mode=ro&uri=true',
+        pool_size=pool_size,
+        max_overflow=pool_size
+    )
+    configurar_sqlite(engine, pragmas, somente_leitura=True)
+    return engine
+
+
+class EscritorUnico:
+    """Fila de escrita do processo: uma transação de escrita por vez."""
+
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+
+    def instalar(self, engine):
+        # Registrado antes de configurar_sqlite para entrar na fila antes do BEGIN
+        event.listen(engine, 'begin', self._entrar)
+        event.listen(engine, 'commit', self._sair)
+        event.listen(engine, 'rollback', self._sair)
+
+    def _entrar(self, conn):
+        # Sem vaga dentro do timeout, segue e deixa o busy_timeout decidir
+        inicio = time.perf_counter()
+        conn.info['escritor_unico'] = self._lock.acquire(timeout=self.timeout)
+        conn.info['espera_fila'] = time.perf_counter() - inicio
+
+    def _sair(self, conn):
+        if conn.info.pop('escritor_unico', False):
+            self._lock.release()
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# MIGRAÇÕES
+# ══════════════════════════════════════════════════════════════════════════════
+# Cada migração roda uma única vez, em ordem, dentro da sua própria transação,
+# e fica registrada em schema_version. Todas são idempotentes: um banco novo
+# criado por create_all() já nasce no esquema atual e só marca as versões.
+
+MIGRACOES = []
+
+
+def migracao(versao, descricao):
+    def registrar(funcao):
+        MIGRACOES.append((versao, descricao, funcao))
+        MIGRACOES.sort(key=lambda m: m[0])
+        return funcao
+    return registrar
+
+
+def _colunas(conn, tabela):
+    return {row[1] for row in conn.exec_driver_sql(f'PRAGMA table_info({tabela})')}
+
+
+def _adicionar_coluna(conn, tabela, coluna, definicao):
+    if coluna not in _colunas(conn, tabela):
+        conn.exec_driver_sql(f'ALTER TABLE {tabela} ADD COLUMN {coluna} {definicao}')
+        return True
+    return False
+
+
+@migracao(1, 'contadores de posts e usuários')
+def _m001_contadores(conn):
+    novas = [
+        _adicionar_coluna(conn, 'users', 'total_posts', 'INTEGER NOT NULL DEFAULT 0'),
+        _adicionar_coluna(conn, 'users', 'total_likes', 'INTEGER NOT NULL DEFAULT 0'),
+        _adicionar_coluna(conn, 'posts', 'likes_count', 'INTEGER NOT NULL DEFAULT 0'),
+        _adicionar_coluna(conn, 'posts', 'comments_count', 'INTEGER NOT NULL DEFAULT 0'),
+    ]
+    if any(novas):
+        conn.exec_driver_sql("""
+            UPDATE posts SET
+                likes_count = (SELECT COUNT(*) FROM likes WHERE likes.post_id = posts.id),
+                comments_count = (SELECT COUNT(*) FROM comments WHERE comments.post_id = posts.id)
+        """)
+        conn.exec_driver_sql("""
+            UPDATE users SET
+                total_posts = (SELECT COUNT(*) FROM posts WHERE posts.user_id = users.id),
+                total_likes = (SELECT COALESCE(SUM(likes_count), 0) FROM posts WHERE posts.user_id = users.id)
+        """)
+
+
+@migracao(2, 'índices das consultas do feed, comentários, notificações e convites')
+def _m002_indices(conn):
+    for sql in (
+        'CREATE INDEX IF NOT EXISTS ix_posts_created_at_id ON posts (created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_posts_user_id_created_at ON posts (user_id, created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_likes_post_id ON likes (post_id)',
+        'CREATE INDEX IF NOT EXISTS ix_comments_post_id_created_at ON comments (post_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS ix_notifications_user_id_lida_created_at ON notifications (user_id, lida, created_at)',
+        'CREATE INDEX IF NOT EXISTS ix_invites_invited_by_id_created_at ON invites (invited_by_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS ix_users_last_seen ON users (last_seen)',
+        'CREATE INDEX IF NOT EXISTS ix_users_created_at ON users (created_at)',
+        'CREATE INDEX IF NOT EXISTS ix_users_is_active_last_seen ON users (is_active, last_seen)',
+    ):
+        conn.exec_driver_sql(sql)
+
+
+@migracao(3, 'timeline materializada')
+def _m003_timeline(conn):
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS timeline (
+            id INTEGER NOT NULL PRIMARY KEY REFERENCES posts (id),
+            user_id INTEGER NOT NULL,
+            created_at DATETIME NOT NULL,
+            payload TEXT NOT NULL,
+            likes_count INTEGER NOT NULL,
+            comments_count INTEGER NOT NULL
+        )
+    """)
+    conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_timeline_created_at_id ON timeline (created_at, id)')
+    conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_timeline_user_id_created_at ON timeline (user_id, created_at, id)')
+
+
+@migracao(4, 'agrupamento de notificações')
+def _m004_notificacoes_agrupadas(conn):
+    _adicionar_coluna(conn, 'notifications', 'post_id', 'INTEGER')
+    _adicionar_coluna(conn, 'notifications', 'total_atores', 'INTEGER NOT NULL DEFAULT 1')
+    _adicionar_coluna(conn, 'notifications', 'atores_recentes', "TEXT NOT NULL DEFAULT '[]'")
+    conn.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_notifications_agrupamento ON notifications (user_id, tipo, post_id, lida)'
+    )
+
+
+@migracao(5, 'contagem de referências dos arquivos enviados')
+def _m005_blobs(conn):
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS blobs (
+            nome VARCHAR(256) NOT NULL PRIMARY KEY,
+            refs INTEGER NOT NULL,
+            tamanho INTEGER,
+            atualizado_em DATETIME NOT NULL
+        )
+    """)
+    conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_blobs_refs_atualizado_em ON blobs (refs, atualizado_em)')
+    # Arquivos antigos ({user_id}_{uuid}.{ext}) entram com as referências atuais
+    agora = datetime.utcnow().isoformat(' ')
+    conn.exec_driver_sql("""
+        INSERT OR IGNORE INTO blobs (nome, refs, atualizado_em)
+        SELECT 'posts/' || imagem, COUNT(*), ? FROM posts WHERE imagem != '' GROUP BY imagem
+    """, (agora,))
+    conn.exec_driver_sql("""
+        INSERT OR IGNORE INTO blobs (nome, refs, atualizado_em)
+        SELECT 'avatars/' || avatar, COUNT(*), ? FROM users WHERE avatar != '' GROUP BY avatar
+    """, (agora,))
+
+
+@migracao(6, 'versões dos recursos para GET condicional')
+def _m006_versoes(conn):
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS versoes (
+            chave VARCHAR(64) NOT NULL PRIMARY KEY,
+            versao INTEGER NOT NULL
+        )
+    """)
+
+
+# Busca: rowid = tipo * FAIXA_BUSCA + id (0 post, 1 comentário, 2 usuário), para
+# remover/atualizar um documento sem tabela de ligação. Cada tipo ocupa uma
+# faixa contínua: o FTS5 filtra o tipo pelo rowid sem percorrer os outros
+FAIXA_BUSCA = 1 << 40
+
+
+def preencher_busca(conn):
+    conn.exec_driver_sql('DELETE FROM busca')
+    conn.exec_driver_sql('INSERT INTO busca (rowid, texto) SELECT id, texto FROM posts')
+    conn.exec_driver_sql(f'INSERT INTO busca (rowid, texto) SELECT {FAIXA_BUSCA} + id, texto FROM comments')
+    conn.exec_driver_sql(
+        f"INSERT INTO busca (rowid, texto) SELECT {2 * FAIXA_BUSCA} + id, nome || ' ' || COALESCE(bio, '') FROM users"
+    )
+    conn.exec_driver_sql("INSERT INTO busca (busca) VALUES ('optimize')")
+
+
+def recontar_blobs(conn):
+    """Refaz as referências dos blobs a partir de posts e avatares (ex.: depois de uma importação)."""
+    agora = datetime.utcnow().isoformat(' ')
+    conn.exec_driver_sql('UPDATE blobs SET refs = 0')
+    for pasta, tabela, coluna in (('posts', 'posts', 'imagem'), ('avatars', 'users', 'avatar')):
+        conn.exec_driver_sql(f"""
+            INSERT INTO blobs (nome, refs, atualizado_em)
+            SELECT '{pasta}/' || {coluna}, COUNT(*), ? FROM {tabela} WHERE {coluna} != '' GROUP BY {coluna}
+            ON CONFLICT (nome) DO UPDATE SET refs = excluded.refs, atualizado_em = excluded.atualizado_em
+        """, (agora,))
+
+
+@migracao(7, 'índice de busca textual (FTS5)')
+def _m007_busca(conn):
+    # remove_diacritics: 'acao' encontra 'ação'; prefix: índices para buscas por prefixo de 2 e 3 letras
+    conn.exec_driver_sql("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS busca USING fts5(
+            texto,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    """)
+    preencher_busca(conn)
+
+
+@migracao(8, 'agenda das tarefas de manutenção')
+def _m008_manutencao(conn):
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS manutencao (
+            nome VARCHAR(64) NOT NULL PRIMARY KEY,
+            proxima DATETIME NOT NULL,
+            ultima DATETIME,
+            duracao FLOAT,
+            resultado TEXT NOT NULL
+        )
+    """)
+
+
+def versao_atual(conn):
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            versao INTEGER PRIMARY KEY,
+            descricao VARCHAR(200) NOT NULL,
+            aplicada_em DATETIME NOT NULL
+        )
+    """)
+    return conn.exec_driver_sql('SELECT COALESCE(MAX(versao), 0) FROM schema_version').scalar()
+
+
+def aplicar_migracoes(engine):
+    with engine.begin() as conn:
+        atual = versao_atual(conn)
+
+    aplicadas = []
+    for versao, descricao, funcao in MIGRACOES:
+        if versao <= atual:
+            continue
+        with engine.begin() as conn:
+            funcao(conn)
+            conn.exec_driver_sql(
+                'INSERT INTO schema_version (versao, descricao, aplicada_em) VALUES (?, ?, ?)',
+                (versao, descricao, datetime.utcnow().isoformat(' '))
+            )
+        aplicadas.append((versao, descricao))
+    return aplicadas
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# PLANOS DE CONSULTA
+# ══════════════════════════════════════════════════════════════════════════════
+
+# Todo SCAN de tabela, com ou sem índice (USING [COVERING] INDEX só muda a ordem de
+# leitura, não quantas linhas são lidas). "SCAN (subquery-N)" lê um resultado já limitado
+_VARREDURA = re.compile(r'^SCAN \w+')
+
+
+def plano_de_consulta(conn, statement):
+    sql = str(statement.compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True}))
+    return [row[3] for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + sql)]
+
+
+def varreduras(plano):
+    """Linhas do plano que percorrem uma tabela em vez de buscar por índice (SEARCH)."""
+    return [linha for linha in plano if _VARREDURA.match(linha)]
@@ -0,0 +1,109 @@
+"""
+FriendCircle - Latência da busca textual com muitos posts
+
+Gera N posts com frases aleatórias em português direto no banco, monta o
+índice FTS5 e mede GET /api/search para buscas comuns, raras, por prefixo,
+com acento e paginadas. O vocabulário tem só 50 palavras, então cada uma
+aparece em boa parte dos posts: é o pior caso para o ranking.
+
+Uso (dentro de backend/):
+    python bench/busca.py --posts 1000000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PALAVRAS = (
+    'praia sol café almoço família amigos viagem São Paulo festa aniversário '
+    'ação cachorro gato foto música show cinema livro trabalho férias '
+    'montanha chuva domingo churrasco futebol jogo vitória saudade casa '
+    'jardim flores bolo pão queijo cerveja vinho noite lua estrelas mar'
+).split()
+
+
+def frases(quantidade, semente=42):
+    rnd = random.Random(semente)
+    for _ in range(quantidade):
+        yield ' '.join(rnd.choices(PALAVRAS, k=rnd.randint(4, 14)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--posts', type=int, default=1_000_000)
+    parser.add_argument('--repeticoes', type=int, default=50)
+    args = parser.parse_args()
+
+    pasta = tempfile.mkdtemp(prefix='friendcircle-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(pasta, 'busca.db')}"
+    os.environ['UPLOAD_FOLDER'] = os.path.join(pasta, 'uploads')
+
+    from app import create_app, db, inicializar_banco
+    from banco import preencher_busca
+
+    app = create_app()
+    with app.app_context():
+        inicializar_banco()
+
+    client = app.test_client()
+    token = client.post('/api/auth/register', json={
+        'email': 'ana@teste.com', 'password': '123456', 'nome': 'Ana'
+    }).get_json()['token']
+    headers = {'Authorization': f'Bearer {token}'}
+
+    inicio = time.time()
+    base = datetime(2024, 1, 1)
+    with app.app_context(), db.engine.begin() as conn:
+        lote = []
+        for i, texto in enumerate(frases(args.posts)):
+            lote.append((1, texto, '', base + timedelta(seconds=i), base + timedelta(seconds=i)))
+            if len(lote) == 50_000:
+                conn.exec_driver_sql(
+                    'INSERT INTO posts (user_id, texto, imagem, created_at, updated_at) VALUES (?, ?, ?, ?, ?)', lote
+                )
+                lote = []
+        if lote:
+            conn.exec_driver_sql(
+                'INSERT INTO posts (user_id, texto, imagem, created_at, updated_at) VALUES (?, ?, ?, ?, ?)', lote
+            )
+    print(f"{args.posts} posts inseridos em {time.time() - inicio:.1f}s")
+
+    inicio = time.time()
+    with app.app_context(), db.engine.begin() as conn:
+        preencher_busca(conn)
+    print(f"Índice montado em {time.time() - inicio:.1f}s "
+          f"(banco com {os.path.getsize(os.path.join(pasta, 'busca.db')) / 1024 / 1024:.0f} MB)")
+
+    consultas = [
+        ('comum', {'q': 'praia'}),
+        ('duas palavras', {'q': 'praia churrasco'}),
+        ('prefixo', {'q': 'churr'}),
+        ('sem acento', {'q': 'acao cafe'}),
+        ('rara', {'q': 'estrelas vinho queijo lua'}),
+        ('sem resultado', {'q': 'xilofone'}),
+    ]
+    for nome, params in consultas:
+        tempos = []
+        for _ in range(args.repeticoes):
+            t = time.perf_counter()
+            resposta = client.get('/api/search', query_string=params, headers=headers)
+            tempos.append((time.perf_counter() - t) * 1000)
+        dados = resposta.get_json()
+        tempos.sort()
+        print(f"  {nome:<14} p50 {tempos[len(tempos) // 2]:7.1f} ms  p99 {tempos[int(len(tempos) * 0.99)]:7.1f} ms  "
+              f"({len(dados['results'])} resultados{', com próxima página' if dados['next_cursor'] else ''})")
+
+    cursor = client.get('/api/search', query_string={'q': 'praia'}, headers=headers).get_json()['next_cursor']
+    t = time.perf_counter()
+    client.get('/api/search', query_string={'q': 'praia', 'cursor': cursor}, headers=headers)
+    print(f"  segunda página {(time.perf_counter() - t) * 1000:7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
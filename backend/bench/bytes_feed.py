@@ -0,0 +1,97 @@
+"""
+FriendCircle - Bytes servidos por página do feed (originais x variantes)
+
+Publica posts com fotos grandes de celular (com EXIF), espera o pipeline de
+imagens gerar as variantes e compara quantos bytes um cliente baixa para
+exibir uma página do feed: os arquivos originais de post e avatar contra as
+variantes "feed" do post e "thumb" do avatar.
+
+Uso (dentro de backend/, precisa de Pillow):
+    python bench/bytes_feed.py --posts 20
+"""
+
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def foto_de_celular(largura, altura, semente):
+    from PIL import Image
+
+    rnd = random.Random(semente)
+    # Ruído em blocos: comprime como uma foto real, não como uma cor sólida
+    pequena = Image.frombytes('RGB', (largura // 8, altura // 8), rnd.randbytes(largura // 8 * altura // 8 * 3))
+    imagem = pequena.resize((largura, altura), Image.BICUBIC)
+    exif = Image.Exif()
+    exif[0x010F] = 'FriendPhone'
+    exif[0x0112] = 1
+    saida = io.BytesIO()
+    imagem.save(saida, 'JPEG', quality=92, exif=exif)
+    return saida.getvalue()
+
+
+def tamanho(client, url):
+    resposta = client.get(url)
+    if resposta.status_code != 200:
+        raise RuntimeError(f'{url}: {resposta.status_code}')
+    return len(resposta.get_data())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--posts', type=int, default=20)
+    parser.add_argument('--largura', type=int, default=4032)
+    parser.add_argument('--altura', type=int, default=3024)
+    args = parser.parse_args()
+
+    pasta = tempfile.mkdtemp(prefix='friendcircle-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(pasta, 'bytes.db')}"
+    os.environ['UPLOAD_FOLDER'] = os.path.join(pasta, 'uploads')
+
+    from app import create_app, inicializar_banco
+
+    app = create_app()
+    with app.app_context():
+        inicializar_banco()
+    processador_imagens = app.extensions['processador_imagens']
+
+    client = app.test_client()
+    token = client.post('/api/auth/register', json={
+        'email': 'ana@teste.com', 'password': '123456', 'nome': 'Ana'
+    }).get_json()['token']
+    headers = {'Authorization': f'Bearer {token}'}
+
+    client.post('/api/profile/avatar', headers=headers, data={
+        'avatar': (io.BytesIO(foto_de_celular(args.largura, args.altura, 0)), 'avatar.jpg')
+    })
+    for i in range(args.posts):
+        client.post('/api/posts', headers=headers, data={
+            'texto': f'Foto {i}',
+            'imagem': (io.BytesIO(foto_de_celular(args.largura, args.altura, i + 1)), f'foto{i}.jpg')
+        })
+
+    inicio = time.time()
+    processador_imagens._executor().shutdown(wait=True)
+    print(f"Variantes geradas em {time.time() - inicio:.1f}s")
+
+    posts = client.get(f'/api/posts?per_page={args.posts}', headers=headers).get_json()['posts']
+    antes = depois = 0
+    for post in posts:
+        antes += tamanho(client, f"/uploads/posts/{post['imagem']}")
+        antes += tamanho(client, f"/uploads/avatars/{post['autor']['avatar']}")
+        depois += tamanho(client, post['imagem_variantes']['feed'])
+        depois += tamanho(client, post['autor']['avatar_variantes']['thumb'])
+
+    print(f"Página com {len(posts)} posts:")
+    print(f"  originais: {antes / 1024 / 1024:.1f} MB")
+    print(f"  variantes: {depois / 1024 / 1024:.2f} MB ({depois / antes:.1%} dos originais)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,489 @@
+"""
+FriendCircle - Teste de carga reproduzível de todas as rotas
+
+Gera uma comunidade sintética (bench/comunidade.py), importa num banco
+temporário e dispara um plano fixo de requisições, sorteado pela --semente,
+cobrindo todas as rotas da API. Para cada rota mede p50/p95/p99, vazão, erros
+e, no modo cliente, quantas consultas SQL cada requisição faz.
+
+Modos:
+    cliente   - Flask test client no próprio processo, uma requisição por vez
+                (latência sem rede e contagem de consultas)
+    servidor  - gunicorn com vários workers e --clientes threads em paralelo
+                (precisa de gunicorn e, no worker padrão, gevent)
+
+O stream SSE (/api/notifications/stream) fica de fora: é uma conexão longa,
+medida por bench/sse_conexoes.py.
+
+Uso (dentro de backend/):
+    python bench/carga.py --usuarios 500 --saida antes.json
+    python bench/carga.py --usuarios 500 --saida depois.json --comparar antes.json
+    python bench/carga.py --comparar antes.json depois.json
+"""
+
+from collections import deque
+from datetime import datetime
+import argparse
+import http.client
+import io
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+from comunidade import gerar  # noqa: E402
+
+SENHA = '123456'
+ROTAS_FORA = {'stream_notifications': 'conexão longa, ver bench/sse_conexoes.py', 'static': 'arquivos do Flask'}
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# CENÁRIOS
+# ══════════════════════════════════════════════════════════════════════════════
+
+class Pedido:
+    def __init__(self, metodo, caminho, token=None, json=None, arquivo=None, query=None):
+        self.metodo = metodo
+        self.caminho = caminho
+        self.token = token
+        self.json = json
+        self.arquivo = arquivo
+        self.query = query
+
+
+class Comunidade:
+    """O que os cenários sabem do banco: ids, tokens e recursos de uso único."""
+
+    def __init__(self, usuarios, posts, tokens, convites, descartaveis, avatar):
+        self.usuarios = usuarios
+        self.posts = posts
+        self.tokens = tokens
+        self.convites = deque(convites)
+        self.descartaveis = deque(descartaveis)
+        self.avatar = avatar
+        self.sequencia = itertools.count(1)
+
+
+def _imagem(rnd):
+    from PIL import Image
+    saida = io.BytesIO()
+    Image.new('RGB', (96, 96), tuple(rnd.randrange(256) for _ in range(3))).save(saida, 'PNG')
+    return saida.getvalue()
+
+
+def _registrar(c, rnd):
+    if not c.convites:
+        return None
+    email, token = c.convites.popleft()
+    return Pedido('POST', '/api/auth/register', json={'email': email, 'password': SENHA, 'nome': 'Novo membro', 'token_convite': token})
+
+
+def _deletar(c, rnd):
+    if not c.descartaveis:
+        return None
+    post_id, autor = c.descartaveis.popleft()
+    return Pedido('DELETE', f'/api/posts/{post_id}', c.tokens[autor])
+
+
+def _buscar(c, rnd):
+    return Pedido('GET', '/api/search', c.tokens[rnd.choice(c.usuarios)], query={'q': rnd.choice(['praia', 'churr', 'cafe festa', 'vinho lua'])})
+
+
+# endpoint -> (peso no plano, função que monta o pedido)
+CENARIOS = {
+    'health_check': (1, lambda c, r: Pedido('GET', '/api/health')),
+    'register': (1, _registrar),
+    'login': (2, lambda c, r: Pedido('POST', '/api/auth/login', json={'email': f'membro{r.choice(c.usuarios)}@teste.com', 'password': SENHA})),
+    'get_me': (4, lambda c, r: Pedido('GET', '/api/auth/me', c.tokens[r.choice(c.usuarios)])),
+    'check_invite': (1, lambda c, r: Pedido('GET', '/api/auth/check-invite/bench-fixo')),
+    'update_profile': (1, lambda c, r: Pedido('PUT', '/api/profile', c.tokens[r.choice(c.usuarios)], json={'bio': f'bio {next(c.sequencia)}'})),
+    'upload_avatar': (1, lambda c, r: Pedido('POST', '/api/profile/avatar', c.tokens[r.choice(c.usuarios)], arquivo=('avatar', 'avatar.png', _imagem(r)))),
+    'list_users': (2, lambda c, r: Pedido('GET', '/api/users', c.tokens[r.choice(c.usuarios)])),
+    'get_user': (3, lambda c, r: Pedido('GET', f'/api/users/{r.choice(c.usuarios)}', c.tokens[r.choice(c.usuarios)])),
+    'list_posts': (10, lambda c, r: Pedido('GET', '/api/posts', c.tokens[r.choice(c.usuarios)])),
+    'create_post': (2, lambda c, r: Pedido('POST', '/api/posts', c.tokens[r.choice(c.usuarios)], json={'texto': f'Post de carga {next(c.sequencia)}'})),
+    'get_post': (4, lambda c, r: Pedido('GET', f'/api/posts/{r.choice(c.posts)}', c.tokens[r.choice(c.usuarios)])),
+    'delete_post': (1, _deletar),
+    'like_post': (4, lambda c, r: Pedido('POST', f'/api/posts/{r.choice(c.posts)}/like', c.tokens[r.choice(c.usuarios)])),
+    'likes_state': (3, lambda c, r: Pedido('POST', '/api/likes/state', c.tokens[r.choice(c.usuarios)], json={'post_ids': r.sample(c.posts, min(20, len(c.posts)))})),
+    'list_user_posts': (3, lambda c, r: Pedido('GET', f'/api/posts/user/{r.choice(c.usuarios)}', c.tokens[r.choice(c.usuarios)])),
+    'list_comments': (4, lambda c, r: Pedido('GET', f'/api/posts/{r.choice(c.posts)}/comments', c.tokens[r.choice(c.usuarios)])),
+    'create_comment': (2, lambda c, r: Pedido('POST', f'/api/posts/{r.choice(c.posts)}/comments', c.tokens[r.choice(c.usuarios)], json={'texto': 'Que legal!'})),
+    'search': (3, _buscar),
+    'list_invites': (1, lambda c, r: Pedido('GET', '/api/invites', c.tokens[r.choice(c.usuarios)])),
+    'create_invite': (1, lambda c, r: Pedido('POST', '/api/invites', c.tokens[r.choice(c.usuarios)], json={'email': f'convidado{uuid.uuid4().hex[:12]}@teste.com'})),
+    'list_notifications': (4, lambda c, r: Pedido('GET', '/api/notifications', c.tokens[r.choice(c.usuarios)])),
+    'mark_notifications_read': (1, lambda c, r: Pedido('POST', '/api/notifications/read', c.tokens[r.choice(c.usuarios)])),
+    'serve_upload': (3, lambda c, r: Pedido('GET', f'/uploads/avatars/{c.avatar}')),
+    'get_stats': (2, lambda c, r: Pedido('GET', '/api/stats', c.tokens[r.choice(c.usuarios)])),
+    'cache_stats': (1, lambda c, r: Pedido('GET', '/api/admin/cache', c.tokens[1])),
+    'metrics': (1, lambda c, r: Pedido('GET', '/api/admin/metrics', c.tokens[1])),
+    'maintenance_status': (1, lambda c, r: Pedido('GET', '/api/admin/maintenance', c.tokens[1])),
+    'export_data': (1, lambda c, r: Pedido('GET', '/api/admin/export', c.tokens[1])),
+}
+
+
+def montar_plano(repeticoes, semente):
+    plano = [nome for nome, (peso, _) in CENARIOS.items() for _ in range(peso * repeticoes)]
+    random.Random(semente).shuffle(plano)
+    return plano
+
+
+def conferir_cobertura(app):
+    rotas = {regra.endpoint.rsplit('.', 1)[-1] for regra in app.url_map.iter_rules()}
+    for endpoint in sorted(rotas - set(CENARIOS) - set(ROTAS_FORA)):
+        print(f"⚠️  Rota sem cenário: {endpoint}")
+    for endpoint in sorted(set(CENARIOS) - rotas):
+        print(f"⚠️  Cenário para rota inexistente: {endpoint}")
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# PREPARAÇÃO DO BANCO
+# ══════════════════════════════════════════════════════════════════════════════
+
+def preparar(pasta, usuarios, semente, reservas):
+    """Importa a comunidade sintética e devolve (app, Comunidade)."""
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(pasta, 'carga.db')}"
+    os.environ['UPLOAD_FOLDER'] = os.path.join(pasta, 'uploads')
+    # Manutenção no meio da medição mudaria o resultado de uma rodada para outra
+    os.environ['MANUTENCAO_AUTOMATICA'] = '0'
+
+    from app import create_app, db, inicializar_banco, reconstruir_derivados, consultas_sem_indice, Invite
+    from flask_jwt_extended import create_access_token
+    from portabilidade import importar
+
+    inicio = time.time()
+    app = create_app()
+    password_hash = app.extensions['processador_senhas'].gerar(SENHA)
+    posts, ultimo_post = [], 0
+    linhas = []
+    for registro in gerar(usuarios, semente, password_hash=password_hash):
+        if registro['tabela'] == 'posts':
+            ultimo_post = registro['dados']['id']
+            posts.append(ultimo_post)
+        linhas.append(json.dumps(registro))
+
+    # Posts extras só para o cenário de exclusão, fora da lista que os outros cenários sorteiam
+    rnd = random.Random(semente)
+    descartaveis = []
+    for post_id in range(ultimo_post + 1, ultimo_post + 1 + reservas):
+        autor = rnd.randint(1, usuarios)
+        descartaveis.append((post_id, autor))
+        linhas.append(json.dumps({'tabela': 'posts', 'dados': {
+            'id': post_id, 'user_id': autor, 'texto': 'Post descartável',
+            'created_at': '2024-12-31T12:00:00', 'updated_at': '2024-12-31T12:00:00'
+        }}))
+
+    with app.app_context():
+        inicializar_banco()
+        with db.engine.begin() as conn:
+            totais = importar(conn, db.metadata, linhas)
+        reconstruir_derivados()
+        # Com o banco já populado: um índice que falta invalida a medição inteira
+        falhas = consultas_sem_indice()
+        for rota, proibidas, _ in falhas:
+            print(f"❌ {rota}: {'; '.join(proibidas)}")
+        if falhas:
+            sys.exit("❌ Consulta sem índice (flask --app app verificar-indices mostra o plano)")
+
+        convites = [(f'novo{i}@teste.com', f'bench-{i}') for i in range(reservas)]
+        for email, token in convites + [('fixo@teste.com', 'bench-fixo')]:
+            db.session.add(Invite(email=email, token=token, invited_by_id=1, expires_at=datetime(2100, 1, 1)))
+        db.session.commit()
+        tokens = {i: create_access_token(identity=str(i)) for i in range(1, usuarios + 1)}
+
+    avatar = app.test_client().post(
+        '/api/profile/avatar', headers={'Authorization': f'Bearer {tokens[1]}'},
+        data={'avatar': (io.BytesIO(_imagem(rnd)), 'avatar.png')}
+    ).get_json()['avatar']
+
+    print(f"📦 {', '.join(f'{total} {tabela}' for tabela, total in totais.items())} em {time.time() - inicio:.1f}s")
+    return app, Comunidade(list(range(1, usuarios + 1)), posts, tokens, convites, descartaveis, avatar)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# EXECUÇÃO
+# ══════════════════════════════════════════════════════════════════════════════
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def resumir(medidas, duracao):
+    """medidas: endpoint -> lista de (ms, status, consultas ou None)."""
+    resumo = {}
+    for endpoint, lista in sorted(medidas.items()):
+        tempos = [ms for ms, _, _ in lista]
+        consultas = [q for _, _, q in lista if q is not None]
+        resumo[endpoint] = {
+            'n': len(lista),
+            'erros': sum(1 for _, status, _ in lista if status >= 400),
+            'p50': round(percentil(tempos, 0.50), 2),
+            'p95': round(percentil(tempos, 0.95), 2),
+            'p99': round(percentil(tempos, 0.99), 2),
+            'rps': round(len(lista) / duracao, 1),
+            'consultas': round(sum(consultas) / len(consultas), 1) if consultas else None,
+        }
+    return resumo
+
+
+def rodar_cliente(app, comunidade, plano, semente):
+    from sqlalchemy import event
+    from app import db
+
+    contador = [0]
+    principal = threading.get_ident()
+
+    def contar(*args):
+        # Só as consultas da requisição: os escritores em lote gravam em outras threads
+        if threading.get_ident() == principal:
+            contador[0] += 1
+
+    # Conta nos dois motores: escritas no principal, GETs no pool somente leitura
+    with app.app_context():
+        motores = [db.engine, app.extensions.get('sqlite_leitura')]
+    for motor in filter(None, motores):
+        event.listen(motor, 'before_cursor_execute', contar)
+
+    client = app.test_client()
+    rnd = random.Random(semente)
+    medidas = {}
+    inicio = time.perf_counter()
+    for endpoint in plano:
+        pedido = CENARIOS[endpoint][1](comunidade, rnd)
+        if pedido is None:
+            continue
+        headers = {'Authorization': f'Bearer {pedido.token}'} if pedido.token else {}
+        data = None
+        if pedido.arquivo:
+            campo, nome, conteudo = pedido.arquivo
+            data = {campo: (io.BytesIO(conteudo), nome)}
+        contador[0] = 0
+        t = time.perf_counter()
+        resposta = client.open(pedido.caminho, method=pedido.metodo, headers=headers,
+                               json=pedido.json, data=data, query_string=pedido.query)
+        resposta.get_data()
+        medidas.setdefault(endpoint, []).append(((time.perf_counter() - t) * 1000, resposta.status_code, contador[0]))
+    duracao = time.perf_counter() - inicio
+
+    for motor in filter(None, motores):
+        event.remove(motor, 'before_cursor_execute', contar)
+    return resumir(medidas, duracao)
+
+
+def _corpo(pedido):
+    if pedido.arquivo:
+        campo, nome, conteudo = pedido.arquivo
+        fronteira = uuid.uuid4().hex
+        corpo = (f'--{fronteira}\r\nContent-Disposition: form-data; name="{campo}"; filename="{nome}"\r\n'
+                 f'Content-Type: application/octet-stream\r\n\r\n').encode() + conteudo + f'\r\n--{fronteira}--\r\n'.encode()
+        return corpo, f'multipart/form-data; boundary={fronteira}'
+    if pedido.json is not None:
+        return json.dumps(pedido.json).encode(), 'application/json'
+    return None, None
+
+
+def subir_servidor(porta, pasta, workers, worker_class):
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(pasta, 'carga.db')}",
+        UPLOAD_FOLDER=os.path.join(pasta, 'uploads'),
+        MANUTENCAO_AUTOMATICA='0',
+    )
+    processo = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-k', worker_class, '-w', str(workers), '-b', f'127.0.0.1:{porta}', 'wsgi:app'],
+        cwd=BACKEND, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    for _ in range(100):
+        try:
+            conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=5)
+            conexao.request('GET', '/api/health')
+            conexao.getresponse().read()
+            conexao.close()
+            return processo
+        except OSError:
+            time.sleep(0.2)
+    processo.kill()
+    raise RuntimeError('servidor não subiu')
+
+
+def rodar_servidor(comunidade, plano, semente, porta, clientes):
+    from urllib.parse import urlencode
+
+    fila = deque(plano)
+    medidas = {}
+    lock = threading.Lock()
+
+    def cliente(indice):
+        rnd = random.Random(semente + indice)
+        conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=60)
+        while True:
+            try:
+                endpoint = fila.popleft()
+            except IndexError:
+                break
+            with lock:
+                pedido = CENARIOS[endpoint][1](comunidade, rnd)
+            if pedido is None:
+                continue
+            corpo, tipo = _corpo(pedido)
+            headers = {}
+            if tipo:
+                headers['Content-Type'] = tipo
+            if pedido.token:
+                headers['Authorization'] = f'Bearer {pedido.token}'
+            caminho = pedido.caminho + (f'?{urlencode(pedido.query)}' if pedido.query else '')
+            t = time.perf_counter()
+            try:
+                conexao.request(pedido.metodo, caminho, body=corpo, headers=headers)
+                resposta = conexao.getresponse()
+                resposta.read()
+                status = resposta.status
+            except (OSError, http.client.HTTPException):
+                conexao.close()
+                conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=60)
+                status = 599
+            with lock:
+                medidas.setdefault(endpoint, []).append(((time.perf_counter() - t) * 1000, status, None))
+        conexao.close()
+
+    threads = [threading.Thread(target=cliente, args=(i,)) for i in range(clientes)]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return resumir(medidas, time.perf_counter() - inicio)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# RELATÓRIOS
+# ══════════════════════════════════════════════════════════════════════════════
+
+def imprimir(modo, resumo):
+    total = sum(r['n'] for r in resumo.values())
+    print(f"\n{modo}: {total} requisições, {sum(r['rps'] for r in resumo.values()):.0f} req/s")
+    print(f"  {'rota':<26}{'n':>6}{'erros':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'req/s':>8}{'SQL':>6}")
+    for endpoint, r in resumo.items():
+        consultas = '' if r['consultas'] is None else f"{r['consultas']:.1f}"
+        print(f"  {endpoint:<26}{r['n']:>6}{r['erros']:>7}{r['p50']:>9.1f}{r['p95']:>9.1f}{r['p99']:>9.1f}{r['rps']:>8.1f}{consultas:>6}")
+
+
+def _delta(antes, depois):
+    if antes is None or depois is None:
+        return '—'
+    if not antes:
+        return f'{depois:+.1f}'
+    return f'{(depois - antes) / antes * 100:+.0f}%'
+
+
+def comparar(base, atual):
+    print(f"\nComparação {(base.get('commit') or '?')[:12]} → {(atual.get('commit') or '?')[:12]}")
+    if base.get('parametros') != atual.get('parametros'):
+        print(f"⚠️  Parâmetros diferentes: {base.get('parametros')} × {atual.get('parametros')}")
+    for modo, resumo in atual['modos'].items():
+        anterior = base['modos'].get(modo)
+        if not anterior:
+            continue
+        print(f"\n{modo}:")
+        print(f"  {'rota':<26}{'p50':>9}{'p95':>9}{'p99':>9}{'SQL':>9}")
+        for endpoint, r in resumo.items():
+            a = anterior.get(endpoint)
+            if not a:
+                print(f"  {endpoint:<26}{'(nova)':>9}")
+                continue
+            print(f"  {endpoint:<26}{_delta(a['p50'], r['p50']):>9}{_delta(a['p95'], r['p95']):>9}"
+                  f"{_delta(a['p99'], r['p99']):>9}{_delta(a['consultas'], r['consultas']):>9}")
+
+
+def commit_atual():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BACKEND, capture_output=True, text=True, check=True).stdout.strip()
+        sujo = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=BACKEND, capture_output=True, text=True).stdout.strip()
+        return commit + ('-sujo' if sujo else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--usuarios', type=int, default=300)
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--repeticoes', type=int, default=20, help='multiplica o peso de cada cenário no plano')
+    parser.add_argument('--modo', choices=('cliente', 'servidor', 'ambos'), default='ambos')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--worker-class', default='gevent')
+    parser.add_argument('--clientes', type=int, default=8, help='threads em paralelo no modo servidor')
+    parser.add_argument('--porta', type=int, default=5098)
+    parser.add_argument('--saida', help='grava o resultado em JSON')
+    parser.add_argument('--comparar', nargs='+', metavar='JSON',
+                        help='compara com um resultado anterior; com dois arquivos, só compara e sai')
+    args = parser.parse_args()
+
+    if args.comparar and len(args.comparar) == 2:
+        with open(args.comparar[0]) as a, open(args.comparar[1]) as b:
+            comparar(json.load(a), json.load(b))
+        return
+
+    resultado = {
+        'commit': commit_atual(),
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'parametros': {k: v for k, v in vars(args).items() if k not in ('saida', 'comparar', 'porta')},
+        'modos': {},
+    }
+    modos = ('cliente', 'servidor') if args.modo == 'ambos' else (args.modo,)
+    for modo in modos:
+        # Banco novo por modo: os dois partem do mesmo estado
+        pasta = tempfile.mkdtemp(prefix='friendcircle-')
+        plano = montar_plano(args.repeticoes, args.semente)
+        reservas = plano.count('register') + plano.count('delete_post')
+        if modo == 'cliente':
+            app, comunidade = preparar(pasta, args.usuarios, args.semente, reservas)
+            conferir_cobertura(app)
+            resultado['modos'][modo] = rodar_cliente(app, comunidade, plano, args.semente)
+        else:
+            # O servidor abre o banco por conta própria; a preparação roda num processo à parte
+            subprocess.run([sys.executable, __file__, '--_preparar', pasta, str(args.usuarios), str(args.semente), str(reservas)],
+                           check=True, cwd=BACKEND)
+            with open(os.path.join(pasta, 'comunidade.json')) as f:
+                comunidade = Comunidade(**json.load(f))
+            comunidade.tokens = {int(k): v for k, v in comunidade.tokens.items()}
+            servidor = subir_servidor(args.porta, pasta, args.workers, args.worker_class)
+            try:
+                resultado['modos'][modo] = rodar_servidor(comunidade, plano, args.semente, args.porta, args.clientes)
+            finally:
+                servidor.terminate()
+                servidor.wait()
+        imprimir(modo, resultado['modos'][modo])
+
+    if args.saida:
+        with open(args.saida, 'w') as f:
+            json.dump(resultado, f, indent=2)
+        print(f"\n💾 Resultado salvo em {args.saida}")
+    if args.comparar:
+        with open(args.comparar[0]) as f:
+            comparar(json.load(f), resultado)
+
+
+def _preparar_para_servidor(pasta, usuarios, semente, reservas):
+    _, c = preparar(pasta, int(usuarios), int(semente), int(reservas))
+    with open(os.path.join(pasta, 'comunidade.json'), 'w') as f:
+        json.dump({'usuarios': c.usuarios, 'posts': c.posts, 'tokens': c.tokens, 'convites': list(c.convites),
+                   'descartaveis': list(c.descartaveis), 'avatar': c.avatar}, f)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 6 and sys.argv[1] == '--_preparar':
+        _preparar_para_servidor(*sys.argv[2:])
+    else:
+        main()
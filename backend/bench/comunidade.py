@@ -0,0 +1,132 @@
+"""
+FriendCircle - Gerador de comunidades sintéticas
+
+Gera registros no formato de 'flask exportar' com distribuições de cauda
+longa, como numa rede social de verdade: poucos membros publicam muito e a
+maioria quase nada, poucos posts concentram as curtidas, a maioria dos posts
+não tem comentários e alguns têm conversas longas, e cada curtida ou
+comentário deixa uma notificação (as antigas já lidas, as recentes não).
+
+Com a mesma --semente o resultado é idêntico. Pode gerar um arquivo:
+    python bench/comunidade.py --usuarios 1000 --saida comunidade.ndjson
+ou ser usado por bench/carga.py, que importa direto num banco temporário.
+"""
+
+from datetime import datetime, timedelta
+import argparse
+import json
+import random
+
+PALAVRAS = (
+    'praia sol café almoço família amigos viagem festa aniversário cachorro gato '
+    'foto música show cinema livro trabalho férias montanha chuva domingo churrasco '
+    'futebol jogo saudade casa jardim flores bolo pão queijo vinho noite lua mar '
+    'hoje ontem amanhã lindo incrível saudades parabéns obrigado demais muito'
+).split()
+
+
+def _cauda_longa(rnd, alfa, minimo, maximo):
+    return min(maximo, int(rnd.paretovariate(alfa)) - 1 + minimo)
+
+
+def _frase(rnd, minimo=3, maximo=16):
+    return ' '.join(rnd.choices(PALAVRAS, k=rnd.randint(minimo, maximo)))
+
+
+def gerar(usuarios=200, semente=42, dias=90, password_hash='', agora=None):
+    """Gera dicts {'tabela': ..., 'dados': ...} na ordem das chaves estrangeiras."""
+    rnd = random.Random(semente)
+    agora = agora or datetime(2025, 1, 1)
+    inicio = agora - timedelta(days=dias)
+
+    def instante():
+        return inicio + timedelta(seconds=rnd.uniform(0, dias * 86400))
+
+    def iso(data):
+        return data.isoformat()
+
+    # Atividade de cada membro: pesa quanto publica, curte e comenta
+    atividade = [rnd.paretovariate(1.5) for _ in range(usuarios)]
+    ids_usuarios = list(range(1, usuarios + 1))
+
+    for i in ids_usuarios:
+        criado = inicio - timedelta(days=rnd.uniform(0, 30))
+        yield {'tabela': 'users', 'dados': {
+            'id': i, 'email': f'membro{i}@teste.com', 'password_hash': password_hash,
+            'nome': f'Membro {i}', 'bio': _frase(rnd, 0, 8), 'avatar': '', 'emoji': '😊',
+            'cor_tema': '#7c3aed', 'is_admin': i == 1, 'is_active': True,
+            'created_at': iso(criado), 'last_seen': iso(instante()),
+            'total_posts': 0, 'total_likes': 0,
+        }}
+
+    posts = []
+    for user_id, peso in zip(ids_usuarios, atividade):
+        for _ in range(min(int(peso * 4), 500)):
+            posts.append((instante(), user_id))
+    posts.sort()
+
+    comentarios, curtidas, notificacoes = [], [], []
+    for post_id, (criado, autor) in enumerate(posts, 1):
+        yield {'tabela': 'posts', 'dados': {
+            'id': post_id, 'user_id': autor, 'texto': _frase(rnd), 'imagem': '',
+            'created_at': iso(criado), 'updated_at': iso(criado),
+            'likes_count': 0, 'comments_count': 0,
+        }}
+
+        total_curtidas = _cauda_longa(rnd, 1.2, 0, usuarios - 1)
+        quem_curtiu = set(rnd.choices(ids_usuarios, weights=atividade, k=total_curtidas))
+        for user_id in quem_curtiu:
+            curtidas.append((user_id, post_id))
+        if quem_curtiu - {autor}:
+            notificacoes.append((autor, 'like', sorted(quem_curtiu - {autor}), post_id, criado))
+
+        # Conversas: a maioria dos posts sem comentário, alguns com dezenas
+        total_comentarios = _cauda_longa(rnd, 1.6, 0, 200) if rnd.random() < 0.4 else 0
+        quem_comentou = []
+        momento = criado
+        for _ in range(total_comentarios):
+            momento += timedelta(minutes=rnd.expovariate(1 / 30))
+            user_id = rnd.choices(ids_usuarios, weights=atividade)[0]
+            comentarios.append((user_id, post_id, _frase(rnd, 1, 10), momento))
+            if user_id != autor and user_id not in quem_comentou:
+                quem_comentou.insert(0, user_id)
+        if quem_comentou:
+            notificacoes.append((autor, 'comment', quem_comentou, post_id, momento))
+
+    for comment_id, (user_id, post_id, texto, criado) in enumerate(comentarios, 1):
+        yield {'tabela': 'comments', 'dados': {
+            'id': comment_id, 'user_id': user_id, 'post_id': post_id, 'texto': texto, 'created_at': iso(criado),
+        }}
+
+    for user_id, post_id in curtidas:
+        yield {'tabela': 'likes', 'dados': {'user_id': user_id, 'post_id': post_id}}
+
+    notificacoes.sort(key=lambda n: n[4])
+    for notif_id, (user_id, tipo, atores, post_id, criado) in enumerate(notificacoes, 1):
+        verbo = 'curtiram seu post' if tipo == 'like' else 'comentaram no seu post'
+        mensagem = f'Membro {atores[0]} e mais {len(atores) - 1} {verbo}' if len(atores) > 1 else f'Membro {atores[0]} {verbo}'
+        yield {'tabela': 'notifications', 'dados': {
+            'id': notif_id, 'user_id': user_id, 'tipo': tipo, 'mensagem': mensagem,
+            'link': f'/post/{post_id}', 'lida': (agora - criado).days > 7, 'actor_id': atores[0],
+            'created_at': iso(criado), 'post_id': post_id, 'total_atores': len(atores),
+            'atores_recentes': json.dumps(atores[:100]),
+        }}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--usuarios', type=int, default=200)
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--saida', required=True)
+    args = parser.parse_args()
+
+    totais = {}
+    with open(args.saida, 'w', encoding='utf-8') as saida:
+        for registro in gerar(args.usuarios, args.semente):
+            saida.write(json.dumps(registro, ensure_ascii=False) + '\n')
+            totais[registro['tabela']] = totais.get(registro['tabela'], 0) + 1
+    print(', '.join(f'{total} {tabela}' for tabela, total in totais.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+FriendCircle - Teste de concorrência de escrita
+
+Vários processos (como workers do gunicorn), cada um com várias threads,
+curtem, descurtem e comentam os mesmos posts ao mesmo tempo. Falha se alguma
+requisição der erro (ex.: "database is locked") ou se os contadores mantidos
+divergirem das tabelas.
+
+Uso (dentro de backend/):
+    python bench/concorrencia_escrita.py --processos 4 --threads 8 --operacoes 50
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def preparar(total_usuarios, total_posts):
+    from app import create_app, db, inicializar_banco, User, Post, ajustar_contadores_usuario
+    from flask_jwt_extended import create_access_token
+
+    app = create_app()
+    with app.app_context():
+        inicializar_banco()
+        usuarios = []
+        for i in range(total_usuarios):
+            user = User(email=f'user{i}@teste.com', nome=f'Usuário {i}', is_admin=(i == 0))
+            user.password_hash = '-'
+            db.session.add(user)
+            usuarios.append(user)
+        db.session.flush()
+        for i in range(total_posts):
+            db.session.add(Post(user_id=usuarios[i % total_usuarios].id, texto=f'Post {i}'))
+            ajustar_contadores_usuario(usuarios[i % total_usuarios].id, posts=1)
+        db.session.commit()
+        return [create_access_token(identity=str(u.id)) for u in usuarios]
+
+
+def trabalhador(tokens, total_posts, threads, operacoes, semente, fila):
+    from app import create_app
+
+    app = create_app()
+
+    erros = []
+
+    def rodar(indice):
+        rnd = random.Random(semente * 1000 + indice)
+        client = app.test_client()
+        for _ in range(operacoes):
+            headers = {'Authorization': f'Bearer {rnd.choice(tokens)}'}
+            post_id = rnd.randint(1, total_posts)
+            if rnd.random() < 0.7:
+                r = client.post(f'/api/posts/{post_id}/like', headers=headers)
+            else:
+                r = client.post(f'/api/posts/{post_id}/comments', json={'texto': 'oi!'}, headers=headers)
+            if r.status_code >= 500:
+                erros.append(f'{r.status_code} {r.get_data(as_text=True)[:200]}')
+
+    pool = [threading.Thread(target=rodar, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    fila.put(erros)
+
+
+def verificar_contadores():
+    from app import create_app, db, likes, Post, Comment
+
+    with create_app().app_context():
+        divergentes = 0
+        for post in Post.query.all():
+            curtidas = db.session.query(db.func.count()).select_from(likes).filter(likes.c.post_id == post.id).scalar()
+            comentarios = Comment.query.filter_by(post_id=post.id).count()
+            if (curtidas, comentarios) != (post.likes_count, post.comments_count):
+                divergentes += 1
+        return divergentes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processos', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--operacoes', type=int, default=50)
+    parser.add_argument('--usuarios', type=int, default=20)
+    parser.add_argument('--posts', type=int, default=5)
+    args = parser.parse_args()
+
+    pasta = tempfile.mkdtemp(prefix='friendcircle-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(pasta, 'concorrencia.db')}"
+
+    tokens = preparar(args.usuarios, args.posts)
+
+    ctx = multiprocessing.get_context('spawn')
+    fila = ctx.Queue()
+    processos = [
+        ctx.Process(target=trabalhador, args=(tokens, args.posts, args.threads, args.operacoes, i, fila))
+        for i in range(args.processos)
+    ]
+    for p in processos:
+        p.start()
+    erros = [e for _ in processos for e in fila.get()]
+    for p in processos:
+        p.join()
+
+    total = args.processos * args.threads * args.operacoes
+    divergentes = verificar_contadores()
+    print(f"Requisições: {total} | erros: {len(erros)} | posts com contadores divergentes: {divergentes}")
+    for erro in erros[:10]:
+        print(f"  ✗ {erro}")
+
+    if erros or divergentes:
+        print("❌ Falhou")
+        sys.exit(1)
+    print("✅ Nenhum erro de lock")
+
+
+if __name__ == '__main__':
+    main()
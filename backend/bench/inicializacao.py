@@ -0,0 +1,113 @@
+"""
+FriendCircle - Tempo de inicialização
+
+Mede, em processos novos, quanto custa importar o módulo, montar o app com
+create_app() e responder a primeira requisição; depois sobe o gunicorn com
+e sem preload_app e mede até todos os workers responderem.
+
+Uso (dentro de backend/, precisa de gunicorn e gevent):
+    python bench/inicializacao.py --repeticoes 5 --workers 4
+"""
+
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MEDIR = """
+import json, time
+t0 = time.perf_counter()
+import app as modulo
+t1 = time.perf_counter()
+app = modulo.create_app()
+t2 = time.perf_counter()
+resposta = app.test_client().get('/api/stats')
+t3 = time.perf_counter()
+print(json.dumps({'import': t1 - t0, 'create_app': t2 - t1, 'primeira_requisicao': t3 - t2}))
+"""
+
+
+def mediana(valores):
+    valores = sorted(valores)
+    return valores[len(valores) // 2]
+
+
+def subir_gunicorn(porta, env, workers, preload):
+    """Segundos até a primeira resposta, até todos os workers prontos e para encerrar (SIGTERM)."""
+    args = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-b', f'127.0.0.1:{porta}',
+            '-w', str(workers), 'wsgi:app']
+    inicio = time.perf_counter()
+    processo = subprocess.Popen(args, cwd=BACKEND, env=dict(env, GUNICORN_PRELOAD='1' if preload else '0'),
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    prontos = []
+
+    def ler_log():
+        for linha in processo.stderr:
+            if 'Worker pronto' in linha:
+                prontos.append(time.perf_counter() - inicio)
+
+    leitor = threading.Thread(target=ler_log, daemon=True)
+    leitor.start()
+
+    primeira = None
+    while primeira is None and time.perf_counter() - inicio < 60:
+        try:
+            conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=5)
+            conexao.request('GET', '/api/health')
+            conexao.getresponse().read()
+            conexao.close()
+            primeira = time.perf_counter() - inicio
+        except OSError:
+            time.sleep(0.02)
+    while len(prontos) < workers and time.perf_counter() - inicio < 60:
+        time.sleep(0.02)
+
+    parada = time.perf_counter()
+    processo.terminate()
+    processo.wait()
+    leitor.join()
+    return primeira, prontos[-1] if prontos else None, time.perf_counter() - parada
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeticoes', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--porta', type=int, default=5096)
+    args = parser.parse_args()
+
+    pasta = tempfile.mkdtemp(prefix='friendcircle-')
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(pasta, 'inicio.db')}",
+        UPLOAD_FOLDER=os.path.join(pasta, 'uploads'),
+    )
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'], cwd=BACKEND, env=env,
+                   stdout=subprocess.DEVNULL, check=True)
+
+    tempos = {'import': [], 'create_app': [], 'primeira_requisicao': []}
+    for _ in range(args.repeticoes):
+        saida = subprocess.run([sys.executable, '-c', MEDIR], cwd=BACKEND, env=env, capture_output=True, text=True, check=True)
+        for etapa, valor in json.loads(saida.stdout.strip().splitlines()[-1]).items():
+            tempos[etapa].append(valor)
+    print(f"Processo novo (mediana de {args.repeticoes}):")
+    for etapa, valores in tempos.items():
+        print(f"  {etapa:<22}{mediana(valores) * 1000:8.1f} ms")
+
+    print(f"\ngunicorn com {args.workers} workers (mediana de {args.repeticoes}):")
+    print(f"  {'':<14}{'1ª resposta':>14}{'todos prontos':>16}{'encerramento':>15}")
+    for preload in (True, False):
+        medidas = [subir_gunicorn(args.porta, env, args.workers, preload) for _ in range(args.repeticoes)]
+        primeira, prontos, encerramento = (mediana([m[i] for m in medidas if m[i] is not None] or [float('nan')]) for i in range(3))
+        print(f"  {'com preload' if preload else 'sem preload':<14}{primeira * 1000:11.0f} ms"
+              f"{prontos * 1000:13.0f} ms{encerramento * 1000:12.0f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+FriendCircle - Latência do feed durante uma rajada de logins
+
+Sobe o backend com gunicorn (worker gevent) num banco temporário e mede a
+latência de GET /api/posts enquanto várias threads fazem login sem parar.
+Roda três cenários: feed sozinho, logins com hash na própria requisição
+(SENHAS_WORKERS=0) e logins com o pool de processos.
+
+Uso (dentro de backend/, precisa de gunicorn e gevent):
+    python bench/login_feed.py --segundos 10 --logins 8
+"""
+
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def chamar(porta, metodo, caminho, corpo=None, token=None):
+    conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=30)
+    headers = {'Content-Type': 'application/json'}
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    conexao.request(metodo, caminho, body=json.dumps(corpo) if corpo is not None else None, headers=headers)
+    resposta = conexao.getresponse()
+    dados = resposta.read()
+    conexao.close()
+    return resposta.status, dados
+
+
+def subir_servidor(porta, pasta, senhas_workers):
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(pasta, 'bench.db')}",
+        UPLOAD_FOLDER=os.path.join(pasta, 'uploads'),
+        SENHAS_WORKERS=str(senhas_workers),
+    )
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'], cwd=BACKEND, env=env,
+                   stdout=subprocess.DEVNULL, check=True)
+    processo = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-k', 'gevent', '-w', '1', '-b', f'127.0.0.1:{porta}', 'wsgi:app'],
+        cwd=BACKEND, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    for _ in range(100):
+        try:
+            chamar(porta, 'GET', '/api/health')
+            return processo
+        except OSError:
+            time.sleep(0.1)
+    processo.kill()
+    raise RuntimeError('servidor não subiu')
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def cenario(nome, porta, token, segundos, logins):
+    parar = threading.Event()
+    total_logins = [0]
+
+    def logar():
+        while not parar.is_set():
+            status, _ = chamar(porta, 'POST', '/api/auth/login', {'email': 'ana@teste.com', 'password': '123456'})
+            if status == 200:
+                total_logins[0] += 1
+
+    threads = [threading.Thread(target=logar, daemon=True) for _ in range(logins)]
+    for t in threads:
+        t.start()
+
+    latencias = []
+    fim = time.time() + segundos
+    while time.time() < fim:
+        inicio = time.perf_counter()
+        chamar(porta, 'GET', '/api/posts', token=token)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+
+    parar.set()
+    for t in threads:
+        t.join()
+
+    print(f"{nome:<28} feed p50 {percentil(latencias, 0.5):6.1f} ms  "
+          f"p99 {percentil(latencias, 0.99):6.1f} ms  ({len(latencias)} feeds, {total_logins[0]} logins)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--segundos', type=float, default=10)
+    parser.add_argument('--logins', type=int, default=8, help='threads fazendo login sem parar')
+    parser.add_argument('--porta', type=int, default=5099)
+    args = parser.parse_args()
+
+    for titulo, senhas_workers, logins in (
+        ('sem logins', 2, 0),
+        ('hash na requisição', 0, args.logins),
+        ('hash no pool de processos', 2, args.logins),
+    ):
+        pasta = tempfile.mkdtemp(prefix='friendcircle-')
+        servidor = subir_servidor(args.porta, pasta, senhas_workers)
+        try:
+            _, dados = chamar(args.porta, 'POST', '/api/auth/register', {
+                'email': 'ana@teste.com', 'password': '123456', 'nome': 'Ana'
+            })
+            token = json.loads(dados)['token']
+            for i in range(20):
+                chamar(args.porta, 'POST', '/api/posts', {'texto': f'Post {i}'}, token)
+            cenario(titulo, args.porta, token, args.segundos, logins)
+        finally:
+            servidor.terminate()
+            servidor.wait()
+
+
+if __name__ == '__main__':
+    main()
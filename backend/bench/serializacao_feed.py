@@ -0,0 +1,117 @@
+"""
+FriendCircle - Custo de serialização e bytes por página do feed
+
+Importa uma comunidade sintética (bench/comunidade.py) e, para cada página
+do feed, mede separadamente a montagem dos dicts (serializar_posts), a
+codificação em JSON e o gzip, com o codificador padrão e com o orjson, a
+página completa e só os campos que o cartão de post do site usa
+(?fields=), com e sem ?include=comments:3.
+
+Uso (dentro de backend/):
+    python bench/serializacao_feed.py --usuarios 500 --paginas 20 --repeticoes 5
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from comunidade import gerar  # noqa: E402
+
+# O que o PostCard do site lê de cada post
+CAMPOS_CARTAO = 'id,texto,imagem,likes_count,comments_count,liked_by_me,tempo,autor.id,autor.nome,autor.avatar,autor.emoji'
+
+
+def mediana(valores):
+    valores = sorted(valores)
+    return valores[len(valores) // 2]
+
+
+def preparar(pasta, usuarios, semente):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(pasta, 'serializacao.db')}"
+    os.environ['UPLOAD_FOLDER'] = os.path.join(pasta, 'uploads')
+    os.environ.setdefault('SENHAS_WORKERS', '0')
+
+    from app import create_app, db, inicializar_banco, reconstruir_derivados
+    from portabilidade import importar
+
+    app = create_app({'JSON_PROVEDOR': 'padrao'})
+    with app.app_context():
+        inicializar_banco()
+        with db.engine.begin() as conn:
+            totais = importar(conn, db.metadata, (json.dumps(r) for r in gerar(usuarios, semente)))
+        reconstruir_derivados()
+    print(f"📦 {', '.join(f'{total} {tabela}' for tabela, total in totais.items())}")
+    return app
+
+
+def medir_paginas(app, paginas, repeticoes, campos, comentarios):
+    """Medianas por página: montagem, codificação e gzip (ms) e bytes com e sem gzip."""
+    from app import Post, pagina_por_cursor, serializar_posts
+    from serializacao import ler_campos
+
+    tempos = {'montagem': [], 'codificacao': [], 'gzip': []}
+    tamanhos = {'bytes': [], 'bytes_gzip': []}
+    for _ in range(repeticoes):
+        cursor = None
+        for _ in range(paginas):
+            with app.test_request_context('/api/posts'):
+                posts, cursor = pagina_por_cursor(Post.query, Post, cursor, 20)
+                inicio = time.perf_counter()
+                dados = serializar_posts(posts, current_user_id=1, comentarios=comentarios, campos=ler_campos(campos))
+                montado = time.perf_counter()
+                corpo = app.json.response({'posts': dados, 'next_cursor': cursor}).get_data()
+                codificado = time.perf_counter()
+                comprimido = gzip.compress(corpo, compresslevel=app.config['RESPOSTAS_GZIP_NIVEL'])
+                fim = time.perf_counter()
+            tempos['montagem'].append(montado - inicio)
+            tempos['codificacao'].append(codificado - montado)
+            tempos['gzip'].append(fim - codificado)
+            tamanhos['bytes'].append(len(corpo))
+            tamanhos['bytes_gzip'].append(len(comprimido))
+            if cursor is None:
+                break
+    resultado = {etapa: mediana(valores) * 1000 for etapa, valores in tempos.items()}
+    resultado.update({chave: mediana(valores) for chave, valores in tamanhos.items()})
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--usuarios', type=int, default=500)
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--paginas', type=int, default=20)
+    parser.add_argument('--repeticoes', type=int, default=5)
+    args = parser.parse_args()
+
+    from app import create_app
+
+    base = preparar(tempfile.mkdtemp(prefix='friendcircle-'), args.usuarios, args.semente)
+    apps = {'padrao': base}
+    try:
+        apps['orjson'] = create_app({'JSON_PROVEDOR': 'orjson'})
+    except RuntimeError as e:
+        print(f"⚠️  {e}: medindo só o codificador padrão")
+
+    print(f"\nPor página de 20 posts (mediana de {args.paginas} páginas x {args.repeticoes}):")
+    print(f"  {'codificador':<12}{'campos':<10}{'comentários':>12}{'montagem':>11}{'codificação':>13}"
+          f"{'gzip':>9}{'bytes':>9}{'gzip':>8}")
+    for nome, app in apps.items():
+        for rotulo, campos in (('todos', ''), ('cartão', CAMPOS_CARTAO)):
+            for comentarios in (0, 3):
+                if comentarios:
+                    campos_pedidos = campos and f'{campos},comments'
+                else:
+                    campos_pedidos = campos
+                r = medir_paginas(app, args.paginas, args.repeticoes, campos_pedidos, comentarios)
+                print(f"  {nome:<12}{rotulo:<10}{comentarios:>12}{r['montagem']:>8.2f} ms{r['codificacao']:>10.2f} ms"
+                      f"{r['gzip']:>6.2f} ms{r['bytes']:>9}{r['bytes_gzip']:>8}")
+
+
+if __name__ == '__main__':
+    main()
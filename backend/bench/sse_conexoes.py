@@ -0,0 +1,141 @@
+"""
+FriendCircle - Teste de carga do stream de notificações (SSE)
+
+Sobe o backend num servidor gevent, abre milhares de conexões ociosas em
+/api/notifications/stream, mede a memória do servidor e confere que uma
+curtida chega a todas elas.
+
+Uso (dentro de backend/, precisa de gevent):
+    python bench/sse_conexoes.py --conexoes 5000
+"""
+
+import argparse
+import json
+import os
+import selectors
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVIDOR = """
+from gevent import monkey; monkey.patch_all()
+from gevent.pywsgi import WSGIServer
+from app import create_app, inicializar_banco
+app = create_app()
+with app.app_context():
+    inicializar_banco()
+WSGIServer(('127.0.0.1', {porta}), app, log=None).serve_forever()
+"""
+
+
+def api(porta, metodo, caminho, corpo=None, token=None):
+    req = urllib.request.Request(
+        f'http://127.0.0.1:{porta}/api{caminho}',
+        data=json.dumps(corpo).encode() if corpo is not None else None,
+        method=metodo,
+        headers={'Content-Type': 'application/json', **({'Authorization': f'Bearer {token}'} if token else {})}
+    )
+    with urllib.request.urlopen(req) as resp:
+        return json.loads(resp.read())
+
+
+def memoria_kb(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for linha in f:
+            if linha.startswith('VmRSS:'):
+                return int(linha.split()[1])
+    return 0
+
+
+def esperar_servidor(porta, timeout=30):
+    limite = time.time() + timeout
+    while time.time() < limite:
+        try:
+            return api(porta, 'GET', '/health')
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('Servidor não subiu')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--conexoes', type=int, default=2000)
+    parser.add_argument('--porta', type=int, default=5099)
+    args = parser.parse_args()
+
+    pasta = tempfile.mkdtemp(prefix='friendcircle-')
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(pasta, 'sse.db')}")
+    servidor = subprocess.Popen(
+        [sys.executable, '-c', SERVIDOR.format(porta=args.porta)],
+        cwd=pasta, env=dict(env, PYTHONPATH=BACKEND),
+        stdout=subprocess.DEVNULL
+    )
+    conexoes = []
+    try:
+        esperar_servidor(args.porta)
+        ana = api(args.porta, 'POST', '/auth/register', {'email': 'ana@teste.com', 'password': '123456', 'nome': 'Ana'})['token']
+        convite = api(args.porta, 'POST', '/invites', {'email': 'bia@teste.com'}, ana)['invite']['token']
+        bia = api(args.porta, 'POST', '/auth/register', {
+            'email': 'bia@teste.com', 'password': '123456', 'nome': 'Bia', 'token_convite': convite
+        })['token']
+        post_id = api(args.porta, 'POST', '/posts', {'texto': 'Olá!'}, ana)['post']['id']
+
+        memoria_antes = memoria_kb(servidor.pid)
+        seletor = selectors.DefaultSelector()
+        pedido = (
+            f'GET /api/notifications/stream?jwt={ana} HTTP/1.1\r\n'
+            f'Host: 127.0.0.1\r\nAccept: text/event-stream\r\n\r\n'
+        ).encode()
+        inicio = time.time()
+        for _ in range(args.conexoes):
+            sock = socket.create_connection(('127.0.0.1', args.porta))
+            sock.sendall(pedido)
+            sock.setblocking(False)
+            seletor.register(sock, selectors.EVENT_READ, bytearray())
+            conexoes.append(sock)
+
+        # Espera todas receberem o cabeçalho e o "retry:" inicial
+        prontas = set()
+        while len(prontas) < len(conexoes) and time.time() - inicio < 60:
+            for chave, _ in seletor.select(timeout=1):
+                chave.data.extend(chave.fileobj.recv(65536))
+                if b'retry:' in chave.data:
+                    prontas.add(chave.fileobj)
+        abertura = time.time() - inicio
+        time.sleep(1)
+        memoria_depois = memoria_kb(servidor.pid)
+
+        for chave in seletor.get_map().values():
+            chave.data.clear()
+        disparo = time.time()
+        api(args.porta, 'POST', f'/posts/{post_id}/like', token=bia)
+
+        recebidas = set()
+        while len(recebidas) < len(conexoes) and time.time() - disparo < 30:
+            for chave, _ in seletor.select(timeout=1):
+                chave.data.extend(chave.fileobj.recv(65536))
+                if b'event: notification' in chave.data:
+                    recebidas.add(chave.fileobj)
+        entrega = time.time() - disparo
+
+        por_conexao = (memoria_depois - memoria_antes) / max(len(prontas), 1)
+        print(f"Conexões abertas: {len(prontas)}/{args.conexoes} em {abertura:.1f}s")
+        print(f"Memória do servidor: {memoria_antes / 1024:.1f} MB -> {memoria_depois / 1024:.1f} MB "
+              f"(~{por_conexao:.1f} KB por conexão)")
+        print(f"Notificação entregue a {len(recebidas)}/{len(conexoes)} conexões em {entrega:.2f}s")
+        if len(recebidas) < len(conexoes):
+            sys.exit(1)
+    finally:
+        for sock in conexoes:
+            sock.close()
+        servidor.terminate()
+        servidor.wait()
+
+
+if __name__ == '__main__':
+    main()
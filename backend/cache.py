@@ -0,0 +1,237 @@
+"""
+FriendCircle - Cache de respostas com TTL e invalidação por tags
+"""
+
+from collections import OrderedDict, defaultdict
+from functools import wraps
+import pickle
+import threading
+import time
+
+from flask import current_app, request, make_response, g, has_app_context
+
+from recursos import escolher_backend, conectar_redis
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# BACKENDS
+# ══════════════════════════════════════════════════════════════════════════════
+
+class CacheMemoria:
+    """LRU em memória do processo, com TTL por item."""
+
+    def __init__(self, max_itens=2048):
+        self.max_itens = max_itens
+        self._itens = OrderedDict()
+        self._contadores = {}
+        self._lock = threading.Lock()
+
+    def get(self, chave):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+            expira_em, valor = item
+            if expira_em is not None and expira_em < time.monotonic():
+                del self._itens[chave]
+                return None
+            self._itens.move_to_end(chave)
+            return valor
+
+    def get_muitos(self, chaves):
+        return [self.get(chave) for chave in chaves]
+
+    def set(self, chave, valor, ttl=None):
+        expira_em = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._itens[chave] = (expira_em, valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+
+    def delete(self, chave):
+        with self._lock:
+            self._itens.pop(chave, None)
+
+    def incr(self, chave):
+        # Contadores ficam fora do LRU: perder uma versão de tag traria respostas velhas de volta
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + 1
+            return self._contadores[chave]
+
+    def contadores(self, chaves):
+        with self._lock:
+            return [self._contadores.get(chave, 0) for chave in chaves]
+
+    def tamanho(self):
+        with self._lock:
+            return len(self._itens)
+
+
+class CacheRedis:
+    """Backend compartilhado entre workers."""
+
+    PREFIXO = 'friendcircle:cache:'
+
+    def __init__(self, url):
+        self._redis = conectar_redis(url)
+
+    def get(self, chave):
+        valor = self._redis.get(self.PREFIXO + chave)
+        return pickle.loads(valor) if valor is not None else None
+
+    def get_muitos(self, chaves):
+        if not chaves:
+            return []
+        valores = self._redis.mget([self.PREFIXO + c for c in chaves])
+        return [pickle.loads(v) if v is not None else None for v in valores]
+
+    def set(self, chave, valor, ttl=None):
+        self._redis.set(self.PREFIXO + chave, pickle.dumps(valor), ex=int(ttl) if ttl else None)
+
+    def delete(self, chave):
+        self._redis.delete(self.PREFIXO + chave)
+
+    def incr(self, chave):
+        return self._redis.incr(self.PREFIXO + chave)
+
+    def contadores(self, chaves):
+        if not chaves:
+            return []
+        return [int(v or 0) for v in self._redis.mget([self.PREFIXO + c for c in chaves])]
+
+    def tamanho(self):
+        return None
+
+
+def criar_cache(url, max_itens=2048):
+    return escolher_backend(url, 'cache', lambda: CacheMemoria(max_itens), lambda: CacheRedis(url))
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# CACHE DE RESPOSTAS
+# ══════════════════════════════════════════════════════════════════════════════
+# Cada tag tem um número de versão guardado no backend e a chave de uma
+# resposta inclui as versões das suas tags. Invalidar uma tag só incrementa a
+# versão: as respostas antigas ficam inalcançáveis e saem por TTL/LRU.
+
+class CacheRespostas:
+    """Sem `backend` no construtor, usa o que `init_app` registrou no app atual."""
+
+    def __init__(self, backend=None):
+        self._backend = backend
+        self._contadores = defaultdict(lambda: {'hits': 0, 'misses': 0})
+        self._lock = threading.Lock()
+
+    def init_app(self, app, backend):
+        app.extensions['cache_respostas'] = backend
+
+    @property
+    def backend(self):
+        if self._backend is not None:
+            return self._backend
+        return current_app.extensions['cache_respostas']
+
+    def invalidar(self, *tags):
+        for tag in set(tags):
+            self.backend.incr(f'tag:{tag}')
+
+    def _versoes(self, tags):
+        return self.backend.contadores([f'tag:{t}' for t in tags])
+
+    def _contar(self, endpoint, campo):
+        with self._lock:
+            self._contadores[endpoint][campo] += 1
+
+    def estatisticas(self):
+        with self._lock:
+            endpoints = {}
+            for endpoint, c in self._contadores.items():
+                total = c['hits'] + c['misses']
+                endpoints[endpoint] = {**c, 'hit_rate': round(c['hits'] / total, 3) if total else 0.0}
+        return {'endpoints': endpoints, 'itens': self.backend.tamanho()}
+
+    def resposta(self, tags=(), por_usuario=None):
+        """Decora uma rota GET. `por_usuario` é uma função que devolve o id do usuário quando a resposta depende dele."""
+        def decorador(view):
+            @wraps(view)
+            def envolvida(*args, **kwargs):
+                endpoint = request.endpoint
+                ttl = current_app.config['CACHE_TTL'].get(endpoint)
+                if not ttl:
+                    return view(*args, **kwargs)
+
+                versoes = '.'.join(map(str, self._versoes(tags)))
+                usuario = por_usuario() if por_usuario else ''
+                chave = f'resp:{endpoint}:{usuario}:{request.full_path}:{versoes}'
+
+                guardada = self.backend.get(chave)
+                if guardada is not None:
+                    self._contar(endpoint, 'hits')
+                    corpo, status, mimetype = guardada
+                    resposta = current_app.response_class(corpo, status=status, mimetype=mimetype)
+                    resposta.headers['X-Cache'] = 'HIT'
+                    return resposta
+
+                self._contar(endpoint, 'misses')
+                resposta = make_response(view(*args, **kwargs))
+                if resposta.status_code == 200 and not resposta.is_streamed:
+                    self.backend.set(chave, (resposta.get_data(), resposta.status_code, resposta.mimetype), ttl)
+                resposta.headers['X-Cache'] = 'MISS'
+                return resposta
+            return envolvida
+        return decorador
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# CACHE DE ENTIDADES
+# ══════════════════════════════════════════════════════════════════════════════
+# Mesmo esquema de versões, mas por id: guarda o dict serializado de cada
+# entidade. `invalidar(ids)` incrementa a versão desses ids e `limpar()` a
+# geração de todos. Dentro de uma requisição cada id é resolvido uma vez só
+# (memo em flask.g). Os dicts devolvidos são compartilhados: não alterar.
+
+class CacheEntidades:
+
+    def __init__(self, backend, prefixo, ttl=300):
+        self.backend = backend
+        self.prefixo = prefixo
+        self.ttl = ttl
+
+    def invalidar(self, ids):
+        memo = self._memo() if has_app_context() else {}
+        for id_ in set(ids):
+            self.backend.incr(f'{self.prefixo}:v:{id_}')
+            memo.pop(id_, None)
+
+    def limpar(self):
+        self.backend.incr(f'{self.prefixo}:geracao')
+        if has_app_context():
+            self._memo().clear()
+
+    def esquecer_memo(self):
+        # Para conexões longas (SSE), onde o mesmo contexto atravessa várias invalidações
+        g.pop(f'_memo_{self.prefixo}', None)
+
+    def _memo(self):
+        return g.setdefault(f'_memo_{self.prefixo}', {})
+
+    def buscar(self, ids, carregar):
+        """Retorna {id: dict}. `carregar(ids_faltando)` devolve {id: dict} só para os que não estão no cache."""
+        memo = self._memo()
+        faltando = [i for i in dict.fromkeys(ids) if i not in memo]
+        if faltando:
+            geracao, *versoes = self.backend.contadores(
+                [f'{self.prefixo}:geracao'] + [f'{self.prefixo}:v:{i}' for i in faltando]
+            )
+            chaves = {i: f'{self.prefixo}:{geracao}:{i}:{v}' for i, v in zip(faltando, versoes)}
+            for id_, valor in zip(faltando, self.backend.get_muitos(list(chaves.values()))):
+                if valor is not None:
+                    memo[id_] = valor
+
+            restantes = [i for i in faltando if i not in memo]
+            if restantes:
+                for id_, valor in carregar(restantes).items():
+                    self.backend.set(chaves[id_], valor, self.ttl)
+                    memo[id_] = valor
+        return {i: memo[i] for i in ids if i in memo}
@@ -0,0 +1,92 @@
+"""
+FriendCircle - Hub de eventos (pub/sub) para o stream de notificações
+"""
+
+from collections import defaultdict
+import queue
+import threading
+
+from recursos import PorProcesso, iniciar_thread, escolher_backend, conectar_redis
+
+
+class Assinatura:
+    __slots__ = ('canal', 'fila')
+
+    def __init__(self, canal, tamanho):
+        self.canal = canal
+        self.fila = queue.Queue(maxsize=tamanho)
+
+    def proximo(self, timeout):
+        try:
+            return self.fila.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class HubMemoria:
+    """Pub/sub dentro do processo: cada canal é um usuário, cada assinatura uma conexão aberta."""
+
+    def __init__(self, tamanho_fila=32):
+        self.tamanho_fila = tamanho_fila
+        self._assinaturas = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def assinar(self, canal):
+        assinatura = Assinatura(canal, self.tamanho_fila)
+        with self._lock:
+            self._assinaturas[canal].add(assinatura)
+        return assinatura
+
+    def cancelar(self, assinatura):
+        with self._lock:
+            assinaturas = self._assinaturas.get(assinatura.canal)
+            if assinaturas is not None:
+                assinaturas.discard(assinatura)
+                if not assinaturas:
+                    del self._assinaturas[assinatura.canal]
+
+    def publicar(self, canal, evento):
+        self._entregar(canal, evento)
+
+    def _entregar(self, canal, evento):
+        with self._lock:
+            assinaturas = list(self._assinaturas.get(canal, ()))
+        for assinatura in assinaturas:
+            try:
+                assinatura.fila.put_nowait(evento)
+            except queue.Full:
+                # Conexão lenta: o evento é só um aviso, a próxima leitura busca tudo no banco
+                pass
+
+    def conexoes(self):
+        with self._lock:
+            return sum(len(a) for a in self._assinaturas.values())
+
+
+class HubRedis(HubMemoria):
+    """Compartilha os eventos entre workers via Redis; a entrega local continua em memória."""
+
+    PREFIXO = 'friendcircle:eventos:'
+
+    def __init__(self, url, tamanho_fila=32):
+        super().__init__(tamanho_fila)
+        self._redis = conectar_redis(url)
+        self._ouvinte = PorProcesso(lambda: iniciar_thread(self._ouvir, 'hub-redis'))
+
+    def assinar(self, canal):
+        self._ouvinte()
+        return super().assinar(canal)
+
+    def publicar(self, canal, evento):
+        self._redis.publish(f'{self.PREFIXO}{canal}', str(evento))
+
+    def _ouvir(self):
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe(f'{self.PREFIXO}*')
+        for mensagem in pubsub.listen():
+            canal = mensagem['channel'].decode()[len(self.PREFIXO):]
+            self._entregar(canal, mensagem['data'].decode())
+
+
+def criar_hub(url, tamanho_fila=32):
+    return escolher_backend(url, 'eventos', lambda: HubMemoria(tamanho_fila), lambda: HubRedis(url, tamanho_fila))
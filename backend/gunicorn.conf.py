@@ -0,0 +1,55 @@
+"""
+FriendCircle - Configuração do gunicorn para produção
+
+Antes de subir (e a cada deploy), crie ou atualize o esquema:
+    flask --app app init-db
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', '5001')}")
+
+# gevent: cada conexão SSE ocupa só uma greenlet. O SQLite aceita um escritor
+# por vez, então mais processos só ajudam nas leituras e no hash de senhas
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count(), 4)))
+worker_connections = int(os.environ.get('GUNICORN_CONEXOES', 1000))
+if worker_class == 'gthread':
+    # Só o gthread usa threads; no gevent a concorrência vem de worker_connections
+    threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# O app é montado uma vez no master e herdado pelos workers (fork): boot mais
+# rápido e memória compartilhada. create_app() não abre conexões nem threads
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+timeout = 30
+# SIGTERM: os workers param de aceitar conexões e têm esse tempo para terminar
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+if worker_class == 'gevent':
+    # Com preload o app é importado aqui no master: o patch tem que vir antes
+    from gevent import monkey
+    monkey.patch_all()
+
+
+def post_fork(server, worker):
+    # Garantia: nenhuma conexão aberta no master é reaproveitada pelo worker
+    from app import db
+    app = server.app.wsgi()
+    with app.app_context():
+        db.engine.dispose(close=False)
+        if app.extensions.get('sqlite_leitura') is not None:
+            app.extensions['sqlite_leitura'].dispose(close=False)
+
+
+def post_worker_init(worker):
+    worker.log.info('Worker pronto (pid: %s)', worker.pid)
+
+
+def worker_exit(server, worker):
+    # Grava last_seen e notificações pendentes antes de o processo sair
+    from app import encerrar_app
+    encerrar_app(server.app.wsgi())
@@ -0,0 +1,213 @@
+"""
+FriendCircle - Processamento de imagens enviadas (miniaturas e variantes responsivas)
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import struct
+
+from recursos import PorProcesso
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+FORMATO = 'WEBP'
+EXTENSAO = 'webp'
+
+# nome: (maior lado em px, recorte quadrado)
+VARIANTES_POST = {
+    'thumb': (320, False),
+    'feed': (1080, False),
+    'full': (2048, False),
+}
+VARIANTES_AVATAR = {
+    'thumb': (96, True),
+    'full': (512, True),
+}
+
+
+def disponivel():
+    return Image is not None
+
+
+def nome_variante(nome, variante):
+    return f"{nome.rsplit('.', 1)[0]}_{variante}.{EXTENSAO}"
+
+
+def candidatos_originais(nome_variante_, extensoes):
+    """Nomes possíveis do arquivo original de uma variante (vazio se não for variante)."""
+    base, _, resto = nome_variante_.rpartition('_')
+    variante, _, extensao = resto.partition('.')
+    if not base or extensao != EXTENSAO or variante not in {**VARIANTES_POST, **VARIANTES_AVATAR}:
+        return []
+    return [f'{base}.{ext}' for ext in sorted(extensoes)]
+
+
+def gerar_variantes(caminho, variantes, qualidade=80):
+    pasta, nome = os.path.split(caminho)
+    gerados = []
+    with Image.open(caminho) as original:
+        # Aplica a rotação do EXIF antes de descartar os metadados
+        imagem = ImageOps.exif_transpose(original)
+        if imagem.mode not in ('RGB', 'RGBA'):
+            imagem = imagem.convert('RGBA' if 'transparency' in imagem.info or imagem.mode in ('LA', 'PA') else 'RGB')
+
+        for variante, (lado, quadrado) in variantes.items():
+            if quadrado:
+                copia = ImageOps.fit(imagem, (lado, lado), Image.LANCZOS)
+            else:
+                copia = imagem.copy()
+                copia.thumbnail((lado, lado), Image.LANCZOS)
+
+            destino = os.path.join(pasta, nome_variante(nome, variante))
+            temporario = f'{destino}.tmp'
+            # Sem exif/icc: a variante sai sem metadados (GPS, câmera...)
+            copia.save(temporario, FORMATO, quality=qualidade, method=4)
+            os.replace(temporario, destino)
+            gerados.append(destino)
+    return gerados
+
+
+def remover_metadados(caminho):
+    """Tira EXIF/XMP/IPTC (GPS, câmera) e comentários do arquivo, sem recomprimir.
+
+    JPEG, PNG e WebP; no JPEG só a orientação é mantida. Retorna True se o arquivo mudou.
+    """
+    with open(caminho, 'rb') as f:
+        dados = f.read()
+    for limpar in (_limpar_jpeg, _limpar_png, _limpar_webp):
+        limpo = limpar(dados)
+        if limpo is not None:
+            break
+    else:
+        return False
+    if limpo == dados:
+        return False
+    with open(caminho, 'wb') as f:
+        f.write(limpo)
+    return True
+
+
+# APP0 (JFIF), APP2 só com perfil de cor, APP14 (Adobe); o resto dos APPn e COM é metadado
+_JPEG_MANTER = (0xE0, 0xEE)
+
+
+def _limpar_jpeg(dados):
+    if dados[:2] != b'\xff\xd8':
+        return None
+    partes = [dados[:2]]
+    orientacao = None
+    i = 2
+    while i + 4 <= len(dados):
+        if dados[i] != 0xFF:
+            return None
+        marcador = dados[i + 1]
+        if marcador == 0xFF:
+            i += 1
+            continue
+        if marcador == 0xDA:
+            # Dados da imagem até o EOI; o que vem depois (miniaturas, mapas de profundidade) sai também
+            fim = dados.find(b'\xff\xd9', i)
+            partes.append(dados[i:fim + 2] if fim != -1 else dados[i:])
+            break
+        tamanho = int.from_bytes(dados[i + 2:i + 4], 'big')
+        segmento = dados[i:i + 2 + tamanho]
+        if marcador == 0xE1 and segmento[4:10] == b'Exif\x00\x00':
+            orientacao = _orientacao_exif(segmento[10:])
+        if (not 0xE0 <= marcador <= 0xEF and marcador != 0xFE) or marcador in _JPEG_MANTER \
+                or (marcador == 0xE2 and segmento[4:16] == b'ICC_PROFILE\x00'):
+            partes.append(segmento)
+        i += 2 + tamanho
+    else:
+        return None
+    if orientacao and orientacao != 1:
+        partes.insert(1, _exif_orientacao(orientacao))
+    return b''.join(partes)
+
+
+def _orientacao_exif(tiff):
+    ordem = {b'II': 'little', b'MM': 'big'}.get(tiff[:2])
+    if ordem is None:
+        return None
+    ifd = int.from_bytes(tiff[4:8], ordem)
+    for n in range(int.from_bytes(tiff[ifd:ifd + 2], ordem)):
+        entrada = tiff[ifd + 2 + 12 * n:ifd + 14 + 12 * n]
+        if len(entrada) < 12:
+            break
+        if int.from_bytes(entrada[:2], ordem) == 0x0112:
+            return int.from_bytes(entrada[8:10], ordem)
+    return None
+
+
+def _exif_orientacao(valor):
+    # TIFF com uma única entrada no IFD0: Orientation (SHORT)
+    tiff = b'MM\x00\x2a' + struct.pack('>IH', 8, 1) + struct.pack('>HHIHH', 0x0112, 3, 1, valor, 0) + bytes(4)
+    corpo = b'Exif\x00\x00' + tiff
+    return b'\xff\xe1' + (len(corpo) + 2).to_bytes(2, 'big') + corpo
+
+
+_PNG_METADADOS = {b'eXIf', b'tEXt', b'zTXt', b'iTXt', b'tIME'}
+
+
+def _limpar_png(dados):
+    if dados[:8] != b'\x89PNG\r\n\x1a\n':
+        return None
+    partes = [dados[:8]]
+    i = 8
+    while i + 8 <= len(dados):
+        tamanho = int.from_bytes(dados[i:i + 4], 'big')
+        tipo = dados[i + 4:i + 8]
+        if tipo not in _PNG_METADADOS:
+            partes.append(dados[i:i + 12 + tamanho])
+        i += 12 + tamanho
+        if tipo == b'IEND':
+            break
+    return b''.join(partes)
+
+
+def _limpar_webp(dados):
+    if dados[:4] != b'RIFF' or dados[8:12] != b'WEBP':
+        return None
+    partes = []
+    i = 12
+    while i + 8 <= len(dados):
+        tipo = dados[i:i + 4]
+        tamanho = int.from_bytes(dados[i + 4:i + 8], 'little')
+        pedaco = dados[i:i + 8 + tamanho + (tamanho & 1)]
+        if tipo == b'VP8X' and len(pedaco) > 8:
+            # Desliga as flags de EXIF (0x08) e XMP (0x04) do cabeçalho estendido
+            pedaco = pedaco[:8] + bytes([pedaco[8] & ~0x0C]) + pedaco[9:]
+        if tipo not in (b'EXIF', b'XMP '):
+            partes.append(pedaco)
+        i += 8 + tamanho + (tamanho & 1)
+    corpo = b'WEBP' + b''.join(partes)
+    return b'RIFF' + len(corpo).to_bytes(4, 'little') + corpo
+
+
+class ProcessadorImagens:
+    """Pool de workers que gera as variantes fora da requisição."""
+
+    def __init__(self, workers=2, qualidade=80):
+        self.workers = workers
+        self.qualidade = qualidade
+        self._pool = PorProcesso(lambda: ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='imagens'))
+
+    def enviar(self, caminho, variantes):
+        if not disponivel():
+            return None
+        return self._pool().submit(self._processar, caminho, variantes)
+
+    def encerrar(self):
+        """Termina as variantes já enviadas antes de o processo sair."""
+        pool = self._pool.descartar()
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def _processar(self, caminho, variantes):
+        try:
+            return gerar_variantes(caminho, variantes, self.qualidade)
+        except Exception as e:
+            print(f"Erro ao processar imagem {caminho}: {str(e)}")
+            return []
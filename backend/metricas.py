@@ -0,0 +1,198 @@
+"""
+FriendCircle - Métricas por requisição: consultas SQL, fases e histogramas
+"""
+
+from contextlib import contextmanager
+from functools import wraps
+import os
+import threading
+import time
+import traceback
+
+from flask import g, has_request_context
+from sqlalchemy import event
+
+# Limites em segundos (latência) e em quantidade (consultas por requisição)
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CONSULTAS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+_PASTA = os.path.dirname(os.path.abspath(__file__))
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# REGISTRO (formato Prometheus)
+# ══════════════════════════════════════════════════════════════════════════════
+
+class Registro:
+    """Histogramas e contadores em memória do processo, exportados em texto Prometheus."""
+
+    def __init__(self, prefixo='friendcircle'):
+        self.prefixo = prefixo
+        self._tipos = {}
+        self._ajudas = {}
+        self._buckets = {}
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def histograma(self, nome, ajuda, buckets=BUCKETS_SEGUNDOS):
+        self._tipos[nome], self._ajudas[nome], self._buckets[nome] = 'histogram', ajuda, tuple(buckets)
+        self._series[nome] = {}
+
+    def contador(self, nome, ajuda):
+        self._tipos[nome], self._ajudas[nome] = 'counter', ajuda
+        self._series[nome] = {}
+
+    def observar(self, nome, valor, **rotulos):
+        chave = tuple(sorted(rotulos.items()))
+        buckets = self._buckets[nome]
+        with self._lock:
+            serie = self._series[nome].get(chave)
+            if serie is None:
+                # [contagem por bucket..., +Inf, soma]
+                serie = self._series[nome][chave] = [0] * (len(buckets) + 2)
+            for i, limite in enumerate(buckets):
+                if valor <= limite:
+                    serie[i] += 1
+            serie[-2] += 1
+            serie[-1] += valor
+
+    def somar(self, nome, valor=1, **rotulos):
+        chave = tuple(sorted(rotulos.items()))
+        with self._lock:
+            self._series[nome][chave] = self._series[nome].get(chave, 0) + valor
+
+    def exportar(self):
+        with self._lock:
+            series = {nome: dict(s) for nome, s in self._series.items()}
+        linhas = []
+        for nome, tipo in self._tipos.items():
+            completo = f'{self.prefixo}_{nome}'
+            linhas.append(f'# HELP {completo} {self._ajudas[nome]}')
+            linhas.append(f'# TYPE {completo} {tipo}')
+            for chave, valor in sorted(series[nome].items()):
+                if tipo == 'counter':
+                    linhas.append(f'{completo}{_rotulos(chave)} {valor}')
+                    continue
+                for limite, total in zip(self._buckets[nome] + ('+Inf',), valor[:-1]):
+                    linhas.append(f'{completo}_bucket{_rotulos(chave + (("le", limite),))} {total}')
+                linhas.append(f'{completo}_sum{_rotulos(chave)} {valor[-1]:.6f}')
+                linhas.append(f'{completo}_count{_rotulos(chave)} {valor[-2]}')
+        return '\n'.join(linhas) + '\n'
+
+
+def _rotulos(chave):
+    if not chave:
+        return ''
+    pares = (f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in chave)
+    return '{' + ','.join(pares) + '}'
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# MEDIÇÃO DA REQUISIÇÃO
+# ══════════════════════════════════════════════════════════════════════════════
+
+class Medicao:
+    """Acumula, para uma requisição, consultas SQL e tempo por fase."""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.sql = 0.0
+        self.fases = {}
+        self._abertas = set()
+
+    @contextmanager
+    def fase(self, nome):
+        # Fases aninhadas com o mesmo nome (serializar_resultados -> serializar_posts) contam uma vez
+        if nome in self._abertas:
+            yield
+            return
+        self._abertas.add(nome)
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._abertas.discard(nome)
+            self.acumular(nome, time.perf_counter() - inicio)
+
+    def acumular(self, fase, duracao):
+        self.fases[fase] = self.fases.get(fase, 0.0) + duracao
+
+    def server_timing(self, total):
+        partes = [f'sql;dur={self.sql * 1000:.1f};desc="{self.consultas} consultas"']
+        partes += [f'{nome};dur={duracao * 1000:.1f}' for nome, duracao in self.fases.items()]
+        partes.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(partes)
+
+
+def medicao_atual():
+    return g.get('medicao') if has_request_context() else None
+
+
+@contextmanager
+def medir(fase):
+    """Mede um trecho da requisição atual; fora de uma requisição não faz nada."""
+    medicao = medicao_atual()
+    if medicao is None:
+        yield
+        return
+    with medicao.fase(fase):
+        yield
+
+
+def medido(fase):
+    def decorador(funcao):
+        @wraps(funcao)
+        def envolvida(*args, **kwargs):
+            with medir(fase):
+                return funcao(*args, **kwargs)
+        return envolvida
+    return decorador
+
+
+def local_da_chamada(profundidade=2):
+    """'arquivo.py:linha funcao' dos quadros do app mais próximos da consulta, do mais interno ao externo."""
+    locais = []
+    for quadro in reversed(traceback.extract_stack()[:-1]):
+        if quadro.filename.startswith(_PASTA) and not quadro.filename.endswith('metricas.py'):
+            locais.append(f'{os.path.basename(quadro.filename)}:{quadro.lineno} {quadro.name}')
+            if len(locais) == profundidade:
+                break
+    return ' ← '.join(locais) or '?'
+
+
+def instrumentar_motor(engine, consulta_lenta, ao_registrar_lenta, ao_esperar_lock=None):
+    """Conta e cronometra as consultas de `engine` na requisição atual.
+
+    Consultas acima de `consulta_lenta` segundos (de qualquer thread) vão para
+    `ao_registrar_lenta(duracao, statement, local)`. O BEGIN não é consulta e fica
+    de fora; no motor de escrita (com `ao_esperar_lock`) ele é a espera pelo lock:
+    o busy_timeout mais a fila do EscritorUnico (conn.info['espera_fila']), somados
+    na fase 'lock' e passados a `ao_esperar_lock(duracao)`.
+    """
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _antes(conn, cursor, statement, parametros, contexto, executemany):
+        conn.info.setdefault('metricas_inicio', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _depois(conn, cursor, statement, parametros, contexto, executemany):
+        duracao = time.perf_counter() - conn.info['metricas_inicio'].pop()
+        medicao = medicao_atual()
+        if statement.startswith('BEGIN'):
+            if ao_esperar_lock is not None:
+                espera = duracao + conn.info.pop('espera_fila', 0.0)
+                if medicao is not None:
+                    medicao.acumular('lock', espera)
+                ao_esperar_lock(espera)
+            return
+        if medicao is not None:
+            medicao.consultas += 1
+            medicao.sql += duracao
+        if duracao >= consulta_lenta:
+            ao_registrar_lenta(duracao, statement, local_da_chamada())
+
+    @event.listens_for(engine, 'handle_error')
+    def _erro(contexto):
+        # Consulta que falhou não passa pelo after_cursor_execute
+        if contexto.connection is not None and contexto.connection.info.get('metricas_inicio'):
+            contexto.connection.info['metricas_inicio'].pop()
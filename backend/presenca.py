@@ -0,0 +1,81 @@
+"""
+FriendCircle - Presença dos usuários (quem está online)
+"""
+
+import threading
+import time
+
+from recursos import escolher_backend, conectar_redis
+
+
+class PresencaMemoria:
+    """Última atividade de cada usuário, em memória do processo.
+
+    Cada worker só conhece quem ele atendeu (`compartilhada` é False): com um
+    processo `online()` é exato; com vários, conta só os usuários deste worker.
+    """
+
+    compartilhada = False
+
+    def __init__(self, resolucao=60, retencao=3600):
+        self.resolucao = resolucao
+        self.retencao = retencao
+        self._vistos = {}
+        self._gravados = {}
+        self._podado = time.time()
+        self._lock = threading.Lock()
+
+    def registrar(self, user_id, quando=None):
+        """Marca atividade. Retorna True quando vale gravar o last_seen (no máximo uma vez por `resolucao`)."""
+        quando = quando or time.time()
+        with self._lock:
+            self._vistos[user_id] = quando
+            if quando - self._podado >= self.resolucao:
+                self._podar(quando)
+            if quando - self._gravados.get(user_id, 0) < self.resolucao:
+                return False
+            self._gravados[user_id] = quando
+            return True
+
+    def online(self, desde):
+        with self._lock:
+            self._podar(time.time())
+            return sum(1 for t in self._vistos.values() if t >= desde)
+
+    def _podar(self, agora):
+        # Quem não aparece há mais de `retencao` sai dos dois dicionários
+        limite = agora - self.retencao
+        for user_id in [u for u, t in self._vistos.items() if t < limite]:
+            del self._vistos[user_id]
+            self._gravados.pop(user_id, None)
+        self._podado = agora
+
+
+class PresencaRedis:
+    """Compartilhada entre workers: um sorted set com o horário da última atividade."""
+
+    CHAVE = 'friendcircle:presenca'
+    compartilhada = True
+
+    def __init__(self, url, resolucao=60, retencao=3600):
+        self._redis = conectar_redis(url)
+        self.resolucao = resolucao
+        self.retencao = retencao
+
+    def registrar(self, user_id, quando=None):
+        quando = quando or time.time()
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.zadd(self.CHAVE, {user_id: quando})
+        # Trava por usuário com TTL: só um worker grava o last_seen a cada `resolucao`
+        pipe.set(f'{self.CHAVE}:gravado:{user_id}', 1, nx=True, ex=self.resolucao)
+        return bool(pipe.execute()[1])
+
+    def online(self, desde):
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.zremrangebyscore(self.CHAVE, 0, time.time() - self.retencao)
+        pipe.zcount(self.CHAVE, desde, '+inf')
+        return pipe.execute()[1]
+
+
+def criar_presenca(url, resolucao=60):
+    return escolher_backend(url, 'presença', lambda: PresencaMemoria(resolucao), lambda: PresencaRedis(url, resolucao))
@@ -0,0 +1,69 @@
+"""
+FriendCircle - Recursos por processo (pools e threads) e escolha do backend (memória ou Redis)
+"""
+
+import os
+import threading
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# UM POR PROCESSO
+# ══════════════════════════════════════════════════════════════════════════════
+# Pools e threads não sobrevivem ao fork dos workers do gunicorn (com
+# preload_app o app é montado no master): cada processo cria o seu na
+# primeira vez que precisa.
+
+class PorProcesso:
+    """Chamar devolve o recurso deste processo, criado por `criar()` na primeira chamada."""
+
+    def __init__(self, criar):
+        self._criar = criar
+        self._recurso = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._recurso = self._criar()
+                    self._pid = os.getpid()
+        return self._recurso
+
+    def descartar(self):
+        """Esquece o recurso; devolve o deste processo (None se não foi criado aqui) para ser fechado."""
+        with self._lock:
+            recurso = self._recurso if self._pid == os.getpid() else None
+            self._recurso = None
+            self._pid = None
+        return recurso
+
+
+def iniciar_thread(alvo, nome):
+    thread = threading.Thread(target=alvo, daemon=True, name=nome)
+    thread.start()
+    return thread
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# BACKENDS
+# ══════════════════════════════════════════════════════════════════════════════
+
+def escolher_backend(url, tipo, memoria, compartilhado):
+    """`memoria()` para memory:// (ou vazio); `compartilhado()` para redis://, rediss:// e unix://."""
+    if not url or url.startswith('memory://'):
+        return memoria()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return compartilhado()
+    raise ValueError(f'Backend de {tipo} desconhecido: {url}')
+
+
+def conectar_redis(url):
+    if redis is None:
+        raise RuntimeError('Pacote redis não instalado (pip install redis)')
+    return redis.Redis.from_url(url)
@@ -0,0 +1,77 @@
+"""
+FriendCircle - Hash de senhas fora da thread da requisição
+"""
+
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as TempoEsgotado
+from werkzeug.security import generate_password_hash, check_password_hash
+import multiprocessing
+import threading
+
+from recursos import PorProcesso
+
+
+class SenhasOcupadas(RuntimeError):
+    """Fila de hashing cheia: o cliente deve tentar de novo em instantes."""
+
+
+def _contexto():
+    # fork evita reimportar o app em cada processo do pool (spawn executa o módulo principal de novo)
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+
+def _normalizar(metodo):
+    # 'scrypt' -> 'scrypt:32768:8:1', para comparar com o prefixo dos hashes gravados.
+    # Com todos os parâmetros já informados não calcula um hash (o scrypt leva ~100 ms no boot)
+    partes = metodo.split(':')
+    if (partes[0], len(partes)) in (('scrypt', 4), ('pbkdf2', 3)):
+        return metodo
+    return generate_password_hash('', metodo).split('$', 1)[0]
+
+
+class ProcessadorSenhas:
+    """Pool de processos para gerar e conferir hashes de senha.
+
+    `metodo` segue o formato do Werkzeug ('scrypt:32768:8:1', 'pbkdf2:sha256:600000').
+    Com `workers=0` o hash é feito na própria thread (útil em scripts e testes).
+    No máximo `workers + fila` hashes ficam pendentes; além disso, `SenhasOcupadas`.
+    """
+
+    def __init__(self, metodo='scrypt', workers=2, fila=32, espera=5.0):
+        self.metodo = _normalizar(metodo)
+        self.workers = workers
+        self.espera = espera
+        self._vagas = threading.BoundedSemaphore(workers + fila) if workers else None
+        self._pool = PorProcesso(lambda: ProcessPoolExecutor(max_workers=self.workers, mp_context=_contexto()))
+
+    def gerar(self, senha):
+        return self._executar(generate_password_hash, senha, self.metodo)
+
+    def verificar(self, hash_, senha):
+        return self._executar(check_password_hash, hash_, senha)
+
+    def desatualizado(self, hash_):
+        """True se o hash foi gerado com outro algoritmo ou custo."""
+        return hash_.split('$', 1)[0] != self.metodo
+
+    def _executar(self, funcao, *args):
+        if not self.workers:
+            return funcao(*args)
+        if not self._vagas.acquire(timeout=self.espera):
+            raise SenhasOcupadas()
+        try:
+            futuro = self._pool().submit(funcao, *args)
+        except Exception:
+            self._vagas.release()
+            raise
+        futuro.add_done_callback(lambda _: self._vagas.release())
+        try:
+            return futuro.result(timeout=self.espera * 2)
+        except TempoEsgotado:
+            raise SenhasOcupadas()
+
+    def encerrar(self):
+        pool = self._pool.descartar()
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
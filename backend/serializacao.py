@@ -0,0 +1,174 @@
+"""
+FriendCircle - JSON das respostas: campos esparsos (?fields=), codificador e gzip
+"""
+
+from datetime import date
+import gzip
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# CAMPOS ESPARSOS
+# ══════════════════════════════════════════════════════════════════════════════
+# ?fields=id,texto,autor.nome,autor.avatar vira a árvore
+# {'id': None, 'texto': None, 'autor': {'nome': None, 'avatar': None}}, onde
+# None quer dizer "o valor inteiro". Cada recurso descreve seus campos com um
+# gerador por campo; só os geradores pedidos são chamados.
+
+class CamposInvalidos(ValueError):
+    pass
+
+
+def ler_campos(texto):
+    """Árvore de campos de 'a,b.c,b.d'; None se `texto` for vazio (todos os campos)."""
+    if not texto:
+        return None
+    arvore = {}
+    for caminho in filter(None, (c.strip() for c in texto.split(','))):
+        partes = caminho.split('.')
+        if not all(partes):
+            raise CamposInvalidos(caminho)
+        no = arvore
+        for parte in partes[:-1]:
+            # 'autor' sozinho já pediu o autor inteiro
+            if parte in no and no[parte] is None:
+                break
+            no = no.setdefault(parte, {})
+        else:
+            no[partes[-1]] = None
+    return arvore
+
+
+def montar(campos, geradores, obj, **prontos):
+    """Dict de `obj` só com `campos`, na ordem de `geradores`.
+
+    `geradores` mapeia o nome do campo para uma função de `obj`, ou para None
+    quando o valor já vem calculado em `prontos` (o cartão do autor, por exemplo).
+    """
+    if campos is None:
+        return {
+            nome: prontos[nome] if gerador is None else gerador(obj)
+            for nome, gerador in geradores.items()
+        }
+    validar(campos, geradores)
+    dados = {}
+    for nome, gerador in geradores.items():
+        if nome in campos:
+            valor = prontos[nome] if gerador is None else gerador(obj)
+            dados[nome] = recortar(valor, campos[nome])
+    return dados
+
+
+def validar(campos, nomes):
+    """CamposInvalidos se `campos` pede algo fora de `nomes`."""
+    desconhecidos = campos.keys() - nomes if campos else ()
+    if desconhecidos:
+        raise CamposInvalidos(', '.join(sorted(desconhecidos)))
+    return campos
+
+
+def recortar(valor, campos):
+    """Aplica `campos` a um valor já serializado (dict ou lista de dicts), sem alterá-lo.
+
+    Aninhados têm chaves variáveis (variantes de imagem, email só no próprio
+    perfil): o que o valor não tem fica de fora, sem erro.
+    """
+    if campos is None or valor is None:
+        return valor
+    if isinstance(valor, list):
+        return [recortar(item, campos) for item in valor]
+    if not isinstance(valor, dict):
+        raise CamposInvalidos(', '.join(sorted(campos)))
+    return {nome: recortar(item, campos[nome]) for nome, item in valor.items() if nome in campos}
+
+
+def pedidos(campos, nome):
+    """Se o campo `nome` entra na resposta (para pular o trabalho em lote de quem não entra)."""
+    return campos is None or nome in campos
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# CODIFICADOR JSON
+# ══════════════════════════════════════════════════════════════════════════════
+# Os dicts das rotas levam datetime; a data vira ISO 8601 (igual a
+# isoformat()) só ao codificar. Com orjson isso acontece em C, sem uma
+# chamada Python por campo.
+
+class ProvedorJSON(DefaultJSONProvider):
+    """json da biblioteca padrão, com datas em ISO 8601 em vez do formato HTTP."""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, date):
+            return o.isoformat()
+        return DefaultJSONProvider.default(o)
+
+
+class ProvedorOrjson(ProvedorJSON):
+    """orjson: mesma saída (em UTF-8, sem ordenar as chaves), bem mais rápido."""
+
+    def _opcoes(self, **kwargs):
+        opcoes = orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys'):
+            opcoes |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            opcoes |= orjson.OPT_INDENT_2
+        return opcoes
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self._opcoes(**kwargs)).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indentar = self.compact is False or (self.compact is None and self._app.debug)
+        corpo = orjson.dumps(obj, default=self.default, option=self._opcoes(indent=indentar))
+        return self._app.response_class(corpo + b'\n', mimetype=self.mimetype)
+
+
+def escolher_provedor(nome):
+    """Classe do provedor para JSON_PROVEDOR: 'orjson', 'padrao' ou 'auto' (orjson se instalado)."""
+    if nome == 'auto':
+        nome = 'orjson' if orjson is not None else 'padrao'
+    if nome == 'orjson':
+        if orjson is None:
+            raise RuntimeError('Pacote orjson não instalado (pip install orjson)')
+        return ProvedorOrjson
+    if nome == 'padrao':
+        return ProvedorJSON
+    raise ValueError(f'JSON_PROVEDOR desconhecido: {nome}')
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# COMPRESSÃO
+# ══════════════════════════════════════════════════════════════════════════════
+
+TIPOS_COMPRIMIVEIS = ('application/json', 'application/x-ndjson')
+
+
+def comprimir(resposta, aceita, minimo=1024, nivel=6):
+    """gzip no corpo de `resposta` se o cliente aceita e o corpo vale a pena."""
+    if (
+        'gzip' not in aceita
+        or resposta.status_code != 200
+        or resposta.direct_passthrough
+        or resposta.is_streamed
+        or resposta.mimetype not in TIPOS_COMPRIMIVEIS
+        or 'Content-Encoding' in resposta.headers
+    ):
+        return resposta
+    corpo = resposta.get_data()
+    if len(corpo) < minimo:
+        return resposta
+    resposta.set_data(gzip.compress(corpo, compresslevel=nivel))
+    resposta.headers['Content-Encoding'] = 'gzip'
+    resposta.vary.add('Accept-Encoding')
+    return resposta
@@ -0,0 +1,113 @@
+"""
+FriendCircle - Tarefas em segundo plano (processamento em lote e agendador)
+"""
+
+import atexit
+import threading
+import time
+
+from recursos import PorProcesso, iniciar_thread
+
+
+class ProcessadorEmLote:
+    """Acumula itens em memória e os entrega em lote a `processar` numa thread própria.
+
+    O lote é esvaziado a cada `intervalo` segundos, ou antes se passar de `limite`
+    itens, e também na saída do processo. Se `processar` falha (ex.: banco
+    travado), os itens voltam para a fila e entram no próximo lote; cada item é
+    descartado depois de `tentativas` falhas.
+    """
+
+    def __init__(self, processar, intervalo=1.0, limite=500, nome='lote', tentativas=5):
+        self.processar = processar
+        self.intervalo = intervalo
+        self.limite = limite
+        self.nome = nome
+        self.tentativas = tentativas
+        # (falhas, item)
+        self._itens = []
+        self._lock = threading.Lock()
+        self._acordar = threading.Event()
+        self._thread = PorProcesso(lambda: iniciar_thread(self._loop, self.nome))
+        atexit.register(self.encerrar)
+
+    def adicionar(self, *itens):
+        with self._lock:
+            self._itens.extend((0, item) for item in itens)
+            cheio = len(self._itens) >= self.limite
+        self._thread()
+        if cheio:
+            self._acordar.set()
+
+    def pendentes(self):
+        with self._lock:
+            return len(self._itens)
+
+    def esvaziar(self):
+        with self._lock:
+            lote, self._itens = self._itens, []
+        if not lote:
+            return 0
+        try:
+            self.processar([item for _, item in lote])
+        except Exception:
+            # Na frente da fila, para manter a ordem com o que chegou enquanto isso
+            devolvidos = [(falhas + 1, item) for falhas, item in lote if falhas + 1 < self.tentativas]
+            with self._lock:
+                self._itens[:0] = devolvidos
+            if len(devolvidos) < len(lote):
+                print(f"⚠️ {len(lote) - len(devolvidos)} item(ns) descartado(s) após {self.tentativas} falhas ({self.nome})")
+            raise
+        return len(lote)
+
+    def encerrar(self, pausa=0.5):
+        """Esvazia até não sobrar nada: na saída do processo não há próximo ciclo."""
+        while self.pendentes():
+            try:
+                self.esvaziar()
+            except Exception as e:
+                print(f"Erro no processamento em lote ({self.nome}): {str(e)}")
+                time.sleep(pausa)
+
+    def _loop(self):
+        while True:
+            self._acordar.wait(self.intervalo)
+            self._acordar.clear()
+            try:
+                self.esvaziar()
+            except Exception as e:
+                print(f"Erro no processamento em lote ({self.nome}): {str(e)}")
+
+
+class Agendador:
+    """Chama `executar()` a cada `intervalo` segundos numa thread própria, uma por processo.
+
+    Quem decide o que está vencido é `executar`; com vários workers cada um tem
+    seu agendador, então a reserva da tarefa precisa ser compartilhada (no banco).
+    """
+
+    def __init__(self, executar, intervalo=60.0, nome='agendador'):
+        self.executar = executar
+        self.intervalo = intervalo
+        self.nome = nome
+        self._parar = threading.Event()
+        self._thread = PorProcesso(lambda: iniciar_thread(self._loop, self.nome))
+
+    def iniciar(self):
+        self._thread()
+
+    def encerrar(self, espera=20.0):
+        """Não agenda mais nada e espera até `espera` segundos a execução em andamento."""
+        self._parar.set()
+        thread = self._thread.descartar()
+        if thread is not None:
+            thread.join(espera)
+            if thread.is_alive():
+                print(f"⚠️ Agendador ({self.nome}) ainda executando na saída do processo")
+
+    def _loop(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.executar()
+            except Exception as e:
+                print(f"Erro no agendador ({self.nome}): {str(e)}")
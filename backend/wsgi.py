@@ -0,0 +1,9 @@
+"""
+FriendCircle - Ponto de entrada WSGI
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+from app import create_app
+
+app = create_app()
@@ -7,6 +7,13 @@ import axios from 'axios';
 // ══════════════════════════════════════════════════════════════════════════════
 
 const API_URL = 'https://friendcircle-api.onrender.com/api';
+const UPLOADS_URL = 'http://localhost:5000';
+
+// Variante redimensionada (WebP) quando o servidor informa; senão o arquivo original
+function urlImagem(pasta, nome, variantes, tamanho) {
+  const variante = variantes?.[tamanho];
+  return `${UPLOADS_URL}${variante || `/uploads/${pasta}/${nome}`}`;
+}
 
 const api = axios.create({
   baseURL: API_URL,
@@ -333,7 +340,7 @@ function Avatar({ user, size = 48 }) {
   if (user?.avatar) {
     return (
       <img
-        src={`http://localhost:5000/uploads/avatars/${user.avatar}`}
+        src={urlImagem('avatars', user.avatar, user.avatar_variantes, size <= 48 ? 'thumb' : 'full')}
         alt={user.nome}
         style={{
           ...sizeStyle,
@@ -966,6 +973,7 @@ function FeedPage() {
 function PostCard({ post, onLike }) {
   const [showComments, setShowComments] = useState(false);
   const [comments, setComments] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [newComment, setNewComment] = useState('');
   const [loadingComments, setLoadingComments] = useState(false);
 
@@ -978,7 +986,8 @@ function PostCard({ post, onLike }) {
     setLoadingComments(true);
     try {
       const res = await api.get(`/posts/${post.id}/comments`);
-      setComments(res.data);
+      setComments(res.data.comments);
+      setNextCursor(res.data.next_cursor);
       setShowComments(true);
     } catch (err) {
       console.error(err);
@@ -987,6 +996,16 @@ function PostCard({ post, onLike }) {
     }
   };
 
+  const loadMoreComments = async () => {
+    try {
+      const res = await api.get(`/posts/${post.id}/comments`, { params: { cursor: nextCursor } });
+      setComments([...comments, ...res.data.comments]);
+      setNextCursor(res.data.next_cursor);
+    } catch (err) {
+      console.error(err);
+    }
+  };
+
   const handleComment = async (e) => {
     e.preventDefault();
     if (!newComment.trim()) return;
@@ -1027,7 +1046,7 @@ function PostCard({ post, onLike }) {
       {post.imagem && (
         <div style={{ borderRadius: 16, overflow: 'hidden', marginBottom: 16 }}>
           <img 
-            src={`http://localhost:5000/uploads/posts/${post.imagem}`}
+            src={urlImagem('posts', post.imagem, post.imagem_variantes, 'feed')}
             alt=""
             style={{ width: '100%', maxHeight: 400, objectFit: 'cover' }}
           />
@@ -1103,6 +1122,15 @@ function PostCard({ post, onLike }) {
             </div>
           ))}
 
+          {nextCursor && (
+            <button
+              onClick={loadMoreComments}
+              style={{ background: 'none', border: 'none', color: '#a78bfa', fontSize: 13, cursor: 'pointer', padding: 0 }}
+            >
+              Ver mais comentários
+            </button>
+          )}
+
           <form onSubmit={handleComment} style={{ display: 'flex', gap: 8, marginTop: 12 }}>
             <input
               type="text"